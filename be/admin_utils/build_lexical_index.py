@@ -0,0 +1,33 @@
+import argparse
+from vector_store import VectorStore, create_vector_store
+from lexical_index import LexicalIndex
+from config import LEXICAL_INDEX_DIR
+
+PAGE_SIZE = 1000
+
+
+def build(vector_store: VectorStore, lexical_index: LexicalIndex) -> int:
+    """
+    Replaces the lexical index's contents with every chunk in the vector
+    store. Needed once for collections ingested before hybrid retrieval.
+    """
+    lexical_index.clear()
+    copied = 0
+    for page in vector_store.iter_documents(batch_size=PAGE_SIZE):
+        lexical_index.upsert(page["ids"], page["documents"], page["metadatas"])
+        copied += len(page["ids"])
+    lexical_index.flush()
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the BM25 index from the chunks in the vector store.")
+    parser.add_argument("--index-dir", default=LEXICAL_INDEX_DIR)
+    args = parser.parse_args()
+    vector_store = create_vector_store()
+    lexical_index = LexicalIndex(args.index_dir)
+    count = build(vector_store, lexical_index)
+    lexical_index.close()
+    vector_store.close()
+    print(f"Indexed {count} chunks into {args.index_dir}")
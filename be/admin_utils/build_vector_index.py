@@ -0,0 +1,51 @@
+import os
+import argparse
+import shutil
+from chromadb_client import ChromaDbClient, CHROMA_DB_DIR
+from numpy_store import NumpyVectorStore
+from manifest import MANIFEST_FILENAME
+from config import NUMPY_INDEX_DIR, NUMPY_INDEX_DTYPE, NUMPY_PREFIX_DIMS
+
+PAGE_SIZE = 1000
+
+
+def build(chroma_dir: str, index_dir: str, dtype: str, prefix_dims: int = NUMPY_PREFIX_DIMS) -> int:
+    """
+    Copies every chunk of the Chroma collection, with its vector and
+    metadata, into a NumPy index. The ingestion manifest is copied too so
+    later incremental runs of ingest_pdfs.py work against the new index.
+    """
+    chroma = ChromaDbClient(persist_directory=chroma_dir)
+    store = NumpyVectorStore(persist_directory=index_dir, dtype=dtype, prefix_dims=prefix_dims)
+    # An empty filter matches every chunk already in the index
+    store.delete_documents(where={})
+    copied = 0
+    for page in chroma.iter_documents(
+            batch_size=PAGE_SIZE, include=["embeddings", "documents", "metadatas"]):
+        store.upsert_documents(
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            ids=page["ids"],
+            metadatas=page["metadatas"],
+        )
+        copied += len(page["ids"])
+    store.close()
+    chroma.close()
+    manifest = os.path.join(chroma_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest):
+        shutil.copyfile(manifest, os.path.join(index_dir, MANIFEST_FILENAME))
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the NumPy vector index from the Chroma collection.")
+    parser.add_argument("--chroma-dir", default=CHROMA_DB_DIR)
+    parser.add_argument("--index-dir", default=NUMPY_INDEX_DIR)
+    parser.add_argument("--dtype", default=NUMPY_INDEX_DTYPE, choices=["float32", "float16", "int8"])
+    parser.add_argument("--prefix-dims", type=int, default=NUMPY_PREFIX_DIMS,
+                        help="search only this many leading dimensions, re-scoring in full (0 = all)")
+    args = parser.parse_args()
+    count = build(args.chroma_dir, args.index_dir, args.dtype, args.prefix_dims)
+    prefix = f", {args.prefix_dims}-d prefix" if args.prefix_dims else ""
+    print(f"Copied {count} chunks from {args.chroma_dir} to {args.index_dir} ({args.dtype}{prefix})")
@@ -0,0 +1,52 @@
+import os
+import argparse
+import statistics
+from chunking import CHUNKERS, CHUNKER_BY_DOCUMENT_TYPE, document_type, get_chunker, iter_chunks
+from pdf_extract import iter_page_texts
+from tokens import count_tokens
+from config import EMBEDDING_MODEL
+
+PDF_DIR = os.path.join(os.path.dirname(__file__), "..", "pdfs")
+
+
+def percentile(values, pct):
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def report(pdf_files, strategies):
+    """
+    Prints chunk count and token distribution per strategy and document type.
+    """
+    print(f"{'strategy':<13} {'doc type':<8} {'chunks':>7} {'tokens':>9} "
+          f"{'min':>5} {'p50':>5} {'p90':>5} {'max':>5} {'stdev':>7}")
+    for strategy in strategies:
+        by_type = {}
+        for pdf_path in pdf_files:
+            chunker = get_chunker(strategy)
+            counts = by_type.setdefault(document_type(pdf_path), [])
+            for chunk in iter_chunks(iter_page_texts(pdf_path), chunker):
+                counts.append(count_tokens(chunk.text, EMBEDDING_MODEL))
+        for doc_type, counts in sorted(by_type.items()):
+            if not counts:
+                continue
+            counts.sort()
+            marker = "*" if CHUNKER_BY_DOCUMENT_TYPE[doc_type] == strategy else ""
+            print(f"{strategy + marker:<13} {doc_type:<8} {len(counts):>7} {sum(counts):>9} "
+                  f"{counts[0]:>5} {percentile(counts, 50):>5} {percentile(counts, 90):>5} "
+                  f"{counts[-1]:>5} {statistics.pstdev(counts):>7.1f}")
+    print("* = strategy currently configured for that document type")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Chunk count and token distribution of each chunking strategy.")
+    parser.add_argument("--strategy", action="append", choices=sorted(CHUNKERS),
+                        help="strategy to report (repeatable; default: all)")
+    args = parser.parse_args()
+    pdf_files = sorted(
+        os.path.join(PDF_DIR, f)
+        for f in os.listdir(PDF_DIR)
+        if f.lower().endswith(".pdf")
+    )
+    report(pdf_files, args.strategy or sorted(CHUNKERS))
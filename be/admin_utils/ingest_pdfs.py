@@ -1,25 +1,76 @@
 import os
+import argparse
 import asyncio
 from llm import Embeddings
-from chromadb_client import ChromaDbClient
+from vector_store import create_vector_store
+from lexical_index import LexicalIndex
+from embedding_pipeline import BatchEmbedder
+from config import EMBED_CONCURRENCY, LEXICAL_INDEX_DIR
+from ingestion import ingest_pdfs_parallel
+from manifest import IngestManifest, MANIFEST_FILENAME
 from rag import RAG
+from catalog import ProductCatalog
+from admin_utils.build_lexical_index import build as build_lexical_index
+from admin_utils.retag_chunks import retag
 
 PDF_DIR = os.path.join(os.path.dirname(__file__), "..", "pdfs")
 
 
-async def main():
+async def main(
+    concurrency: int = EMBED_CONCURRENCY,
+    workers: int = os.cpu_count() or 1,
+    full: bool = False,
+):
     embeddings = Embeddings()
-    chroma_client = ChromaDbClient()
-    rag = RAG(chroma_client, embeddings)
+    vector_store = create_vector_store()
+    lexical_index = LexicalIndex(LEXICAL_INDEX_DIR) if LEXICAL_INDEX_DIR else None
+    batch_embedder = BatchEmbedder(embeddings, concurrency=concurrency)
+    rag = RAG(vector_store, embeddings, batch_embedder,
+              lexical_index=lexical_index, catalog=ProductCatalog.load())
+    manifest = IngestManifest(
+        os.path.join(vector_store.persist_directory, MANIFEST_FILENAME))
+    if full:
+        # Drop everything the manifest knows about so every file is re-embedded
+        for document in list(manifest.documents):
+            stale_ids = manifest.forget(document)
+            if stale_ids:
+                await rag.delete_chunks(stale_ids)
+        await rag.flush()
+        manifest.save()
+    elif lexical_index is not None and lexical_index.count() == 0:
+        # Unchanged PDFs are skipped below, so index what is already stored
+        print(f"Backfilled {build_lexical_index(vector_store, lexical_index)} chunks into the lexical index")
+    if not full:
+        # Unchanged PDFs are not rewritten, so bring their metadata up to date
+        retagged = retag(rag)
+        if retagged:
+            await rag.flush()
+            print(f"Updated metadata of {retagged} chunks")
     pdf_files = [
         os.path.join(PDF_DIR, f)
         for f in os.listdir(PDF_DIR)
         if f.lower().endswith(".pdf")
     ]
-    for pdf_path in pdf_files:
-        print(f"Ingesting {pdf_path} ...")
-        await rag.ingest_pdf(pdf_path)
-        print(f"Done ingesting {pdf_path}")
+    print(f"Ingesting {len(pdf_files)} PDFs with {workers} parser processes ...")
+    report = await ingest_pdfs_parallel(
+        rag, pdf_files, workers=workers, manifest=manifest)
+    print(report.summary())
+    print(
+        f"Embedding requests: {batch_embedder.requests} "
+        f"({batch_embedder.retries} retried)")
+    vector_store.close()
+    if lexical_index is not None:
+        lexical_index.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(
+        description="Ingest all PDFs into the vector database.")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY,
+                        help="embedding batches in flight at once")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes parsing PDFs in parallel")
+    parser.add_argument("--full", action="store_true",
+                        help="re-embed every PDF instead of only new or changed chunks")
+    args = parser.parse_args()
+    asyncio.run(main(concurrency=args.concurrency,
+                workers=args.workers, full=args.full))
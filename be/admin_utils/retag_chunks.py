@@ -0,0 +1,59 @@
+import argparse
+from vector_store import create_vector_store
+from lexical_index import open_built_index
+from catalog import ProductCatalog
+from config import LEXICAL_INDEX_DIR
+from rag import RAG
+
+PAGE_SIZE = 1000
+
+
+def retag(rag: RAG) -> int:
+    """
+    Rewrites the metadata of stored chunks that differs from what
+    ingestion would write today (document type, linked product), keeping
+    their vectors. Chunks ingested before a field existed, or before the
+    product database was populated, become visible to filters this way
+    without being re-embedded.
+    """
+    changed = 0
+    for page in rag.vector_store.iter_documents(
+            batch_size=PAGE_SIZE, include=["embeddings", "documents", "metadatas"]):
+        rows = []
+        for i, metadata in enumerate(page["metadatas"]):
+            metadata = metadata or {}
+            current = rag.chunk_metadata(
+                metadata.get("source", ""), metadata.get("page_start"), metadata.get("page_end"),
+                metadata.get("chunk_index"))
+            current = {key: value for key, value in current.items() if value is not None}
+            if current != metadata:
+                rows.append((i, current))
+        if not rows:
+            continue
+        ids = [page["ids"][i] for i, _ in rows]
+        documents = [page["documents"][i] for i, _ in rows]
+        metadatas = [metadata for _, metadata in rows]
+        rag.vector_store.upsert_documents(
+            embeddings=[page["embeddings"][i] for i, _ in rows],
+            documents=documents,
+            ids=ids,
+            metadatas=metadatas,
+        )
+        if rag.lexical_index is not None:
+            rag.lexical_index.upsert(ids, documents, metadatas)
+        changed += len(rows)
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresh stored chunk metadata (document type, product) without re-embedding.")
+    parser.parse_args()
+    vector_store = create_vector_store()
+    # An index that was never built is left alone rather than half filled
+    lexical_index = open_built_index(LEXICAL_INDEX_DIR) if LEXICAL_INDEX_DIR else None
+    rag = RAG(vector_store, None, lexical_index=lexical_index, catalog=ProductCatalog.load())
+    print(f"Updated metadata of {retag(rag)} chunks")
+    vector_store.close()
+    if lexical_index is not None:
+        lexical_index.close()
@@ -0,0 +1,232 @@
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable
+from starlette.responses import JSONResponse
+from config import (
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_PER_CLIENT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+
+# Weight of the newest request in the running mean of request durations
+SERVICE_TIME_ALPHA = 0.1
+MAX_RETRY_AFTER_SECONDS = 60
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps the requests served at once, in total and per client. A request
+    over the per-client cap is rejected at once (429); one over the global
+    cap waits in a FIFO queue of at most max_queue for up to
+    queue_timeout_seconds, and is rejected (503) when the queue is full or
+    its wait runs out. A finished request hands its slot straight to the
+    oldest waiter. Event-loop only, apart from stats().
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_per_client: int = ADMISSION_MAX_PER_CLIENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout_seconds: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._clients: Counter = Counter()
+        self._lock = threading.Lock()
+        self.active = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_client_limit = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.service_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely free: the queue ahead drained at
+        max_concurrent requests per mean request duration.
+        """
+        waves = (len(self._waiters) + 1) / max(self.max_concurrent, 1)
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(waves * self.service_seconds)))
+
+    async def acquire(self, client: str) -> float:
+        """
+        Returns once the request holds a slot (with the time it was
+        admitted), or raises Rejected.
+        """
+        if self.max_per_client and self._clients[client] >= self.max_per_client:
+            with self._lock:
+                self.rejected_client_limit += 1
+            raise Rejected(429, "Too many concurrent requests from this client", self.retry_after())
+        if self.active < self.max_concurrent and not self._waiters:
+            self._admit(client)
+            return time.perf_counter()
+        if len(self._waiters) >= self.max_queue:
+            with self._lock:
+                self.rejected_queue_full += 1
+            raise Rejected(503, "Server is at capacity", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._clients[client] += 1
+        with self._lock:
+            self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._leave_queue(future, client)
+            with self._lock:
+                self.rejected_timeout += 1
+            raise Rejected(503, "Timed out waiting for capacity", self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as the caller went away
+                self.release(client, time.perf_counter())
+            else:
+                self._leave_queue(future, client)
+            raise
+        with self._lock:
+            self.admitted += 1
+        return time.perf_counter()
+
+    def _admit(self, client: str):
+        self._clients[client] += 1
+        with self._lock:
+            self.active += 1
+            self.admitted += 1
+
+    def _leave_queue(self, future: asyncio.Future, client: str):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        self._forget(client)
+
+    def _forget(self, client: str):
+        self._clients[client] -= 1
+        if self._clients[client] <= 0:
+            del self._clients[client]
+
+    def release(self, client: str, admitted_at: float):
+        self._forget(client)
+        elapsed = time.perf_counter() - admitted_at
+        self.service_seconds += SERVICE_TIME_ALPHA * (elapsed - self.service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter; active is unchanged
+                waiter.set_result(None)
+                return
+        with self._lock:
+            self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_per_client": self.max_per_client,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queue_depth": len(self._waiters),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_client_limit": self.rejected_client_limit,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "mean_request_ms": self.service_seconds * 1000,
+            }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware holding an admission slot for the whole of each
+    request to paths, streamed body included, and answering rejected
+    requests with their status and Retry-After. The controller is looked
+    up on app.state.components, which exists once the app has started.
+    """
+
+    def __init__(self, app, paths: Iterable[str] = ("/generate",)):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        controller: AdmissionController = scope["app"].state.components.admission
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        try:
+            admitted_at = await controller.acquire(client)
+        except Rejected as rejection:
+            response = JSONResponse(
+                {"detail": rejection.reason},
+                status_code=rejection.status_code,
+                headers={"Retry-After": str(rejection.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(client, admitted_at)
+
+
+class TokenBucket:
+    """
+    Allows rate acquisitions per second on average and up to burst at
+    once. Callers reserve in arrival order and sleep off any deficit, so
+    waiting callers are served first come, first served.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self, amount: float = 1.0):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += 1
+            if wait:
+                self.delayed += 1
+                self.wait_seconds += wait
+        if wait:
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.capacity,
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "mean_wait_ms": self.wait_seconds / self.acquired * 1000 if self.acquired else 0.0,
+            }
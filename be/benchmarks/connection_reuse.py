@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import httpx
+from benchmarks.embed_throughput import start_fake_server
+from benchmarks.retrieval_batching import percentile
+
+
+async def one_request(embeddings, llm, i: int) -> float:
+    """
+    What /generate sends upstream: one query embedding, then a streamed
+    completion read to the end.
+    """
+    began = time.perf_counter()
+    await embeddings.embed(f"question {i}")
+    async for _ in llm.generate([{"role": "user", "content": f"question {i}"}]):
+        pass
+    return (time.perf_counter() - began) * 1000
+
+
+async def run_mode(mode: str, args, server_url: str) -> dict:
+    # Imported after OPENAI_API_BASE is set so litellm picks up the stub
+    import litellm
+    from llm import LLM, Embeddings
+    from upstream import UpstreamClient
+
+    # Drop clients litellm cached for the previous mode
+    litellm.in_memory_llm_clients_cache.flush_cache()
+    upstream = None
+    if mode == "pooled":
+        upstream = UpstreamClient(
+            max_connections=args.max_connections,
+            keepalive_seconds=args.keepalive_seconds,
+        )
+    embeddings, llm = Embeddings(), LLM()
+    before = httpx.get(f"{server_url}/health").json()["connections"]
+    latencies = []
+    for round in range(args.rounds):
+        if round:
+            await asyncio.sleep(args.idle_seconds)
+        latencies += await asyncio.gather(*(
+            one_request(embeddings, llm, round * args.concurrency + i)
+            for i in range(args.concurrency)
+        ))
+    connections = httpx.get(f"{server_url}/health").json()["connections"] - before
+    # litellm's own clients are not closed by flush_cache()
+    await litellm.close_litellm_async_clients()
+    result = {
+        "mode": mode,
+        "connections": connections,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+        "pool": upstream.stats() if upstream else None,
+    }
+    if upstream is not None:
+        await upstream.aclose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Connections opened to the provider by litellm's default clients "
+                    "versus the shared upstream pool, over bursts separated by idle gaps.")
+    parser.add_argument("--port", type=int, default=8124)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--idle-seconds", type=float, default=6.0,
+                        help="pause between bursts; httpx closes idle connections after 5 s by default")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--keepalive-seconds", type=float, default=60.0)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server_url = f"http://127.0.0.1:{args.port}"
+    os.environ["OPENAI_API_BASE"] = f"{server_url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    # The stub keeps idle connections open as long as the pool does, as a
+    # provider behind a load balancer would; uvicorn's default is 5 s
+    server = start_fake_server(args.port, args.latency_ms, 0,
+                               "--keepalive-seconds", str(args.keepalive_seconds + 5))
+    try:
+        print(f"{args.rounds} bursts of {args.concurrency} requests (embedding + streamed completion), "
+              f"{args.idle_seconds:g} s apart")
+        print(f"{'mode':<8} {'connections':>11} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in ("default", "pooled"):
+            result = asyncio.run(run_mode(mode, args, server_url))
+            print(f"{mode:<8} {result['connections']:>11} {result['p50']:>8.1f} {result['p99']:>8.1f}")
+            if result["pool"]:
+                print(f"         pool: {result['pool']}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
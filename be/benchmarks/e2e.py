@@ -0,0 +1,436 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from benchmarks.embed_throughput import start_fake_server, synthetic_chunks
+from benchmarks.fake_openai import hashed_embedding
+from benchmarks.ttfb import percentile
+
+PERCENTILES = (50, 90, 99)
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def process_usage(pid: Optional[int]) -> Optional[Dict[str, float]]:
+    """
+    CPU seconds, resident and peak resident MB of a process, read from
+    /proc; None where there is no /proc (or no pid).
+    """
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "rss_mb": int(status["VmRSS"].split()[0]) / 1024,
+        "peak_rss_mb": int(status["VmHWM"].split()[0]) / 1024,
+    }
+
+
+def scrape_histogram(url: str, name: str) -> Optional[Tuple[List[Tuple[float, int]], float, int]]:
+    """
+    Cumulative buckets, sum and count of an unlabelled histogram on the
+    server's /metrics, or None if the server does not export it.
+    """
+    try:
+        response = httpx.get(f"{url}/metrics", timeout=10)
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    buckets, total, count = [], 0.0, 0
+    for line in response.text.splitlines():
+        if line.startswith(f"{name}_bucket"):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets.append((float(bound), int(line.rsplit(" ", 1)[1])))
+        elif line.startswith(f"{name}_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{name}_count"):
+            count = int(line.rsplit(" ", 1)[1])
+    return (buckets, total, count) if buckets else None
+
+
+def histogram_summary(before, after) -> Optional[Dict[str, float]]:
+    """
+    Mean and bucket-bound percentiles, in ms, of the observations made
+    between two scrapes of the same histogram.
+    """
+    if before is None or after is None:
+        return None
+    count = after[2] - before[2]
+    if count <= 0:
+        return None
+    summary = {"mean": (after[1] - before[1]) / count * 1000}
+    deltas = [(bound, new - old) for (bound, new), (_, old) in zip(after[0], before[0])]
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = next(
+            (bound * 1000 for bound, seen in deltas if seen >= pct / 100 * count), float("inf"))
+    return summary
+
+
+def latency_summary(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    values = sorted(value * 1000 for value in values)
+    summary = {f"p{pct}": percentile(values, pct) for pct in PERCENTILES}
+    summary["max"] = values[-1]
+    return summary
+
+
+async def one_request(client: httpx.AsyncClient, url: str, question: str) -> Dict[str, Any]:
+    """
+    Status and the seconds to the first byte, the first answer token and
+    the last byte of one /generate; failed if the stream reported an error
+    or broke.
+    """
+    payload = {"conversation": [{"role": "user", "content": question}]}
+    start = time.perf_counter()
+    outcome: Dict[str, Any] = {"status": 0, "ttfb": None, "ttft": None, "ttlb": None, "failed": False}
+    try:
+        async with client.stream("POST", f"{url}/generate", json=payload) as response:
+            outcome["status"] = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                return outcome
+            async for line in response.aiter_lines():
+                if outcome["ttfb"] is None:
+                    outcome["ttfb"] = time.perf_counter() - start
+                if line == "event: error":
+                    outcome["failed"] = True
+                elif outcome["ttft"] is None and line.startswith("data: ") and not line.startswith("data: {"):
+                    outcome["ttft"] = time.perf_counter() - start
+            outcome["ttlb"] = time.perf_counter() - start
+    except httpx.HTTPError:
+        outcome["failed"] = True
+    return outcome
+
+
+class LoadGenerator:
+    """
+    Clients on distinct loopback addresses, so per-client admission limits
+    see separate users, and a supply of distinct questions, so no cache
+    answers them.
+    """
+
+    def __init__(self, url: str, clients: int, seed: int):
+        self.url = url
+        self.clients = [
+            httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(local_address=f"127.0.0.{i % 250 + 1}"),
+                timeout=300,
+            )
+            for i in range(clients)
+        ]
+        self.questions = synthetic_chunks(512, chars=60, seed=seed)
+        self.sent = 0
+
+    def question(self) -> str:
+        self.sent += 1
+        return f"{self.questions[self.sent % len(self.questions)]} {self.sent}"
+
+    async def closed_loop(self, concurrency: int, requests: int) -> List[Dict[str, Any]]:
+        """
+        concurrency workers, each sending its next request when the last
+        one has finished, until requests have been sent.
+        """
+        outcomes = []
+        remaining = iter(range(requests))
+
+        async def worker(w: int):
+            client = self.clients[w % len(self.clients)]
+            for _ in remaining:
+                outcomes.append(await one_request(client, self.url, self.question()))
+
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        return outcomes
+
+    async def open_loop(self, rate: float, duration: float, seed: int) -> List[Dict[str, Any]]:
+        """
+        Poisson arrivals at rate per second for duration seconds, sent
+        whether or not earlier requests have been answered.
+        """
+        rng = random.Random(seed)
+        tasks = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            client = self.clients[len(tasks) % len(self.clients)]
+            tasks.append(asyncio.ensure_future(one_request(client, self.url, self.question())))
+            await asyncio.sleep(rng.expovariate(rate))
+        return list(await asyncio.gather(*tasks))
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+
+def build_corpus(directory: str, chunks: int):
+    """
+    Synthetic chunks embedded as the stub embeds them, in a NumPy index
+    and a BM25 index, so retrieval does real work.
+    """
+    from numpy_store import NumpyVectorStore
+    from lexical_index import LexicalIndex
+
+    texts = synthetic_chunks(chunks, seed=1)
+    ids = [f"synthetic.pdf_{i}" for i in range(len(texts))]
+    metadatas = [{"source": "synthetic.pdf", "doc_type": "manual"}] * len(texts)
+    store = NumpyVectorStore(persist_directory=os.path.join(directory, "vector_index"))
+    for start in range(0, len(texts), 1000):
+        end = start + 1000
+        store.upsert_documents(
+            embeddings=[hashed_embedding(text) for text in texts[start:end]],
+            documents=texts[start:end],
+            ids=ids[start:end],
+            metadatas=metadatas[start:end],
+        )
+    store.close()
+    lexical_index = LexicalIndex(os.path.join(directory, "lexical_index"))
+    lexical_index.upsert(ids, texts, metadatas)
+    lexical_index.close()
+
+
+def start_backend(args, directory: str, stub_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_BASE": stub_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-fake"),
+        # No download of litellm's price list at import
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+        "VECTOR_STORE": "numpy",
+        "NUMPY_INDEX_DIR": os.path.join(directory, "vector_index"),
+        "LEXICAL_INDEX_DIR": os.path.join(directory, "lexical_index"),
+        "ECOMMERCE_DB": os.path.join(directory, "ecommerce.db"),
+        "EMBEDDING_CACHE_PATH": "",
+    }
+    env.update(setting.split("=", 1) for setting in args.env)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("backend exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/hello", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("backend did not start")
+
+
+def summarize(mode: str, load: float, outcomes: List[Dict[str, Any]], elapsed: float,
+              usage_before, usage_after, lag_before, lag_after, client_cpu: float) -> Dict[str, Any]:
+    answered = [o for o in outcomes if o["status"] == 200 and not o["failed"]]
+    result: Dict[str, Any] = {
+        "mode": mode,
+        "load": load,
+        "requests": len(outcomes),
+        "answered": len(answered),
+        "failed": sum(1 for o in outcomes if o["failed"]),
+        "rejected": sum(1 for o in outcomes if o["status"] in (429, 503)),
+        "seconds": elapsed,
+        "throughput_rps": len(answered) / elapsed if elapsed else 0.0,
+        "ttfb_ms": latency_summary([o["ttfb"] for o in answered]),
+        "ttft_ms": latency_summary([o["ttft"] for o in answered if o["ttft"] is not None]),
+        "ttlb_ms": latency_summary([o["ttlb"] for o in answered]),
+        "event_loop_lag_ms": histogram_summary(lag_before, lag_after),
+        "client_cpu_seconds": client_cpu,
+        "server": None,
+    }
+    if usage_before is not None and usage_after is not None:
+        cpu = usage_after["cpu_seconds"] - usage_before["cpu_seconds"]
+        result["server"] = {
+            "cpu_seconds": cpu,
+            "cpu_percent": cpu / elapsed * 100 if elapsed else 0.0,
+            "cpu_ms_per_answer": cpu / len(answered) * 1000 if answered else None,
+            "rss_mb": usage_after["rss_mb"],
+            "peak_rss_mb": usage_after["peak_rss_mb"],
+        }
+    return result
+
+
+def print_header():
+    print(f"{'mode':<6} {'load':>6} {'answered':>8} {'failed':>6} {'rejected':>8} {'req/s':>7} "
+          f"{'ttfb p50/p99 ms':>16} {'ttft p50/p99 ms':>16} {'ttlb p50/p99 ms':>16} "
+          f"{'lag p99 ms':>10} {'cpu %':>6} {'rss MB':>7}")
+
+
+def pair(summary: Optional[Dict[str, float]]) -> str:
+    return f"{summary['p50']:.0f} / {summary['p99']:.0f}" if summary else "-"
+
+
+def print_result(result: Dict[str, Any]):
+    lag = f"{result['event_loop_lag_ms']['p99']:g}" if result["event_loop_lag_ms"] else "-"
+    server = result["server"]
+    cpu = f"{server['cpu_percent']:.0f}" if server else "-"
+    rss = f"{server['rss_mb']:.0f}" if server else "-"
+    print(f"{result['mode']:<6} {result['load']:>6g} {result['answered']:>8} {result['failed']:>6} "
+          f"{result['rejected']:>8} {result['throughput_rps']:>7.2f} {pair(result['ttfb_ms']):>16} "
+          f"{pair(result['ttft_ms']):>16} {pair(result['ttlb_ms']):>16} {lag:>10} {cpu:>6} {rss:>7}")
+
+
+async def drive(args, url: str, pid: Optional[int]) -> List[Dict[str, Any]]:
+    generator = LoadGenerator(url, args.clients, args.seed)
+    results = []
+    try:
+        for _ in range(args.warmup):
+            await one_request(generator.clients[0], url, generator.question())
+        plans = [("closed", level) for level in args.concurrency] + [("open", rate) for rate in args.rate]
+        print_header()
+        for mode, load in plans:
+            usage_before = process_usage(pid)
+            lag_before = await asyncio.to_thread(scrape_histogram, url, "event_loop_lag_seconds")
+            client_cpu = time.process_time()
+            began = time.perf_counter()
+            if mode == "closed":
+                outcomes = await generator.closed_loop(int(load), args.requests)
+            else:
+                outcomes = await generator.open_loop(load, args.duration, args.seed)
+            elapsed = time.perf_counter() - began
+            client_cpu = time.process_time() - client_cpu
+            usage_after = process_usage(pid)
+            lag_after = await asyncio.to_thread(scrape_histogram, url, "event_loop_lag_seconds")
+            result = summarize(mode, load, outcomes, elapsed, usage_before, usage_after,
+                               lag_before, lag_after, client_cpu)
+            print_result(result)
+            results.append(result)
+    finally:
+        await generator.aclose()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(paths: List[str]):
+    """
+    Prints the headline numbers of each saved run side by side, matched by
+    mode and load, with the change from the first file.
+    """
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            reports.append(json.load(f))
+    metrics = [
+        ("req/s", lambda r: r["throughput_rps"]),
+        ("ttfb p50", lambda r: (r["ttfb_ms"] or {}).get("p50")),
+        ("ttfb p99", lambda r: (r["ttfb_ms"] or {}).get("p99")),
+        ("ttft p50", lambda r: (r["ttft_ms"] or {}).get("p50")),
+        ("ttlb p50", lambda r: (r["ttlb_ms"] or {}).get("p50")),
+        ("ttlb p99", lambda r: (r["ttlb_ms"] or {}).get("p99")),
+        ("lag p99", lambda r: (r["event_loop_lag_ms"] or {}).get("p99")),
+        ("cpu ms/answer", lambda r: (r["server"] or {}).get("cpu_ms_per_answer")),
+        ("peak rss MB", lambda r: (r["server"] or {}).get("peak_rss_mb")),
+    ]
+    print(f"{'run':<14} {'metric':<14}" + "".join(f" {report['label']:>22}" for report in reports))
+    for run in reports[0]["runs"]:
+        key = (run["mode"], run["load"])
+        matched = [next((r for r in report["runs"] if (r["mode"], r["load"]) == key), None) for report in reports]
+        for name, value_of in metrics:
+            values = [value_of(r) if r is not None else None for r in matched]
+            cells = []
+            for value in values:
+                if value is None:
+                    cells.append(f"{'-':>22}")
+                elif values[0]:
+                    cells.append(f"{value:>13.1f} ({(value / values[0] - 1) * 100:+5.0f}%)")
+                else:
+                    cells.append(f"{value:>22.1f}")
+            run_name = f"{key[0]} {key[1]:g}"
+            print(f"{run_name:<14} {name:<14} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end load test of /generate against local stub completion and embedding "
+                    "servers: throughput, TTFB/TTFT/TTLB percentiles, event-loop lag and server CPU/RSS.")
+    parser.add_argument("--concurrency", default="1,10,50",
+                        help="closed-loop levels: requests in flight at once (empty for none)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per closed-loop level")
+    parser.add_argument("--rate", default="", help="open-loop levels: Poisson arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of arrivals per open-loop level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=64, help="distinct client addresses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="stub time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="stub token rate")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0, help="stub embedding latency")
+    parser.add_argument("--chunks", type=int, default=5000, help="synthetic chunks in the indexes")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="setting for the backend (repeatable), e.g. SSE_FLUSH_MS=0")
+    parser.add_argument("--port", type=int, default=8130)
+    parser.add_argument("--stub-port", type=int, default=8131)
+    parser.add_argument("--url", help="load an already running backend instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="pid of the --url backend, for CPU and RSS")
+    parser.add_argument("--label", help="name of this run in the results (default: the git commit)")
+    parser.add_argument("--output", help="results file (default: e2e-<label>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS", help="compare saved results instead")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+    args.concurrency = [int(level) for level in args.concurrency.split(",") if level]
+    args.rate = [float(rate) for rate in args.rate.split(",") if rate]
+    label = args.label or git_commit()
+    report = {
+        "label": label,
+        "commit": git_commit(),
+        "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key != "compare"},
+    }
+
+    if args.url:
+        report["runs"] = asyncio.run(drive(args, args.url, args.server_pid))
+    else:
+        stub = start_fake_server(
+            args.stub_port, args.embed_latency_ms, 0,
+            "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+        )
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                build_corpus(directory, args.chunks)
+                backend = start_backend(args, directory, f"http://127.0.0.1:{args.stub_port}/v1")
+                try:
+                    url = f"http://127.0.0.1:{args.port}"
+                    print(f"stub: first token {args.ttft_ms:g} ms, {args.tokens_per_second:g} tokens/s, "
+                          f"embeddings {args.embed_latency_ms:g} ms; {args.chunks} chunks")
+                    report["runs"] = asyncio.run(drive(args, url, backend.pid))
+                finally:
+                    backend.terminate()
+                    backend.wait()
+        finally:
+            stub.terminate()
+
+    output = args.output or f"e2e-{label}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import httpx
+
+WORDS = (
+    "battery charge bluetooth pairing firmware update reset noise cancelling "
+    "shutter lens sensor exposure drone propeller gimbal return policy refund "
+    "shipping warranty display screen waterproof speaker headphones controller"
+).split()
+
+
+def synthetic_chunks(count: int, chars: int = 500, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words = []
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(WORDS))
+        chunks.append(" ".join(words)[:chars])
+    return chunks
+
+
+def start_fake_server(port: int, latency_ms: float, max_inflight: int, *extra_args: str) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai",
+        "--port", str(port),
+        "--latency-ms", str(latency_ms),
+        "--max-inflight", str(max_inflight),
+        *extra_args,
+    ])
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("fake embedding server did not start")
+
+
+async def run(levels: list, chunks: list, batch_tokens: int):
+    # Imported after OPENAI_API_BASE is set so litellm picks up the stub
+    from llm import Embeddings
+    from embedding_pipeline import BatchEmbedder
+
+    print(f"{'concurrency':>11} {'seconds':>8} {'chunks/s':>9} {'requests':>9} {'retries':>8}")
+    for concurrency in levels:
+        embedder = BatchEmbedder(
+            Embeddings(),
+            concurrency=concurrency,
+            max_batch_tokens=batch_tokens,
+            retry_base_seconds=0.05,
+        )
+        start = time.perf_counter()
+        vectors = await embedder.embed(chunks)
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == len(chunks)
+        print(f"{concurrency:>11} {elapsed:>8.2f} {len(chunks) / elapsed:>9.1f} "
+              f"{embedder.requests:>9} {embedder.retries:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingestion embedding throughput against a local fake server.")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--batch-tokens", type=int, default=4000)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--max-inflight", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    server = start_fake_server(args.port, args.latency_ms, args.max_inflight)
+    try:
+        levels = [int(level) for level in args.concurrency.split(",")]
+        asyncio.run(run(levels, synthetic_chunks(args.chunks), args.batch_tokens))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import math
+import re
+import json
+import struct
+import time
+from typing import Dict, Iterable, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+DEFAULT_DIM = 1536
+WORD_RE = re.compile(r"\w+")
+ANSWER_WORDS = ("Based on the context, the item can be returned within thirty days "
+                "of delivery for a full refund if it is unused and in its original packaging.").split()
+
+
+def hashed_embedding(text: str, dim: int = DEFAULT_DIM) -> list:
+    """
+    Deterministic bag-of-words vector: every word adds +/-1 to a dimension
+    picked by its hash, and the result is L2-normalized. Texts that share
+    words end up close, so retrieval over these vectors behaves sensibly.
+    """
+    vector = [0.0] * dim
+    for word in WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dim] += 1.0 if value >> 63 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class ConnectionCounter:
+    """
+    ASGI middleware recording the client address of every API request.
+    Each TCP connection has its own client port, so the set's size is the
+    number of connections opened; /health polls are not counted.
+    """
+
+    def __init__(self, app, connections: set):
+        self.app = app
+        self.connections = connections
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] != "/health" and scope.get("client"):
+            self.connections.add(tuple(scope["client"]))
+        await self.app(scope, receive, send)
+
+
+def create_app(
+    latency_ms: float = 0.0,
+    max_inflight: int = 0,
+    dim: int = DEFAULT_DIM,
+    ttft_ms: float = 0.0,
+    tokens_per_second: float = 0.0,
+    max_streams: int = 0,
+    model_ttft_ms: Optional[Dict[str, float]] = None,
+    failing_models: Iterable[str] = (),
+) -> FastAPI:
+    """
+    OpenAI-compatible /v1/embeddings, /v1/chat/completions (streaming only)
+    and /v1/models. Each embedding request sleeps latency_ms; when more
+    than max_inflight are in progress the extra ones get 429. Completions
+    send their first token after ttft_ms and the rest at tokens_per_second
+    (0 = as fast as possible); above max_streams open completions the
+    extra ones get 429. model_ttft_ms overrides ttft_ms for the models it
+    names, and completions for failing_models get 500.
+    """
+    model_ttft_ms = model_ttft_ms or {}
+    failing_models = set(failing_models)
+    app = FastAPI()
+    app.state.inflight = 0
+    app.state.requests = 0
+    app.state.rate_limited = 0
+    app.state.completions = 0
+    app.state.streams = 0
+    app.state.connections = set()
+    app.add_middleware(ConnectionCounter, connections=app.state.connections)
+
+    @app.get("/health")
+    def health():
+        return {
+            "requests": app.state.requests,
+            "rate_limited": app.state.rate_limited,
+            "completions": app.state.completions,
+            "connections": len(app.state.connections),
+        }
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [
+            {"id": model, "object": "model", "owned_by": "stub"}
+            for model in ["gpt-4.1", *model_ttft_ms]
+        ]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.completions += 1
+        if max_streams and app.state.streams >= max_streams:
+            app.state.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"retry-after": "1"},
+            )
+        model = body.get("model", "gpt-4.1")
+        if model in failing_models:
+            return JSONResponse(
+                {"error": {"message": "The server had an error", "type": "server_error"}},
+                status_code=500,
+            )
+        first_token_ms = model_ttft_ms.get(model, ttft_ms)
+        created = int(time.time())
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        async def stream():
+            try:
+                if first_token_ms:
+                    await asyncio.sleep(first_token_ms / 1000)
+                yield chunk({"role": "assistant", "content": ""})
+                for i, word in enumerate(ANSWER_WORDS):
+                    if i and tokens_per_second:
+                        await asyncio.sleep(1 / tokens_per_second)
+                    yield chunk({"content": word if i == 0 else " " + word})
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                app.state.streams -= 1
+
+        app.state.streams += 1
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if max_inflight and app.state.inflight >= max_inflight:
+            app.state.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"retry-after": "1"},
+            )
+        app.state.inflight += 1
+        try:
+            if latency_ms:
+                await asyncio.sleep(latency_ms / 1000)
+            inputs = body["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            # Like OpenAI's, a shortened vector is the renormalized prefix
+            # of the full one
+            dimensions = min(body.get("dimensions") or dim, dim)
+            data = []
+            for i, text in enumerate(inputs):
+                vector = hashed_embedding(text, dim)
+                if dimensions < dim:
+                    vector = vector[:dimensions]
+                    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+                    vector = [v / norm for v in vector]
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(
+                        struct.pack(f"<{len(vector)}f", *vector)).decode()
+                data.append(
+                    {"object": "embedding", "index": i, "embedding": vector})
+            tokens = sum(len(WORD_RE.findall(text)) for text in inputs)
+            # JSONResponse skips FastAPI's per-float jsonable_encoder pass,
+            # which otherwise dominates the stub's own latency
+            return JSONResponse({
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        finally:
+            app.state.inflight -= 1
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--max-inflight", type=int, default=0,
+                        help="answer 429 above this many concurrent requests (0 = unlimited)")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--ttft-ms", type=float, default=0.0,
+                        help="delay before the first completion token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="completion token rate after the first (0 = unthrottled)")
+    parser.add_argument("--max-streams", type=int, default=0,
+                        help="answer 429 above this many open completions (0 = unlimited)")
+    parser.add_argument("--model-ttft-ms", action="append", default=[], metavar="MODEL=MS",
+                        help="delay before the first token for one model (repeatable)")
+    parser.add_argument("--failing-model", action="append", default=[],
+                        help="answer 500 to completions for this model (repeatable)")
+    parser.add_argument("--keepalive-seconds", type=float, default=5.0,
+                        help="idle time before the server closes a connection (uvicorn's default is 5)")
+    args = parser.parse_args()
+    model_ttft_ms = {}
+    for value in args.model_ttft_ms:
+        model, _, ms = value.rpartition("=")
+        model_ttft_ms[model] = float(ms)
+    app = create_app(args.latency_ms, args.max_inflight, args.dim, args.ttft_ms, args.tokens_per_second,
+                     args.max_streams, model_ttft_ms, args.failing_model)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning",
+                timeout_keep_alive=args.keepalive_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from admin_utils.download_data import PDF_LINKS
+from admin_utils.populate_data import PDF_LINKED_PRODUCTS
+from benchmarks.embed_throughput import WORDS, synthetic_chunks
+from benchmarks.fake_openai import hashed_embedding
+from catalog import Product, ProductCatalog
+from chunking import POLICY_DOCUMENTS
+from query_router import QueryRouter
+from rag import RAG
+from vector_store import create_vector_store
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def build_corpus(store, catalog: ProductCatalog, chunks_per_manual: int, seed: int):
+    """
+    Synthetic manuals sharing one vocabulary, as real manuals share words
+    like battery, pairing and firmware; a fifth of each manual's chunks
+    name its product, like page headers do.
+    """
+    rng = random.Random(seed)
+    rag = RAG(store, None, catalog=catalog)
+    documents = [filename for _, _, filename in PDF_LINKS] + sorted(POLICY_DOCUMENTS)
+    for d, document in enumerate(documents):
+        title = document.rsplit(".", 1)[0].replace("_", " ")
+        count = chunks_per_manual if document not in POLICY_DOCUMENTS else chunks_per_manual // 10
+        texts = synthetic_chunks(count, seed=seed + d)
+        texts = [f"{title}. {text}" if rng.random() < 0.2 else text for text in texts]
+        store.upsert_documents(
+            embeddings=[hashed_embedding(text) for text in texts],
+            documents=texts,
+            ids=[f"{document}_{i}" for i in range(count)],
+            metadatas=[rag.chunk_metadata(f"pdfs/{document}", i + 1, i + 1) for i in range(count)],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency and precision of product-routed versus unfiltered retrieval.")
+    parser.add_argument("--store", default="numpy", choices=["chroma", "numpy"])
+    parser.add_argument("--chunks-per-manual", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = ProductCatalog.load()
+    if not catalog.products:
+        # No populated ecommerce.db here: use the products it is seeded with
+        catalog = ProductCatalog([Product(i + 1, p[0]) for i, p in enumerate(PDF_LINKED_PRODUCTS)])
+    router = QueryRouter(catalog)
+    rng = random.Random(args.seed)
+    questions = []
+    for _ in range(args.queries):
+        product = rng.choice(catalog.products)
+        questions.append((product, f"{' '.join(rng.sample(WORDS, 4))} {product.name}?"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = create_vector_store(args.store, persist_directory=directory)
+        build_corpus(store, catalog, args.chunks_per_manual, args.seed)
+        store.warm()
+        print(f"{args.store}: {len(PDF_LINKS)} manuals x {args.chunks_per_manual} chunks, "
+              f"{args.queries} questions, k={args.k}")
+        print(f"{'mode':<10} {'precision@k':>11} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in ("unfiltered", "routed"):
+            latencies, relevant = [], 0
+            for product, question in questions:
+                where = router.route(question) if mode == "routed" else None
+                vector = hashed_embedding(question)
+                began = time.perf_counter()
+                result = store.query(query_embeddings=[vector], n_results=args.k,
+                                     include=["metadatas"], where=where)
+                latencies.append((time.perf_counter() - began) * 1000)
+                relevant += sum(1 for metadata in result["metadatas"][0]
+                                if metadata.get("product_id") == product.product_id)
+            print(f"{mode:<10} {relevant / (args.k * len(questions)):>11.3f} "
+                  f"{statistics.median(latencies):>8.3f} {percentile(latencies, 99):>8.3f}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+PDF_DIR = os.path.join(os.path.dirname(__file__), "..", "pdfs")
+EMBEDDING_DIM = 1536
+
+
+def largest_pdf() -> str:
+    paths = [os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.lower().endswith(".pdf")]
+    return max(paths, key=os.path.getsize)
+
+
+def fake_vector(rng: random.Random) -> list:
+    # Same shape as a provider response: a list of Python floats
+    return [rng.random() for _ in range(EMBEDDING_DIM)]
+
+
+def run_concat(pdf_path: str, with_vectors: bool, segment_size: int) -> int:
+    """
+    The original approach: concatenate every page, slice the whole text into
+    chunks, then hold a vector for every chunk at once.
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(pdf_path)
+    all_text = ""
+    for page in reader.pages:
+        all_text += page.extract_text() or ""
+    chunks = []
+    start = 0
+    while start < len(all_text):
+        chunks.append(all_text[start:start + 500])
+        start += 450
+    chunks = [c.strip() for c in chunks if c.strip()]
+    if with_vectors:
+        rng = random.Random(0)
+        vectors = [fake_vector(rng) for _ in chunks]
+        assert len(vectors) == len(chunks)
+    return len(chunks)
+
+
+def run_stream(pdf_path: str, with_vectors: bool, segment_size: int) -> int:
+    """
+    The streaming path used by RAG.ingest_pdf: chunks are produced page by
+    page and only one segment of vectors is alive at a time.
+    """
+    from chunking import FixedCharChunker, iter_chunks
+    from pdf_extract import iter_page_texts
+    rng = random.Random(0)
+    count = 0
+    segment = []
+    for chunk in iter_chunks(iter_page_texts(pdf_path), FixedCharChunker()):
+        segment.append(chunk)
+        count += 1
+        if len(segment) == segment_size:
+            if with_vectors:
+                vectors = [fake_vector(rng) for _ in segment]
+                del vectors
+            segment = []
+    if with_vectors and segment:
+        vectors = [fake_vector(rng) for _ in segment]
+    return count
+
+
+def child(mode: str, pdf_path: str, with_vectors: bool, segment_size: int):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    began = time.perf_counter()
+    run = run_concat if mode == "concat" else run_stream
+    chunks = run(pdf_path, with_vectors, segment_size)
+    elapsed = time.perf_counter() - began
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    print(f"{mode:<8} {chunks:>7} {elapsed:>8.2f} {peak / scale:>12.1f} {(peak - baseline) / scale:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak RSS of PDF extraction and chunking, concatenating vs streaming.")
+    parser.add_argument("--pdf", default=None,
+                        help="PDF to ingest (default: the largest file in pdfs/)")
+    parser.add_argument("--with-vectors", action="store_true",
+                        help="also hold a 1536-d vector per chunk, as ingestion does")
+    parser.add_argument("--segment-size", type=int, default=256)
+    parser.add_argument("--child", choices=["concat", "stream"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pdf_path = args.pdf or largest_pdf()
+    if args.child:
+        child(args.child, pdf_path, args.with_vectors, args.segment_size)
+        return
+
+    print(f"PDF: {pdf_path} ({os.path.getsize(pdf_path) / 1e6:.1f} MB)")
+    print(f"{'mode':<8} {'chunks':>7} {'seconds':>8} {'peak RSS MB':>12} {'growth MB':>12}")
+    for mode in ("concat", "stream"):
+        # Each mode runs in a fresh interpreter so peak RSS is not shared
+        command = [sys.executable, "-m", "benchmarks.ingest_memory",
+                   "--child", mode, "--pdf", pdf_path,
+                   "--segment-size", str(args.segment_size)]
+        if args.with_vectors:
+            command.append("--with-vectors")
+        subprocess.run(command, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from benchmarks.embed_throughput import synthetic_chunks
+from lexical_index import LexicalIndex
+
+MODEL_NUMBERS = ["WH-1000XM5", "XPS 15 9530", "IP67", "Mini 4 Pro", "SM-S918B", "EOS R50"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build, load, query and incremental-update cost of the BM25 index.")
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--update", type=int, default=256,
+                        help="chunks upserted for the incremental update step")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    chunks = [f"{chunk} {rng.choice(MODEL_NUMBERS)}" for chunk in synthetic_chunks(args.chunks, seed=3)]
+    ids = [f"chunk_{i}" for i in range(len(chunks))]
+    with tempfile.TemporaryDirectory() as directory:
+        index = LexicalIndex(directory)
+        began = time.perf_counter()
+        index.upsert(ids, chunks, ["synthetic.pdf"] * len(ids))
+        index.flush()
+        print(f"build+flush   {time.perf_counter() - began:8.2f} s  "
+              f"({len(chunks)} chunks, {directory_bytes(directory) / 1e6:.1f} MB on disk)")
+        index.close()
+
+        began = time.perf_counter()
+        index = LexicalIndex(directory)
+        index.query("battery", 4)
+        print(f"load+query    {(time.perf_counter() - began) * 1000:8.2f} ms")
+
+        questions = [f"{rng.choice(MODEL_NUMBERS)} {' '.join(rng.sample(chunks[0].split(), 3))}"
+                     for _ in range(args.queries)]
+        latencies = []
+        for question in questions:
+            began = time.perf_counter()
+            index.query(question, 20)
+            latencies.append((time.perf_counter() - began) * 1000)
+        print(f"query p50     {statistics.median(latencies):8.2f} ms")
+        print(f"query p99     {percentile(latencies, 99):8.2f} ms")
+
+        began = time.perf_counter()
+        index.upsert(ids[:args.update], chunks[:args.update], ["synthetic.pdf"] * args.update)
+        index.query("battery", 4)
+        print(f"update+merge  {(time.perf_counter() - began) * 1000:8.2f} ms  ({args.update} chunks)")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import os
+import time
+from benchmarks.embed_throughput import start_fake_server
+from benchmarks.ttfb import percentile
+
+SLOW_MODEL = "gpt-4.1"
+FAST_MODEL = "gpt-4.1-mini"
+FAILING_MODEL = "gpt-4.1-nano"
+
+# name: (complex tier, fallbacks, hedge, description)
+SCENARIOS = {
+    "single": ([SLOW_MODEL], [], True, "slow model only"),
+    "hedge": ([SLOW_MODEL], [FAST_MODEL], True, "slow model, fast one raced in at the deadline"),
+    "failover": ([SLOW_MODEL], [FAST_MODEL], False, "slow model, replaced by the fast one at the deadline"),
+    "ranked": ([SLOW_MODEL, FAST_MODEL], [], True, "both in the tier, ranked by rolling TTFT"),
+    "errors": ([FAILING_MODEL], [FAST_MODEL], True, "failing model, fast one as fallback"),
+}
+
+
+async def run_scenario(name: str, args) -> dict:
+    # Imported after OPENAI_API_BASE is set so litellm picks up the stub
+    from llm import LLM
+    from model_router import ModelRouter
+
+    tier, fallbacks, hedge, _ = SCENARIOS[name]
+    llm = LLM()
+    await llm.warm()
+    router = ModelRouter(
+        llm,
+        complex_models=tier,
+        fallback_models=fallbacks,
+        hedge_after_seconds=args.hedge_after_ms / 1000,
+        hedge=hedge,
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_request(i: int) -> float:
+        # A long question, so every request takes the complex tier
+        conversation = [{"role": "user", "content": f"question {i} " + "word " * 50}]
+        async with semaphore:
+            route = router.route(conversation, [])
+            began = time.perf_counter()
+            ttft = None
+            async for _ in router.generate(conversation, route):
+                if ttft is None:
+                    ttft = time.perf_counter() - began
+            return ttft * 1000
+
+    ttfts = sorted(await asyncio.gather(*(one_request(i) for i in range(args.requests))))
+    stats = router.stats()
+    return {
+        "p50": percentile(ttfts, 50),
+        "p99": percentile(ttfts, 99),
+        "answers": {model: counts["answers"] for model, counts in stats["models"].items() if counts["answers"]},
+        "hedged": stats["hedged"],
+        "failovers": stats["failovers"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time to first token through the model router against a stub with one slow "
+                    "and one fast model, with and without hedging and failover.")
+    parser.add_argument("--port", type=int, default=8125)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--slow-ttft-ms", type=float, default=1500.0)
+    parser.add_argument("--fast-ttft-ms", type=float, default=150.0)
+    parser.add_argument("--hedge-after-ms", type=float, default=500.0)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="run only these scenarios (repeatable)")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    server = start_fake_server(
+        args.port, 0, 0,
+        "--model-ttft-ms", f"{SLOW_MODEL}={args.slow_ttft_ms}",
+        "--model-ttft-ms", f"{FAST_MODEL}={args.fast_ttft_ms}",
+        "--failing-model", FAILING_MODEL,
+    )
+    try:
+        print(f"{args.requests} requests, {args.concurrency} at a time; {SLOW_MODEL} first token after "
+              f"{args.slow_ttft_ms:g} ms, {FAST_MODEL} after {args.fast_ttft_ms:g} ms, "
+              f"deadline {args.hedge_after_ms:g} ms")
+        for name in args.scenario or SCENARIOS:
+            print(f"  {name}: {SCENARIOS[name][3]}")
+        print(f"{'scenario':<9} {'p50 ms':>7} {'p99 ms':>7} {'hedged':>7} {'failovers':>9}  answers")
+        for name in args.scenario or SCENARIOS:
+            result = asyncio.run(run_scenario(name, args))
+            print(f"{name:<9} {result['p50']:>7.0f} {result['p99']:>7.0f} {result['hedged']:>7} "
+                  f"{result['failovers']:>9}  {result['answers']}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import List, Optional
+import httpx
+from benchmarks.ttfb import DEFAULT_URL, DEFAULT_QUESTION, percentile
+
+
+class Outcome:
+    def __init__(self, status: int, seconds: float, ttft: Optional[float] = None, failed: bool = False):
+        self.status = status
+        self.seconds = seconds
+        self.ttft = ttft
+        self.failed = failed
+
+
+async def one_request(client: httpx.AsyncClient, url: str, question: str) -> Outcome:
+    payload = {"conversation": [{"role": "user", "content": question}]}
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", f"{url}/generate", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Outcome(response.status_code, time.perf_counter() - start)
+            ttft, failed = None, False
+            async for line in response.aiter_lines():
+                if line == "event: error":
+                    failed = True
+                elif ttft is None and line.startswith("data: ") and not line.startswith("data: {"):
+                    ttft = time.perf_counter() - start
+            return Outcome(200, time.perf_counter() - start, ttft, failed)
+    except httpx.HTTPError:
+        return Outcome(0, time.perf_counter() - start, failed=True)
+
+
+async def run(args) -> List[Outcome]:
+    # Each client connects from its own loopback address, so the server
+    # sees distinct client addresses as it would from separate users
+    clients = [
+        httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(local_address=f"127.0.0.{i + 1}"),
+            timeout=120,
+        )
+        for i in range(args.clients)
+    ]
+    rng = random.Random(args.seed)
+    tasks = []
+    deadline = time.perf_counter() + args.duration
+    i = 0
+    # Open loop: arrivals follow a Poisson process whatever the server does
+    while time.perf_counter() < deadline:
+        client = clients[i % len(clients)]
+        tasks.append(asyncio.ensure_future(one_request(client, args.url, f"{args.question} {i}")))
+        i += 1
+        await asyncio.sleep(rng.expovariate(args.rate))
+    outcomes = await asyncio.gather(*tasks)
+    for client in clients:
+        await client.aclose()
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop overload test of /generate: outcomes and latency of admitted requests.")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--rate", type=float, default=10.0, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of arrivals")
+    parser.add_argument("--clients", type=int, default=16, help="distinct client addresses")
+    parser.add_argument("--question", default=DEFAULT_QUESTION)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    outcomes = asyncio.run(run(args))
+    statuses = Counter(outcome.status for outcome in outcomes)
+    answered = sorted(o.seconds for o in outcomes if o.status == 200 and not o.failed)
+    first_tokens = sorted(o.ttft for o in outcomes if o.status == 200 and not o.failed and o.ttft)
+    rejected = sorted(o.seconds for o in outcomes if o.status in (429, 503))
+    failed = sum(1 for o in outcomes if o.failed)
+    print(f"offered:     {len(outcomes)} requests at {args.rate:g}/s from {args.clients} clients")
+    print(f"answered:    {len(answered)}")
+    print(f"failed:      {failed} (error event or broken connection)")
+    print(f"rejected:    {statuses[429]} x 429, {statuses[503]} x 503")
+    if answered:
+        print(f"ttft p50:    {percentile(first_tokens, 50) * 1000:.0f} ms, p99 {percentile(first_tokens, 99) * 1000:.0f} ms")
+        print(f"total p50:   {percentile(answered, 50) * 1000:.0f} ms, p99 {percentile(answered, 99) * 1000:.0f} ms")
+    if rejected:
+        print(f"reject p99:  {percentile(rejected, 99) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
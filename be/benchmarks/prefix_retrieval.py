@@ -0,0 +1,78 @@
+import argparse
+import tempfile
+import numpy as np
+from numpy_store import NumpyVectorStore
+from benchmarks.vector_store_compare import exact_top_k, file_mb, make_queries, run
+
+
+def matryoshka_corpus(count: int, dim: int, decay: float, seed: int):
+    """
+    Unit vectors around a few hundred topic centres whose spread shrinks
+    with the dimension index, so the leading dimensions carry most of the
+    signal, as in embeddings trained to be truncated (text-embedding-3).
+    """
+    rng = np.random.default_rng(seed)
+    weights = (np.arange(dim) + 1.0) ** -decay
+    centres = rng.normal(size=(max(1, count // 50), dim))
+    vectors = centres[rng.integers(0, len(centres), size=count)] + rng.normal(0, 0.7, size=(count, dim))
+    vectors *= weights
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    ids = [f"chunk_{i}" for i in range(count)]
+    return ids, vectors, [f"chunk {i}" for i in range(count)], [{"source": "synthetic"}] * count
+
+
+def build(root: str, name: str, ids, vectors, documents, metadatas, **options) -> NumpyVectorStore:
+    store = NumpyVectorStore(persist_directory=f"{root}/{name}", **options)
+    for start in range(0, len(ids), 5000):
+        end = start + 5000
+        store.upsert_documents(
+            embeddings=vectors[start:end].tolist(),
+            documents=documents[start:end],
+            ids=ids[start:end],
+            metadatas=metadatas[start:end],
+        )
+    store.flush()
+    store.warm()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall@k and latency of searching a short prefix of each vector and "
+                    "re-ranking the candidates in full, versus searching the full vectors.")
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--prefix-dims", type=int, default=256)
+    parser.add_argument("--rescore", default="16,32,64,128",
+                        help="comma-separated numbers of candidates re-ranked in full")
+    parser.add_argument("--decay", type=float, default=0.5,
+                        help="how fast the signal per dimension falls off (0 = evenly spread)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, vectors, documents, metadatas = matryoshka_corpus(args.chunks, args.dim, args.decay, args.seed)
+    queries = make_queries(vectors, args.queries, args.noise, args.seed + 1)
+    truth = exact_top_k(vectors, queries, args.k)
+    configs = [(f"full {args.dim}", {"prefix_dims": 0})]
+    configs += [(f"prefix {args.prefix_dims} +rescore {n}", {"prefix_dims": args.prefix_dims, "rescore_candidates": n})
+                for n in (int(value) for value in args.rescore.split(","))]
+    configs.append((f"prefix {args.prefix_dims} int8 +rescore 64",
+                    {"prefix_dims": args.prefix_dims, "dtype": "int8", "rescore_candidates": 64}))
+
+    print(f"{args.chunks} chunks, {args.dim} dimensions, {args.queries} queries, k={args.k}")
+    print(f"{'index':<30} {'recall@k':>8} {'p50 ms':>8} {'p99 ms':>8} {'scan MB':>8} {'side MB':>8}")
+    with tempfile.TemporaryDirectory() as root:
+        for i, (name, options) in enumerate(configs):
+            store = build(root, str(i), ids, vectors, documents, metadatas, **options)
+            recall, p50, p99 = run(name, store, ids, queries, truth, args.k)
+            print(f"{name:<30} {recall:>8.3f} {p50:>8.3f} {p99:>8.3f} "
+                  f"{file_mb(store.persist_directory, 'embeddings.npy'):>8.1f} "
+                  f"{file_mb(store.persist_directory, 'embeddings.full.npy'):>8.1f}")
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
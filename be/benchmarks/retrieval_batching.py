@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import httpx
+from benchmarks.embed_throughput import start_fake_server, synthetic_chunks
+from benchmarks.fake_openai import hashed_embedding
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def run_level(rag, clients: int, per_client: int, questions: list) -> tuple:
+    latencies = []
+
+    async def client(c: int):
+        for i in range(per_client):
+            # Distinct questions so neither cache can answer
+            question = f"{questions[(c * per_client + i) % len(questions)]} {c} {i}"
+            began = time.perf_counter()
+            await rag.retrieve_relevant_chunks(question, k=4)
+            latencies.append((time.perf_counter() - began) * 1000)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return time.perf_counter() - began, latencies
+
+
+async def run(args, server_url: str):
+    # Imported after OPENAI_API_BASE is set so litellm picks up the stub
+    from llm import Embeddings
+    from rag import RAG
+    from retrieval_batcher import RetrievalBatcher
+    from vector_store import create_vector_store
+
+    chunks = synthetic_chunks(args.chunks, seed=1)
+    questions = synthetic_chunks(512, chars=60, seed=2)
+    with tempfile.TemporaryDirectory() as workdir:
+        store = create_vector_store(args.store, persist_directory=workdir)
+        for start in range(0, len(chunks), 1000):
+            batch = chunks[start:start + 1000]
+            store.upsert_documents(
+                embeddings=[hashed_embedding(chunk) for chunk in batch],
+                documents=batch,
+                ids=[f"chunk_{start + i}" for i in range(len(batch))],
+            )
+        store.warm()
+        embeddings = Embeddings()
+        print(f"{'window ms':>9} {'clients':>7} {'queries/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'embed reqs':>10} {'mean batch':>10}")
+        for window_ms in args.windows:
+            for clients in args.clients:
+                batcher = None
+                if window_ms > 0:
+                    batcher = RetrievalBatcher(embeddings, store, window_ms / 1000, args.max_batch)
+                rag = RAG(store, embeddings, batcher=batcher)
+                before = httpx.get(f"{server_url}/health").json()["requests"]
+                elapsed, latencies = await run_level(rag, clients, args.per_client, questions)
+                requests = httpx.get(f"{server_url}/health").json()["requests"] - before
+                mean_batch = batcher.stats()["mean_batch"] if batcher else 1.0
+                print(f"{window_ms:>9g} {clients:>7} {len(latencies) / elapsed:>10.1f} "
+                      f"{statistics.median(latencies):>8.1f} {percentile(latencies, 99):>8.1f} "
+                      f"{requests:>10} {mean_batch:>10.1f}")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Retrieval throughput and latency with and without micro-batching.")
+    parser.add_argument("--clients", default="1,10,100")
+    parser.add_argument("--windows", default="0,2,5",
+                        help="batching windows in ms to compare (0 = no batching)")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--per-client", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--store", default="numpy", choices=["chroma", "numpy"])
+    parser.add_argument("--latency-ms", type=float, default=20.0,
+                        help="latency of each embedding request at the stub server")
+    parser.add_argument("--port", type=int, default=8101)
+    args = parser.parse_args()
+    args.clients = [int(c) for c in args.clients.split(",")]
+    args.windows = [float(w) for w in args.windows.split(",")]
+
+    server_url = f"http://127.0.0.1:{args.port}"
+    os.environ["OPENAI_API_BASE"] = f"{server_url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    server = start_fake_server(args.port, args.latency_ms, 0)
+    try:
+        asyncio.run(run(args, server_url))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
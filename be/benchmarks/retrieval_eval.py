@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple
+from benchmarks.embed_throughput import synthetic_chunks
+from benchmarks.fake_openai import hashed_embedding
+from benchmarks.ttfb import percentile
+
+PDF_DIR = os.path.join(os.path.dirname(__file__), "..", "pdfs")
+DEFAULT_CACHE_PATH = "retrieval_eval_embeddings.sqlite"
+# Cached vectors of the corpus and queries do not expire
+CACHE_TTL_SECONDS = 10 * 365 * 24 * 3600
+
+# Questions about the documents written by admin_utils/gen_policy_docs.py,
+# worded the way a customer would ask. A retrieved chunk answers one if it
+# contains the evidence text, so any chunking can be scored.
+POLICY_QUERIES = [
+    ("How many days do I have to send something back?", "Returns_Policy.pdf", "30 calendar days"),
+    ("What condition does an item have to be in to be returned?", "Returns_Policy.pdf",
+     "original packaging with all original tags"),
+    ("How do I start a return?", "Returns_Policy.pdf", "Visit our Returns Portal"),
+    ("Do I get a label to post my return?", "Returns_Policy.pdf", "pre-paid shipping label"),
+    ("My order arrived broken, what should I do?", "Returns_Policy.pdf", "within 7 days of delivery"),
+    ("Do you refund the delivery charge for a faulty product?", "Returns_Policy.pdf",
+     "including any original shipping costs"),
+    ("How long until the refund shows up on my card?", "Returns_Policy.pdf", "typically 5-10 business days"),
+    ("Can I return a gift card or software I downloaded?", "Returns_Policy.pdf",
+     "Downloadable software products"),
+    ("Which items are not eligible for a return?", "Returns_Policy.pdf", "not eligible for return"),
+    ("How long before my order is processed?", "Shipping_Information.pdf", "processed within 1-2 business days"),
+    ("How much does standard delivery cost in the UK?", "Shipping_Information.pdf", "Free for orders over"),
+    ("Is there a faster delivery option?", "Shipping_Information.pdf", "Express Shipping"),
+    ("Do you deliver to other countries?", "Shipping_Information.pdf", "countries within the European Union"),
+    ("Will I have to pay customs fees or VAT?", "Shipping_Information.pdf", "import duties and taxes"),
+    ("When does my tracking number start working?", "Shipping_Information.pdf",
+     "allow 48 hours for the tracking information"),
+    ("My package never arrived, who do I contact?", "Shipping_Information.pdf",
+     "within 10 days of receiving your shipping confirmation"),
+    ("Where can I follow my parcel?", "Frequently_Asked_Questions.pdf", "on the carrier's website"),
+    ("Can I pay with PayPal?", "Frequently_Asked_Questions.pdf", "as well as PayPal"),
+    ("The product I want is sold out, what can I do?", "Frequently_Asked_Questions.pdf",
+     "'Back in Stock' notifications"),
+    ("Do your products have a guarantee?", "Frequently_Asked_Questions.pdf", "one-year manufacturer's warranty"),
+    ("How quickly is a refund processed once you get my return?", "Frequently_Asked_Questions.pdf",
+     "processed within 3-5 business days"),
+    ("I forgot my password", "Frequently_Asked_Questions.pdf", "'Forgot Password' link"),
+    ("How do I change my delivery address?", "Frequently_Asked_Questions.pdf", "update your saved addresses"),
+    ("What is your return policy?", "Frequently_Asked_Questions.pdf", "30-day return policy for unused items"),
+]
+
+STOPWORDS = set("""
+a an and are as at be been but by can do does for from has have how i if in into is it its of on or
+our so that the their them then there these this to was we were what when where which while who will
+with you your not no all any each may must should than too very also use used using
+""".split())
+
+# A configuration's settings; a name maps to its differences from these
+BASE_CONFIG = {
+    "store": "numpy",
+    "dtype": "float32",
+    "rescore": 32,
+    "prefix_dims": 0,
+    "hybrid": 0,
+    "hybrid_candidates": 20,
+    "chunker_manual": "token_window",
+    "chunker_policy": "recursive",
+}
+CONFIGS = {
+    "dense": {},
+    "dense-int8": {"dtype": "int8"},
+    "dense-int8-codes-only": {"dtype": "int8", "rescore": 0},
+    "hybrid": {"hybrid": 1},
+    "hybrid-int8": {"hybrid": 1, "dtype": "int8"},
+    "hybrid-fixed-char": {"hybrid": 1, "chunker_manual": "fixed_char", "chunker_policy": "fixed_char"},
+    "hybrid-token-window": {"hybrid": 1, "chunker_policy": "token_window"},
+}
+
+
+class Query(NamedTuple):
+    text: str
+    source: str
+    evidence: str
+    group: str
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def write_policy_pdfs(directory: str) -> List[str]:
+    from admin_utils.gen_policy_docs import generate_faq, generate_returns_policy, generate_shipping_policy
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for generate in (generate_returns_policy, generate_shipping_policy, generate_faq):
+            generate(directory)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def readable_manuals(pdf_dir: str) -> List[str]:
+    """
+    Manuals in pdf_dir that PyPDF2 can open; files that are not PDFs, such
+    as Git LFS pointers of manuals never downloaded, are skipped.
+    """
+    from chunking import POLICY_DOCUMENTS
+    from pdf_extract import count_pages
+
+    manuals = []
+    if not os.path.isdir(pdf_dir):
+        return manuals
+    for name in sorted(os.listdir(pdf_dir)):
+        if not name.lower().endswith(".pdf") or name in POLICY_DOCUMENTS:
+            continue
+        path = os.path.join(pdf_dir, name)
+        try:
+            count_pages(path)
+        except Exception:
+            print(f"Skipping {name}: not a readable PDF")
+            continue
+        manuals.append(path)
+    return manuals
+
+
+def manual_queries(pdf_path: str, count: int, seed: int) -> List[Query]:
+    """
+    Keyword questions drawn from sentences of the manual: the sentence's
+    content words with some left out, answered by a chunk that contains
+    six consecutive words from its middle.
+    """
+    from pdf_extract import iter_page_texts
+
+    sentences = []
+    for _, text in iter_page_texts(pdf_path):
+        for sentence in re.split(r"(?<=[.!?])\s+", " ".join(text.split())):
+            words = sentence.split()
+            if 10 <= len(words) <= 40 and sum(word.isalpha() for word in words) >= 0.7 * len(words):
+                sentences.append(words)
+    rng = random.Random(f"{seed}:{os.path.basename(pdf_path)}")
+    queries = []
+    for words in rng.sample(sentences, min(count, len(sentences))):
+        content = [word.strip(",;:()\"'") for word in words]
+        content = [word for word in content if len(word) > 2 and word.lower() not in STOPWORDS]
+        kept = [word for word in content if rng.random() > 0.4] or content
+        middle = max(0, len(words) // 2 - 3)
+        queries.append(Query(" ".join(kept[:12]), os.path.basename(pdf_path),
+                             " ".join(words[middle:middle + 6]), "manual"))
+    return queries
+
+
+def golden_queries(manuals: List[str], per_manual: int, seed: int) -> List[Query]:
+    queries = [Query(text, source, evidence, "policy") for text, source, evidence in POLICY_QUERIES]
+    for pdf_path in manuals:
+        queries.extend(manual_queries(pdf_path, per_manual, seed))
+    return queries
+
+
+def make_embeddings(kind: str, cache_path: str, offline: bool):
+    """
+    Embeddings for the corpus and the queries: "stub" vectors are the stub
+    server's hashed bag of words, computed in process; "cache" calls the
+    configured model once per text and keeps the vectors in a SQLite
+    cache, so later runs (or offline ones) make no calls.
+    """
+    from llm import Embeddings
+    from embedding_cache import EmbeddingCache
+
+    if kind == "stub":
+        class StubEmbeddings(Embeddings):
+            async def embed_uncached(self, texts: List[str]) -> List[List[float]]:
+                return [hashed_embedding(text) for text in texts]
+
+        return StubEmbeddings()
+
+    class CachedEmbeddings(Embeddings):
+        async def embed_uncached(self, texts: List[str]) -> List[List[float]]:
+            if offline:
+                raise RuntimeError(f"{len(texts)} texts are not in {cache_path}; run once without --offline")
+            return await super().embed_uncached(texts)
+
+    cache = EmbeddingCache(max_bytes=1 << 30, ttl_seconds=CACHE_TTL_SECONDS, persist_path=cache_path)
+    return CachedEmbeddings(cache=cache)
+
+
+def parse_config(spec: str) -> tuple:
+    """
+    A preset name, or name:key=value,... with settings over BASE_CONFIG.
+    """
+    name, _, overrides = spec.partition(":")
+    if not overrides and name not in CONFIGS:
+        raise SystemExit(f"Unknown configuration {name!r}; presets: {', '.join(CONFIGS)}")
+    settings = {**BASE_CONFIG, **CONFIGS.get(name, {})}
+    for setting in filter(None, overrides.split(",")):
+        key, _, value = setting.partition("=")
+        if key not in BASE_CONFIG:
+            raise SystemExit(f"Unknown setting {key!r}; settings: {', '.join(BASE_CONFIG)}")
+        settings[key] = type(BASE_CONFIG[key])(value)
+    return name, settings
+
+
+async def build_rag(settings: Dict[str, Any], directory: str, embeddings, documents: List[str], distractors: int):
+    """
+    Chunks and indexes documents (and distractor chunks) as configured,
+    through the same RAG.add_chunks path as ingestion.
+    """
+    from rag import RAG
+    from chunking import Chunk, document_type
+    from lexical_index import LexicalIndex
+    from vector_store import create_vector_store
+
+    options = {"persist_directory": os.path.join(directory, "vectors")}
+    if settings["store"] == "numpy":
+        options.update(dtype=settings["dtype"], rescore_candidates=settings["rescore"],
+                       prefix_dims=settings["prefix_dims"])
+    store = create_vector_store(settings["store"], **options)
+    lexical_index = LexicalIndex(os.path.join(directory, "lexical")) if settings["hybrid"] else None
+    rag = RAG(store, embeddings, lexical_index=lexical_index, hybrid_candidates=settings["hybrid_candidates"])
+    chunk_count = 0
+    for pdf_path in documents:
+        strategy = settings[f"chunker_{document_type(pdf_path)}"]
+        chunks = list(RAG.iter_pdf_chunks(pdf_path, strategy))
+        vectors = await rag.batch_embedder.embed([chunk.text for chunk in chunks])
+        indexes = list(range(len(chunks)))
+        ids = [f"{os.path.basename(pdf_path)}_{i}" for i in indexes]
+        await rag.add_chunks(pdf_path, chunks, vectors, ids, indexes)
+        chunk_count += len(chunks)
+    if distractors:
+        texts = synthetic_chunks(distractors, seed=7)
+        vectors = await rag.batch_embedder.embed(texts)
+        indexes = list(range(len(texts)))
+        ids = [f"synthetic.pdf_{i}" for i in indexes]
+        await rag.add_chunks("synthetic.pdf", [Chunk(text, 1, 1) for text in texts], vectors, ids, indexes)
+        chunk_count += len(texts)
+    await rag.flush()
+    store.warm()
+    return rag, chunk_count
+
+
+def score(queries: List[Query], rankings: List[List[str]], ks: List[int]) -> Dict[str, float]:
+    """
+    recall@k: share of queries with an answering chunk in the top k.
+    MRR: mean reciprocal rank of the first answering chunk (0 if none).
+    """
+    ranks = []
+    for query, documents in zip(queries, rankings):
+        evidence = normalize(query.evidence)
+        ranks.append(next((rank for rank, document in enumerate(documents, start=1)
+                           if evidence in normalize(document)), None))
+    result = {f"recall@{k}": sum(1 for rank in ranks if rank and rank <= k) / len(ranks) for k in ks}
+    result["mrr"] = sum(1 / rank for rank in ranks if rank) / len(ranks)
+    return result
+
+
+async def evaluate(rag, queries: List[Query], ks: List[int], concurrency: int, rounds: int) -> Dict[str, Any]:
+    k = max(ks)
+    # Every query once before timing: caches of the embeddings, not of
+    # search results, so the timed passes measure retrieval alone
+    rankings = [await rag.retrieve_relevant_chunks(query.text, k=k) for query in queries]
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            began = time.perf_counter()
+            await rag.retrieve_relevant_chunks(query.text, k=k)
+            latencies.append((time.perf_counter() - began) * 1000)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query: Query):
+        async with semaphore:
+            await rag.retrieve_relevant_chunks(query.text, k=k)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one(query) for _ in range(rounds) for query in queries))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    result: Dict[str, Any] = {
+        **score(queries, rankings, ks),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+        "queries_per_second": rounds * len(queries) / elapsed,
+    }
+    groups = sorted({query.group for query in queries})
+    if len(groups) > 1:
+        result["groups"] = {
+            group: score([q for q in queries if q.group == group],
+                         [r for q, r in zip(queries, rankings) if q.group == group], ks)
+            for group in groups
+        }
+    return result
+
+
+def check_evidence(queries: List[Query], documents: List[str]) -> List[Query]:
+    """
+    Queries whose evidence is not in their document's text at all, which
+    no configuration could answer.
+    """
+    from pdf_extract import iter_page_texts
+
+    texts = {os.path.basename(path): normalize(" ".join(text for _, text in iter_page_texts(path)))
+             for path in documents}
+    return [query for query in queries if normalize(query.evidence) not in texts.get(query.source, "")]
+
+
+async def run(args) -> Dict[str, Any]:
+    ks = [int(k) for k in args.k.split(",")]
+    configs = [parse_config(spec) for spec in args.config or CONFIGS]
+    embeddings = make_embeddings(args.embeddings, args.embedding_cache, args.offline)
+    with tempfile.TemporaryDirectory() as workdir:
+        policy_dir = os.path.join(workdir, "policies")
+        os.makedirs(policy_dir)
+        manuals = readable_manuals(args.pdf_dir)
+        documents = write_policy_pdfs(policy_dir) + manuals
+        queries = golden_queries(manuals, args.manual_queries, args.seed)
+        unanswerable = check_evidence(queries, documents)
+        if unanswerable:
+            raise SystemExit("Evidence not found in the corpus: "
+                             + "; ".join(f"{q.source}: {q.evidence!r}" for q in unanswerable))
+        if args.save_queries:
+            with open(args.save_queries, "w") as f:
+                json.dump([query._asdict() for query in queries], f, indent=2)
+        groups = ", ".join(f"{sum(1 for q in queries if q.group == group)} {group}"
+                           for group in sorted({q.group for q in queries}))
+        print(f"{len(queries)} queries ({groups}) over {len(documents)} documents and "
+              f"{args.distractors} distractor chunks; {args.embeddings} embeddings")
+        columns = [f"recall@{k}" for k in ks] + ["mrr"]
+        print(f"{'config':<24} {'chunks':>6} " + " ".join(f"{column:>9}" for column in columns)
+              + f" {'p50 ms':>7} {'p99 ms':>7} {'queries/s':>9}")
+        results = []
+        for i, (name, settings) in enumerate(configs):
+            rag, chunk_count = await build_rag(settings, os.path.join(workdir, str(i)), embeddings,
+                                               documents, args.distractors)
+            try:
+                result = await evaluate(rag, queries, ks, args.concurrency, args.rounds)
+            finally:
+                rag.vector_store.close()
+                if rag.lexical_index is not None:
+                    rag.lexical_index.close()
+            print(f"{name:<24} {chunk_count:>6} " + " ".join(f"{result[column]:>9.3f}" for column in columns)
+                  + f" {result['p50_ms']:>7.2f} {result['p99_ms']:>7.2f} {result['queries_per_second']:>9.0f}")
+            for group, scores in result.get("groups", {}).items():
+                print(f"  {group:<22} {'':>6} " + " ".join(f"{scores[column]:>9.3f}" for column in columns))
+            results.append({"config": name, "settings": settings, "chunks": chunk_count, **result})
+    if embeddings.cache is not None:
+        embeddings.cache.close()
+    return {"queries": len(queries), "embeddings": args.embeddings, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline retrieval evaluation: recall@k, MRR, latency and throughput of "
+                    "RAG.retrieve_relevant_chunks on golden queries under several configurations.")
+    parser.add_argument("--config", action="append",
+                        help="preset name, or name:key=value,... over the base settings (repeatable; "
+                             f"presets: {', '.join(CONFIGS)}; settings: {', '.join(BASE_CONFIG)})")
+    parser.add_argument("--k", default="1,4,10", help="comma-separated cut-offs for recall")
+    parser.add_argument("--embeddings", choices=["stub", "cache"], default="stub",
+                        help="stub: hashed bag-of-words vectors; cache: the embedding model, cached on disk")
+    parser.add_argument("--embedding-cache", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--offline", action="store_true", help="fail instead of calling the embedding model")
+    parser.add_argument("--pdf-dir", default=PDF_DIR, help="directory of product manuals")
+    parser.add_argument("--manual-queries", type=int, default=20, help="questions drawn from each manual")
+    parser.add_argument("--distractors", type=int, default=2000,
+                        help="synthetic chunks added to the index as noise")
+    parser.add_argument("--rounds", type=int, default=5, help="timed passes over the queries")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent queries for throughput")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-queries", help="write the golden queries to this JSON file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
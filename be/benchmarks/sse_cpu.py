@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import aclosing
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+import uvicorn
+from sse import SSEWriter, sse_data
+
+MODES = ("before", "per-delta", "coalesced")
+
+
+def create_app(mode: str, tokens: int, tokens_per_second: float, flush_bytes: int, flush_ms: float) -> FastAPI:
+    """
+    /stream relays a synthetic model stream of tokens short deltas as
+    /generate does: "before" with one f-string event per delta through
+    StreamingResponse, "per-delta" and "coalesced" through SSEWriter
+    without and with coalescing. /cpu reports the process's CPU time.
+    """
+    app = FastAPI()
+    writer = SSEWriter(flush_bytes, flush_ms if mode == "coalesced" else 0)
+
+    async def deltas():
+        for i in range(tokens):
+            if tokens_per_second:
+                await asyncio.sleep(1 / tokens_per_second)
+            yield f" word{i % 10}"
+
+    @app.get("/cpu")
+    def cpu():
+        return {"seconds": time.process_time()}
+
+    @app.get("/stream")
+    async def stream():
+        if mode == "before":
+            async def event_stream():
+                async for delta in deltas():
+                    yield f"data: {delta}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        async def event_stream():
+            async with aclosing(writer.coalesce(deltas())) as chunks:
+                async for chunk in chunks:
+                    yield sse_data(chunk)
+            yield sse_data("[DONE]")
+        return writer.response(event_stream())
+
+    return app
+
+
+def start_server(mode: str, args) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.sse_cpu", "--serve", mode,
+        "--port", str(args.port),
+        "--tokens", str(args.tokens),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--flush-bytes", str(args.flush_bytes),
+        "--flush-ms", str(args.flush_ms),
+    ])
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/cpu", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("SSE server did not start")
+
+
+async def drive(args) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=60) as client:
+
+        async def one_request() -> tuple:
+            async with semaphore:
+                began = time.perf_counter()
+                chunks = events = 0
+                async with client.stream("GET", f"{url}/stream") as response:
+                    async for text in response.aiter_text():
+                        chunks += 1
+                        events += text.count("\n\n")
+                return time.perf_counter() - began, chunks, events
+
+        before = (await client.get(f"{url}/cpu")).json()["seconds"]
+        results = await asyncio.gather(*(one_request() for _ in range(args.requests)))
+        after = (await client.get(f"{url}/cpu")).json()["seconds"]
+    return {
+        "cpu_ms": (after - before) / args.requests * 1000,
+        "events": statistics.mean(events for _, _, events in results),
+        "reads": statistics.mean(chunks for _, chunks, _ in results),
+        "total_ms": statistics.median(seconds for seconds, _, _ in results) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Server CPU time per streamed response, one event per delta versus coalesced events.")
+    parser.add_argument("--port", type=int, default=8126)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--flush-bytes", type=int, default=256)
+    parser.add_argument("--flush-ms", type=float, default=20.0)
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        app = create_app(args.serve, args.tokens, args.tokens_per_second, args.flush_bytes, args.flush_ms)
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+        return
+
+    print(f"{args.requests} responses of {args.tokens} deltas at {args.tokens_per_second:g}/s, "
+          f"{args.concurrency} at a time; coalescing at {args.flush_bytes} bytes or {args.flush_ms:g} ms")
+    print(f"{'mode':<10} {'cpu ms/response':>15} {'events':>7} {'reads':>6} {'total p50 ms':>12}")
+    for mode in MODES:
+        server = start_server(mode, args)
+        try:
+            result = asyncio.run(drive(args))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:<10} {result['cpu_ms']:>15.2f} {result['events']:>7.0f} {result['reads']:>6.0f} "
+              f"{result['total_ms']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Tuple
+import httpx
+
+DEFAULT_URL = "http://localhost:8000"
+DEFAULT_QUESTION = "What is your return policy?"
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return float("nan")
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def one_request(client: httpx.AsyncClient, url: str, question: str) -> Tuple[float, float]:
+    """
+    Returns the seconds between sending the request and the first body
+    byte, and between sending it and the first answer token (the first
+    unnamed data event; status events come before it).
+    """
+    payload = {"conversation": [{"role": "user", "content": question}]}
+    start = time.perf_counter()
+    async with client.stream("POST", f"{url}/generate", json=payload) as response:
+        ttfb = ttft = None
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            if ttft is None and line.startswith("data: ") and not line.startswith("data: {"):
+                ttft = time.perf_counter() - start
+        end = time.perf_counter() - start
+        return (ttfb if ttfb is not None else end), (ttft if ttft is not None else end)
+
+
+async def run(url: str, concurrency: int, total: int, question: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    timings, first_tokens = [], []
+
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def worker():
+            async with semaphore:
+                ttfb, ttft = await one_request(client, url, question)
+                timings.append(ttfb)
+                first_tokens.append(ttft)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    timings.sort()
+    first_tokens.sort()
+    print(f"requests:    {total} at concurrency {concurrency}")
+    print(f"elapsed:     {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"ttfb p50:    {percentile(timings, 50) * 1000:.1f} ms")
+    print(f"ttfb p99:    {percentile(timings, 99) * 1000:.1f} ms")
+    print(f"ttfb mean:   {statistics.mean(timings) * 1000:.1f} ms")
+    print(f"ttft p50:    {percentile(first_tokens, 50) * 1000:.1f} ms")
+    print(f"ttft p99:    {percentile(first_tokens, 99) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time-to-first-byte of /generate under concurrent load.")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--question", default=DEFAULT_QUESTION)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.requests, args.question))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import numpy as np
+from chromadb_client import ChromaDbClient, CHROMA_DB_DIR
+from numpy_store import NumpyVectorStore
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def load_collection(chroma: ChromaDbClient):
+    page = chroma.collection.get(include=["embeddings", "documents", "metadatas"])
+    return page["ids"], np.asarray(page["embeddings"], dtype=np.float32), page["documents"], page["metadatas"]
+
+
+def synthetic_corpus(count: int, dim: int, seed: int):
+    """
+    Unit vectors scattered around a few hundred topic centres, standing in
+    for chunk embeddings when there is no collection to read.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, count // 50), dim))
+    vectors = centres[rng.integers(0, len(centres), size=count)] + rng.normal(0, 0.7, size=(count, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    ids = [f"chunk_{i}" for i in range(count)]
+    return ids, vectors, [f"chunk {i}" for i in range(count)], [{"source": "synthetic"}] * count
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """
+    Stored vectors plus Gaussian noise: near, but not exactly on, a chunk,
+    the way a user question lands near the passage that answers it.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(vectors), size=count)
+    queries = vectors[rows] + rng.normal(0, noise, size=(count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = queries.astype(np.float64) @ unit.T.astype(np.float64)
+    return [list(np.argsort(-row, kind="stable")[:k]) for row in scores]
+
+
+def run(name, store, ids, queries, truth, k):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        began = time.perf_counter()
+        result = store.query(query_embeddings=[query.tolist()], n_results=k, include=["documents"])
+        latencies.append((time.perf_counter() - began) * 1000)
+        hits += len(set(result["ids"][0]) & {ids[row] for row in expected})
+    return hits / (k * len(queries)), statistics.median(latencies), percentile(latencies, 99)
+
+
+def file_mb(directory: str, name: str) -> float:
+    """
+    Size of one file of the index's current generation, 0 if absent.
+    """
+    with open(os.path.join(directory, "CURRENT")) as f:
+        path = os.path.join(directory, f.read().strip(), name)
+    return os.path.getsize(path) / 1e6 if os.path.exists(path) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall@k, query latency, memory and load time of Chroma versus the NumPy "
+                    "vector store in float32, float16 and int8, with and without re-scoring.")
+    parser.add_argument("--chroma-dir", default=CHROMA_DB_DIR)
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark this many synthetic vectors instead of the Chroma collection")
+    parser.add_argument("--dim", type=int, default=1536, help="dimensions of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rescore-candidates", type=int, default=32)
+    parser.add_argument("--noise", type=float, default=0.02,
+                        help="per-dimension stddev added to stored vectors to make queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chroma = None
+    if args.synthetic:
+        ids, vectors, documents, metadatas = synthetic_corpus(args.synthetic, args.dim, args.seed)
+    else:
+        chroma = ChromaDbClient(persist_directory=args.chroma_dir)
+        ids, vectors, documents, metadatas = load_collection(chroma)
+        if not ids:
+            raise SystemExit(f"{args.chroma_dir} has no chunks; run admin_utils/ingest_pdfs.py first")
+    print(f"{len(ids)} chunks, {vectors.shape[1]} dimensions, {args.queries} queries, k={args.k}")
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    print(f"{'backend':<26} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'load ms':>8} "
+          f"{'matrix MB':>10} {'side MB':>8}")
+    if chroma is not None:
+        chroma.warm()
+        recall, p50, p99 = run("chroma", chroma, ids, queries, truth, args.k)
+        print(f"{'chroma':<26} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f}")
+        chroma.close()
+    with tempfile.TemporaryDirectory() as workdir:
+        for dtype in ("float32", "float16", "int8"):
+            directory = os.path.join(workdir, dtype)
+            builder = NumpyVectorStore(persist_directory=directory, dtype=dtype)
+            builder.upsert_documents(embeddings=vectors, documents=documents, ids=ids, metadatas=metadatas)
+            builder.close()
+            for rescore in ([0] if dtype == "float32" else [0, args.rescore_candidates]):
+                began = time.perf_counter()
+                store = NumpyVectorStore(persist_directory=directory, dtype=dtype, rescore_candidates=rescore)
+                store.warm()
+                load_ms = (time.perf_counter() - began) * 1000
+                recall, p50, p99 = run(dtype, store, ids, queries, truth, args.k)
+                name = f"numpy {dtype}" + (f" +rescore {rescore}" if rescore else "")
+                # The matrix is read whole and stays resident; the side file
+                # is only read for the rows being re-scored
+                print(f"{name:<26} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} {load_ms:>8.1f} "
+                      f"{file_mb(directory, 'embeddings.npy'):>10.1f} "
+                      f"{file_mb(directory, 'embeddings.full.npy'):>8.1f}")
+                store.close()
+
+
+if __name__ == "__main__":
+    main()
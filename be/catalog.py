@@ -0,0 +1,69 @@
+import os
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional
+from lexical_index import TOKEN_RE
+from config import ECOMMERCE_DB
+
+# Filename words that describe the document rather than the product
+DOCUMENT_WORDS = frozenset("manual qsg guide safety service user quick start".split())
+# Share of a manual's filename words that must appear in a product name
+MIN_NAME_OVERLAP = 0.75
+
+
+class Product(NamedTuple):
+    product_id: int
+    name: str
+
+
+def name_words(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+class ProductCatalog:
+    """
+    Products from the `products` table of ecommerce.db, and the link from
+    each product manual to the product it documents.
+    """
+
+    def __init__(self, products: List[Product]):
+        self.products = products
+        self._by_document: Dict[str, Optional[Product]] = {}
+
+    @classmethod
+    def load(cls, db_path: str = ECOMMERCE_DB) -> "ProductCatalog":
+        """
+        Reads the products; an absent or unreadable database gives an empty
+        catalog, so chunks are simply not linked to products.
+        """
+        if not os.path.exists(db_path):
+            return cls([])
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT product_id, product_name FROM products").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            return cls([])
+        return cls([Product(product_id, name) for product_id, name in rows])
+
+    def product_for_document(self, pdf_path: str) -> Optional[Product]:
+        """
+        Matches a manual's filename (e.g. Sony_WH-1000XM5_Manual.pdf)
+        against product names. Returns None for policy documents and for
+        manuals of products the shop does not list.
+        """
+        document = os.path.basename(pdf_path)
+        if document not in self._by_document:
+            stem = os.path.splitext(document)[0].replace("_", " ")
+            words = {w for w in name_words(stem) if w not in DOCUMENT_WORDS}
+            best, best_overlap, tied = None, 0.0, False
+            for product in self.products:
+                overlap = len(words & set(name_words(product.name))) / len(words) if words else 0.0
+                if overlap > best_overlap:
+                    best, best_overlap, tied = product, overlap, False
+                elif overlap == best_overlap and overlap > 0:
+                    tied = True
+            matched = best_overlap >= MIN_NAME_OVERLAP and not tied
+            self._by_document[document] = best if matched else None
+        return self._by_document[document]
@@ -1,13 +1,23 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional
+from config import CHROMA_EXECUTOR_WORKERS
+from vector_store import VectorStore
 
 CHROMA_COLLECTION_NAME = "documents"
 CHROMA_DB_DIR = "chroma_db"
 
 
-class ChromaDbClient:
-    def __init__(self, collection_name: str = CHROMA_COLLECTION_NAME, persist_directory: str = CHROMA_DB_DIR):
+class ChromaDbClient(VectorStore):
+    def __init__(
+        self,
+        collection_name: str = CHROMA_COLLECTION_NAME,
+        persist_directory: str = CHROMA_DB_DIR,
+        max_workers: int = CHROMA_EXECUTOR_WORKERS,
+    ):
+        # Chroma calls block on SQLite and HNSW; async callers run them on
+        # the executor set up by VectorStore
+        super().__init__(persist_directory, max_workers, thread_name_prefix="chroma")
         self.client = chromadb.PersistentClient(
             persist_directory,
         )
@@ -18,6 +28,29 @@ class ChromaDbClient:
             return self.client.get_collection(collection_name)
         return self.client.create_collection(collection_name)
 
+    def warm(self):
+        """
+        Loads the collection's HNSW index by running one query against a
+        stored vector, so the first real request does not pay for it.
+        """
+        sample = self.collection.peek(limit=1)
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            self.collection.query(
+                query_embeddings=[list(embeddings[0])],
+                n_results=1,
+                include=[],
+            )
+
+    def close(self):
+        """
+        Waits for in-flight calls, then drops the references to the
+        collection and the persistent client.
+        """
+        super().close()
+        self.collection = None
+        self.client = None
+
     def add_documents(
         self,
         embeddings: List[List[float]],
@@ -31,15 +64,61 @@ class ChromaDbClient:
             ids=ids,
             metadatas=metadatas,
         )
+        self._bump_version()
+
+    def upsert_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.collection.upsert(
+            embeddings=embeddings,
+            documents=documents,
+            ids=ids,
+            metadatas=metadatas,
+        )
+        self._bump_version()
+
+    def delete_documents(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        self.collection.delete(ids=ids, where=where)
+        self._bump_version()
 
     def query(
         self,
         query_embeddings: List[List[float]],
         n_results: int = 4,
         include: List[str] = ["documents"],
+        where: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         return self.collection.query(
             query_embeddings=query_embeddings,
             n_results=n_results,
             include=include,
+            where=where,
         )
+
+    def get_documents(
+        self,
+        ids: List[str],
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Dict[str, Any]:
+        return self.collection.get(ids=ids, include=include)
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Iterator[Dict[str, Any]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=include, limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
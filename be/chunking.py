@@ -0,0 +1,329 @@
+import inspect
+import os
+import re
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from tokens import count_tokens, decode, encode
+from config import (
+    EMBEDDING_MODEL,
+    CHUNKER_MANUAL,
+    CHUNKER_POLICY,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_MIN_TOKENS,
+)
+
+# PDFs written by admin_utils/gen_policy_docs.py; everything else is a manual
+POLICY_DOCUMENTS = {
+    "Returns_Policy.pdf",
+    "Shipping_Information.pdf",
+    "Frequently_Asked_Questions.pdf",
+}
+
+
+class Chunk(NamedTuple):
+    text: str
+    # 1-based numbers of the pages the chunk starts and ends on
+    page_start: int
+    page_end: int
+
+
+# Chunking strategies by name. A strategy is fed one page at a time through
+# feed(page_number, text) and returns the chunks each page completed;
+# finish() returns whatever is left once the document ends.
+CHUNKERS: Dict[str, Callable[..., "FixedCharChunker"]] = {}
+
+
+def register_chunker(name: str):
+    def decorator(cls):
+        CHUNKERS[name] = cls
+        return cls
+    return decorator
+
+
+def get_chunker(name: str, **options):
+    if name not in CHUNKERS:
+        raise ValueError(
+            f"Unknown chunking strategy {name!r}; available: {', '.join(sorted(CHUNKERS))}")
+    return CHUNKERS[name](**options)
+
+
+def document_type(pdf_path: str) -> str:
+    return "policy" if os.path.basename(pdf_path) in POLICY_DOCUMENTS else "manual"
+
+
+def chunk_document_type(chunk_id: str) -> str:
+    """
+    Document type of an ingested chunk, from its id: the PDF's file name,
+    "_" and an index or content hash.
+    """
+    for name in POLICY_DOCUMENTS:
+        if chunk_id.startswith(name + "_"):
+            return "policy"
+    return "manual"
+
+
+CHUNKER_BY_DOCUMENT_TYPE = {
+    "manual": CHUNKER_MANUAL,
+    "policy": CHUNKER_POLICY,
+}
+
+
+def chunker_for(pdf_path: str):
+    """
+    A fresh chunker of the strategy configured for the PDF's document type.
+    """
+    return get_chunker(CHUNKER_BY_DOCUMENT_TYPE[document_type(pdf_path)])
+
+
+def chunker_settings(pdf_path: str) -> Dict[str, Any]:
+    """
+    The strategy chunker_for uses for the PDF and the parameters it is
+    built with. Chunks of a document ingested with other settings differ.
+    """
+    name = CHUNKER_BY_DOCUMENT_TYPE[document_type(pdf_path)]
+    parameters = inspect.signature(CHUNKERS[name]).parameters
+    return {"strategy": name, **{key: parameter.default for key, parameter in parameters.items()}}
+
+
+@register_chunker("fixed_char")
+class FixedCharChunker:
+    """
+    Fixed-size character windows with overlap over text fed one page at a
+    time. Produces the same chunks as slicing the concatenated text of all
+    pages, while holding at most one page plus one window in memory.
+    """
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 50):
+        if overlap >= chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+        self._buffer = ""
+        # Absolute offset (in the concatenated text) of _buffer[0]
+        self._buffer_offset = 0
+        self._next_start = 0
+        self._length = 0
+        self._page_starts: List[int] = []
+        self._page_numbers: List[int] = []
+
+    def feed(self, page_number: int, text: str) -> List[Chunk]:
+        """
+        Adds one page of text and returns the windows it completed.
+        """
+        if text:
+            self._page_starts.append(self._length)
+            self._page_numbers.append(page_number)
+            self._buffer += text
+            self._length += len(text)
+        chunks = []
+        while self._next_start + self.chunk_size <= self._length:
+            self._emit(chunks)
+        self._trim()
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        """
+        Returns the trailing windows once all pages have been fed.
+        """
+        chunks: List[Chunk] = []
+        while self._next_start < self._length:
+            self._emit(chunks)
+        self._trim()
+        return chunks
+
+    def _emit(self, chunks: List[Chunk]):
+        start = self._next_start
+        end = min(start + self.chunk_size, self._length)
+        text = self._buffer[start - self._buffer_offset:end - self._buffer_offset].strip()
+        self._next_start += self.step
+        if text:
+            chunks.append(Chunk(text, self._page_at(start), self._page_at(end - 1)))
+
+    def _page_at(self, offset: int) -> int:
+        return self._page_numbers[bisect_right(self._page_starts, offset) - 1]
+
+    def _trim(self):
+        drop = min(self._next_start, self._length) - self._buffer_offset
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_offset += drop
+        first = max(0, bisect_right(self._page_starts, self._buffer_offset) - 1)
+        if first:
+            del self._page_starts[:first]
+            del self._page_numbers[:first]
+
+
+@register_chunker("token_window")
+class TokenWindowChunker:
+    """
+    Windows of max_tokens tokens with overlap_tokens of overlap, counted with
+    the embedding model's tokenizer, so every chunk costs about the same.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        model: str = EMBEDDING_MODEL,
+    ):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.step = max_tokens - overlap_tokens
+        self.model = model
+        self._tokens: List[int] = []
+        self._pages: List[int] = []
+        # Leading tokens of the buffer already emitted as the previous overlap
+        self._emitted = 0
+
+    def feed(self, page_number: int, text: str) -> List[Chunk]:
+        tokens = encode(text, self.model)
+        self._tokens.extend(tokens)
+        self._pages.extend([page_number] * len(tokens))
+        chunks: List[Chunk] = []
+        while len(self._tokens) >= self.max_tokens:
+            self._emit(chunks, self.max_tokens)
+            del self._tokens[:self.step]
+            del self._pages[:self.step]
+            self._emitted = self.max_tokens - self.step
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        if len(self._tokens) > self._emitted:
+            self._emit(chunks, len(self._tokens))
+        self._tokens, self._pages, self._emitted = [], [], 0
+        return chunks
+
+    def _emit(self, chunks: List[Chunk], size: int):
+        text = decode(self._tokens[:size], self.model).strip()
+        if text:
+            chunks.append(Chunk(text, self._pages[0], self._pages[size - 1]))
+
+
+HEADING_RE = re.compile(
+    r"^(?:\d+(?:\.\d+)*\.?\s+\S.*"      # 1.2 Numbered section
+    r"|[A-Z][A-Z0-9 &/,'()\-]{2,}"      # ALL CAPS
+    r"|\**Q:.*"                         # FAQ question
+    r")$"
+)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(*-])")
+
+
+def is_heading(line: str) -> bool:
+    if len(line) > 80 or line.endswith((".", ",", ";", ":")):
+        return False
+    if HEADING_RE.match(line):
+        return True
+    # Short Title Case lines such as "Faulty or Damaged Items"
+    words = line.split()
+    capitalized = sum(1 for w in words if w[:1].isupper() or w[:1].isdigit())
+    return 1 <= len(words) <= 8 and capitalized / len(words) >= 0.6
+
+
+class _Unit(NamedTuple):
+    text: str
+    page: int
+    tokens: int
+    heading: bool
+
+
+@register_chunker("recursive")
+class RecursiveChunker:
+    """
+    Structure-aware splitting: lines are joined back into paragraphs,
+    headings (and FAQ questions) start a new chunk, paragraphs are split into
+    sentences, and sentences are packed up to max_tokens. A sentence longer
+    than max_tokens is cut into token windows. The last sentences of a chunk,
+    up to overlap_tokens, are repeated at the start of the next one.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS,
+        model: str = EMBEDDING_MODEL,
+    ):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self.model = model
+        self._units: List[_Unit] = []
+        self._tokens = 0
+
+    def feed(self, page_number: int, text: str) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        paragraph: List[str] = []
+        for line in (text or "").splitlines():
+            line = line.strip()
+            if not line or is_heading(line):
+                self._add_paragraph(" ".join(paragraph), page_number, chunks)
+                paragraph = []
+                if line:
+                    self._add(self._unit(line, page_number, heading=True), chunks)
+            else:
+                paragraph.append(line)
+        self._add_paragraph(" ".join(paragraph), page_number, chunks)
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        self._flush(chunks, carry=False)
+        return chunks
+
+    def _unit(self, text: str, page: int, heading: bool = False) -> _Unit:
+        return _Unit(text, page, count_tokens(text, self.model), heading)
+
+    def _add_paragraph(self, paragraph: str, page: int, chunks: List[Chunk]):
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            if sentence.strip():
+                self._add(self._unit(sentence.strip(), page), chunks)
+
+    def _add(self, unit: _Unit, chunks: List[Chunk]):
+        if unit.heading and self._tokens >= self.min_tokens:
+            self._flush(chunks, carry=False)
+        if unit.tokens > self.max_tokens:
+            self._flush(chunks, carry=False)
+            tokens = encode(unit.text, self.model)
+            for start in range(0, len(tokens), self.max_tokens):
+                text = decode(tokens[start:start + self.max_tokens], self.model).strip()
+                if text:
+                    chunks.append(Chunk(text, unit.page, unit.page))
+            return
+        if self._tokens + unit.tokens > self.max_tokens:
+            self._flush(chunks, carry=True)
+        self._units.append(unit)
+        self._tokens += unit.tokens
+
+    def _flush(self, chunks: List[Chunk], carry: bool):
+        if not self._units:
+            return
+        parts = []
+        for unit in self._units:
+            parts.append(unit.text + ("\n" if unit.heading else " "))
+        chunks.append(Chunk("".join(parts).strip(),
+                      self._units[0].page, self._units[-1].page))
+        kept: List[_Unit] = []
+        if carry:
+            budget = self.overlap_tokens
+            for unit in reversed(self._units):
+                if unit.tokens > budget:
+                    break
+                kept.insert(0, unit)
+                budget -= unit.tokens
+        self._units = kept
+        self._tokens = sum(unit.tokens for unit in kept)
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], chunker=None) -> Iterator[Chunk]:
+    """
+    Yields chunks from (page number, text) pairs as the pages arrive.
+    Uses fixed 500/50 character windows unless a chunker is given.
+    """
+    if chunker is None:
+        chunker = FixedCharChunker()
+    for page_number, text in pages:
+        yield from chunker.feed(page_number, text)
+    yield from chunker.finish()
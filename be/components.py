@@ -0,0 +1,128 @@
+import asyncio
+from llm import LLM, Embeddings
+from vector_store import create_vector_store
+from rag import RAG
+from embedding_cache import EmbeddingCache
+from retrieval_cache import RetrievalCache
+from retrieval_batcher import RetrievalBatcher
+from lexical_index import open_built_index
+from catalog import ProductCatalog
+from query_router import QueryRouter
+from response_cache import SemanticResponseCache
+from context_budget import ContextBudget
+from model_router import ModelRouter
+from sse import SSEWriter
+from upstream import UpstreamClient
+from admission import AdmissionController, TokenBucket
+from metrics import EventLoopMonitor, RequestProfiler
+from config import (
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_CACHE_PATH,
+    RETRIEVAL_CACHE_MAX_ENTRIES,
+    RETRIEVAL_BATCH_WINDOW_MS,
+    RETRIEVAL_BATCH_MAX,
+    LEXICAL_INDEX_DIR,
+    ECOMMERCE_DB,
+    QUERY_ROUTER_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    ADMISSION_MAX_CONCURRENT,
+    LLM_REQUESTS_PER_SECOND,
+    LLM_REQUESTS_BURST,
+    EMBED_REQUESTS_PER_SECOND,
+    EMBED_REQUESTS_BURST,
+    PROFILE_SAMPLE_RATE,
+    EVENT_LOOP_MONITOR_MS,
+)
+
+
+class Components:
+    """
+    Process-wide clients shared by every request. Built once when the app
+    starts (inside its event loop), warmed before the first request is
+    served and closed on shutdown.
+    """
+
+    def __init__(self):
+        self.upstream = UpstreamClient()
+        self.admission = AdmissionController() if ADMISSION_MAX_CONCURRENT > 0 else None
+        self.profiler = RequestProfiler() if PROFILE_SAMPLE_RATE > 0 else None
+        self.loop_monitor = EventLoopMonitor() if EVENT_LOOP_MONITOR_MS > 0 else None
+        self.llm_rate_limit = None
+        if LLM_REQUESTS_PER_SECOND > 0:
+            self.llm_rate_limit = TokenBucket(LLM_REQUESTS_PER_SECOND, LLM_REQUESTS_BURST)
+        self.embedding_rate_limit = None
+        if EMBED_REQUESTS_PER_SECOND > 0:
+            self.embedding_rate_limit = TokenBucket(EMBED_REQUESTS_PER_SECOND, EMBED_REQUESTS_BURST)
+        self.llm = LLM(rate_limit=self.llm_rate_limit)
+        self.model_router = ModelRouter(self.llm)
+        self.sse_writer = SSEWriter()
+        self.context_budget = ContextBudget(self.llm.model)
+        self.embedding_cache = EmbeddingCache(
+            max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+            ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+            persist_path=EMBEDDING_CACHE_PATH or None,
+        )
+        self.embeddings = Embeddings(cache=self.embedding_cache, rate_limit=self.embedding_rate_limit)
+        self.vector_store = create_vector_store()
+        self.retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_MAX_ENTRIES)
+        self.retrieval_batcher = None
+        if RETRIEVAL_BATCH_WINDOW_MS > 0:
+            self.retrieval_batcher = RetrievalBatcher(
+                self.embeddings,
+                self.vector_store,
+                window_seconds=RETRIEVAL_BATCH_WINDOW_MS / 1000,
+                max_batch=RETRIEVAL_BATCH_MAX,
+            )
+        self.lexical_index = open_built_index(LEXICAL_INDEX_DIR) if LEXICAL_INDEX_DIR else None
+        self.catalog = ProductCatalog.load(ECOMMERCE_DB)
+        self.query_router = QueryRouter(self.catalog) if QUERY_ROUTER_ENABLED else None
+        self.rag = RAG(self.vector_store, self.embeddings,
+                       retrieval_cache=self.retrieval_cache,
+                       batcher=self.retrieval_batcher,
+                       lexical_index=self.lexical_index,
+                       catalog=self.catalog,
+                       router=self.query_router)
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = SemanticResponseCache(
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                threshold=RESPONSE_CACHE_THRESHOLD,
+            )
+
+    def warm(self):
+        self.context_budget.warm()
+        self.vector_store.warm()
+        if self.lexical_index is not None:
+            self.lexical_index.warm()
+
+    async def awarm(self):
+        """
+        Warms the local indexes in a thread while connections to the
+        provider are opened and litellm's request paths are loaded.
+        """
+        await asyncio.gather(
+            asyncio.to_thread(self.warm),
+            self.upstream.prewarm(),
+            self.llm.warm(),
+            self.embeddings.warm(),
+        )
+        # Started after warming, which holds the loop while it imports
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
+
+    async def aclose(self):
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+        await asyncio.to_thread(self.close)
+        await self.upstream.aclose()
+
+    def close(self):
+        self.vector_store.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        self.embedding_cache.close()
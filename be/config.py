@@ -0,0 +1,152 @@
+import os
+
+# Embedding model used for ingestion and queries
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+# Size of the vectors requested from it (0 = the model's full size); only
+# with the NumPy store, see NUMPY_PREFIX_DIMS
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "0"))
+
+# Threads serving blocking Chroma queries and writes off the event loop
+CHROMA_EXECUTOR_WORKERS = int(os.environ.get("CHROMA_EXECUTOR_WORKERS", "4"))
+
+# Vector store backend ("chroma" or "numpy"), and the NumPy index's
+# directory and search element type ("float32", "float16" or "int8"). With
+# float16 or int8, the top NUMPY_RESCORE_CANDIDATES rows are re-scored from
+# a float32 side file (0 = rank by the compact codes alone). float16 only
+# saves memory: NumPy has no fast float16 matmul, so every query upcasts the
+# whole matrix and search is about 7x slower than float32. int8 is smaller
+# and searches nearly as fast as float32
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+NUMPY_INDEX_DIR = os.environ.get("NUMPY_INDEX_DIR", "vector_index")
+NUMPY_INDEX_DTYPE = os.environ.get("NUMPY_INDEX_DTYPE", "float32")
+NUMPY_RESCORE_CANDIDATES = int(os.environ.get("NUMPY_RESCORE_CANDIDATES", "32"))
+# Search only the first NUMPY_PREFIX_DIMS dimensions (renormalised) of each
+# vector, then re-score the candidates in full (0 = search all dimensions).
+# NumPy store only: Chroma always searches the full vectors
+NUMPY_PREFIX_DIMS = int(os.environ.get("NUMPY_PREFIX_DIMS", "0"))
+
+# Query-embedding cache: in-memory byte budget, entry lifetime and an
+# optional SQLite file that keeps entries across restarts (empty = off)
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.environ.get("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+
+# Semantic answer cache for single-turn questions (opt-in): minimum cosine
+# similarity to a cached question, capacity and entry lifetime
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+# Retrieval result cache entries (0 disables); dropped on collection writes
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", "4096"))
+
+# Hybrid retrieval: BM25 index directory (empty disables; the server only
+# uses it once an index has been built there), candidates taken
+# from vector and BM25 search, and the reciprocal-rank fusion constant
+LEXICAL_INDEX_DIR = os.environ.get("LEXICAL_INDEX_DIR", "lexical_index")
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Shop database whose products are linked to manual chunks at ingestion,
+# and whether questions naming a product only search that product's chunks
+# (plus the policy documents)
+ECOMMERCE_DB = os.environ.get("ECOMMERCE_DB", "ecommerce.db")
+QUERY_ROUTER_ENABLED = os.environ.get("QUERY_ROUTER_ENABLED", "1") == "1"
+
+# Pooled HTTP connections to the LLM and embedding provider: pool size,
+# how long idle connections stay open, how many are opened at startup and
+# whether HTTP/2 is negotiated when the h2 package is installed
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_KEEPALIVE_SECONDS = float(os.environ.get("UPSTREAM_KEEPALIVE_SECONDS", "60"))
+UPSTREAM_PREWARM_CONNECTIONS = int(os.environ.get("UPSTREAM_PREWARM_CONNECTIONS", "2"))
+UPSTREAM_HTTP2 = os.environ.get("UPSTREAM_HTTP2", "1") == "1"
+
+# Admission control for /generate: streams served at once in total and per
+# client address (0 = no limit), requests allowed to wait for a slot, and
+# how long they may wait before a 503
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "64"))
+ADMISSION_MAX_PER_CLIENT = int(os.environ.get("ADMISSION_MAX_PER_CLIENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Upstream request rate limits (token buckets, requests per second; 0 = no
+# limit) and how many requests may go out at once after an idle period
+LLM_REQUESTS_PER_SECOND = float(os.environ.get("LLM_REQUESTS_PER_SECOND", "0"))
+LLM_REQUESTS_BURST = int(os.environ.get("LLM_REQUESTS_BURST", "10"))
+EMBED_REQUESTS_PER_SECOND = float(os.environ.get("EMBED_REQUESTS_PER_SECOND", "0"))
+EMBED_REQUESTS_BURST = int(os.environ.get("EMBED_REQUESTS_BURST", "20"))
+
+# Model routing: comma-separated models for simple questions (at most
+# ROUTER_SIMPLE_MAX_WORDS words, ROUTER_SIMPLE_MAX_TURNS user turns, and only
+# policy documents or no context retrieved) and for the rest, ranked by
+# rolling time to first token over LLM_TTFT_WINDOW_SECONDS; fallback models
+# follow. When the first token takes over LLM_HEDGE_AFTER_SECONDS the next
+# model is started, racing the slow one (LLM_HEDGE=1) or replacing it (0)
+LLM_SIMPLE_MODELS = os.environ.get("LLM_SIMPLE_MODELS", "gpt-4.1-mini")
+LLM_COMPLEX_MODELS = os.environ.get("LLM_COMPLEX_MODELS", "gpt-4.1")
+LLM_FALLBACK_MODELS = os.environ.get("LLM_FALLBACK_MODELS", "gpt-4.1-mini,gpt-4.1")
+ROUTER_SIMPLE_MAX_WORDS = int(os.environ.get("ROUTER_SIMPLE_MAX_WORDS", "40"))
+ROUTER_SIMPLE_MAX_TURNS = int(os.environ.get("ROUTER_SIMPLE_MAX_TURNS", "2"))
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", "3"))
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "1") == "1"
+LLM_TTFT_WINDOW_SECONDS = float(os.environ.get("LLM_TTFT_WINDOW_SECONDS", "300"))
+
+# /generate stage budgets: retrieval (the question is answered without
+# context when it runs over), the model's first token, and the longest
+# gap between two tokens
+RETRIEVAL_TIMEOUT_SECONDS = float(os.environ.get("RETRIEVAL_TIMEOUT_SECONDS", "3"))
+LLM_FIRST_TOKEN_TIMEOUT_SECONDS = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT_SECONDS", "20"))
+LLM_IDLE_TIMEOUT_SECONDS = float(os.environ.get("LLM_IDLE_TIMEOUT_SECONDS", "30"))
+
+# Answer deltas are sent in one SSE event per SSE_FLUSH_BYTES collected
+# (counted in characters) or SSE_FLUSH_MS after the oldest one held,
+# whichever comes first; the first delta is always sent at once, and 0 ms
+# sends every delta as it arrives
+SSE_FLUSH_BYTES = int(os.environ.get("SSE_FLUSH_BYTES", "256"))
+SSE_FLUSH_MS = float(os.environ.get("SSE_FLUSH_MS", "20"))
+
+# Prompt token budgets: retrieved context sent with each question, and
+# earlier conversation turns (the latest message is always sent in full)
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "2000"))
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "3000"))
+
+# Concurrent retrievals arriving within this window (0 disables) are served
+# by one embedding request and one multi-vector query, up to max per batch.
+# Off by default: it only pays off at about 10 or more concurrent clients
+RETRIEVAL_BATCH_WINDOW_MS = float(os.environ.get("RETRIEVAL_BATCH_WINDOW_MS", "0"))
+RETRIEVAL_BATCH_MAX = int(os.environ.get("RETRIEVAL_BATCH_MAX", "32"))
+
+# Ingestion embedding: batches in flight at once, per-request token and
+# item limits, and retry policy for 429/5xx responses
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+EMBED_BATCH_MAX_TOKENS = int(os.environ.get("EMBED_BATCH_MAX_TOKENS", "16000"))
+EMBED_BATCH_MAX_ITEMS = int(os.environ.get("EMBED_BATCH_MAX_ITEMS", "256"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "6"))
+EMBED_RETRY_BASE_SECONDS = float(os.environ.get("EMBED_RETRY_BASE_SECONDS", "0.5"))
+EMBED_RETRY_MAX_SECONDS = float(os.environ.get("EMBED_RETRY_MAX_SECONDS", "30"))
+
+# Parallel ingestion: pages handed to one parser process at a time
+INGEST_PAGES_PER_TASK = int(os.environ.get("INGEST_PAGES_PER_TASK", "25"))
+# Chunks embedded and written together; bounds how many chunk vectors one
+# document holds in memory during ingestion
+INGEST_SEGMENT_CHUNKS = int(os.environ.get("INGEST_SEGMENT_CHUNKS", "256"))
+
+# Chunking strategy per document type (see chunking.CHUNKERS) and the token
+# sizes used by the token-aware strategies
+CHUNKER_MANUAL = os.environ.get("CHUNKER_MANUAL", "token_window")
+CHUNKER_POLICY = os.environ.get("CHUNKER_POLICY", "recursive")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", "48"))
+
+# Response header carrying each request's trace ID: the client's own if it
+# sends one, a new one otherwise ("" = no trace IDs)
+TRACE_HEADER = os.environ.get("TRACE_HEADER", "X-Trace-Id")
+# Share of /generate requests run under cProfile (0 disables), and the
+# duration above which their profiles are written to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "2000"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# How often the event loop's timer lag is sampled (0 = not monitored)
+EVENT_LOOP_MONITOR_MS = float(os.environ.get("EVENT_LOOP_MONITOR_MS", "10"))
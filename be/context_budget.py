@@ -0,0 +1,221 @@
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from tokens import count_tokens, decode, encode
+from config import CONTEXT_MAX_TOKENS, HISTORY_MAX_TOKENS
+
+# Chat formats wrap every message in a few tokens of role markup
+MESSAGE_OVERHEAD_TOKENS = 4
+CONTEXT_HEADER = "Relevant context:\n"
+# Shorter shared text between two chunks is coincidence, not chunk overlap
+MIN_OVERLAP_CHARS = 20
+# An older turn is cut to fit the history budget only if this much of it fits
+MIN_TRUNCATED_TURN_TOKENS = 64
+ELISION = "…"
+
+
+class Prompt(NamedTuple):
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    context_tokens: int
+    history_tokens: int
+    context_blocks: int
+    turns_dropped: int
+
+
+def chunk_position(metadata: Optional[Dict[str, Any]]) -> Optional[Tuple[str, int]]:
+    """
+    The source file and position in it of a retrieved chunk, from the
+    metadata written at ingestion, or None for chunks stored without one.
+    """
+    if not metadata or metadata.get("chunk_index") is None or "source" not in metadata:
+        return None
+    return metadata["source"], int(metadata["chunk_index"])
+
+
+def merge_overlapping(first: str, second: str) -> Optional[str]:
+    """
+    first and second joined on the longest suffix of first that starts
+    second, or None if they do not overlap.
+    """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(probe, start + 1)
+    return None
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split())
+
+
+class ContextBudget:
+    """
+    Assembles the messages sent to the LLM within a token budget.
+
+    Retrieved chunks that are neighbours in the same document are merged
+    (their overlap sent once), duplicates are dropped, and blocks are
+    kept in rank order until context_max_tokens is spent. Older turns
+    are kept newest first until history_max_tokens is spent; the latest
+    message is always sent in full. Tokens are counted with the target
+    model's tokenizer.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        context_max_tokens: int = CONTEXT_MAX_TOKENS,
+        history_max_tokens: int = HISTORY_MAX_TOKENS,
+    ):
+        self.model = model
+        self.context_max_tokens = context_max_tokens
+        self.history_max_tokens = history_max_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.chunks_merged = 0
+        self.chunks_dropped = 0
+        self.turns_dropped = 0
+
+    def warm(self):
+        """
+        Loads the tokenizer, which takes a few hundred ms the first time.
+        """
+        count_tokens("warm", self.model)
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def _truncate(self, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        tokens = encode(text, self.model)
+        if len(tokens) <= max_tokens:
+            return text
+        # One token is left for the elision mark
+        if keep_end:
+            return ELISION + decode(tokens[len(tokens) - max_tokens + 1:], self.model)
+        return decode(tokens[:max_tokens - 1], self.model) + ELISION
+
+    def blocks(
+        self,
+        documents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+    ) -> Tuple[List[str], int]:
+        """
+        Merges chunks that are consecutive in the same document (by the
+        chunk_index in their metadata) into one block and drops chunks
+        whose text is already included. Blocks are ordered by their
+        best-ranked chunk. Returns the blocks and the number of chunks
+        merged or dropped.
+        """
+        positions = [chunk_position(metadata) for metadata in metadatas]
+        # Chunks of each document in document order, with their ranks
+        by_source: Dict[str, List[Tuple[int, int, str]]] = {}
+        loose: List[Tuple[int, str]] = []
+        for rank, (position, text) in enumerate(zip(positions, documents)):
+            if position is None:
+                loose.append((rank, text))
+            else:
+                by_source.setdefault(position[0], []).append((position[1], rank, text))
+        ranked: List[Tuple[int, str]] = list(loose)
+        for chunks in by_source.values():
+            chunks.sort()
+            index, rank, text = chunks[0]
+            for next_index, next_rank, next_text in chunks[1:]:
+                if next_index == index + 1:
+                    text = merge_overlapping(text, next_text) or f"{text}\n{next_text}"
+                    rank = min(rank, next_rank)
+                else:
+                    ranked.append((rank, text))
+                    rank, text = next_rank, next_text
+                index = next_index
+            ranked.append((rank, text))
+        ranked.sort(key=lambda item: item[0])
+        blocks: List[str] = []
+        seen: List[str] = []
+        for _, text in ranked:
+            normalized = _normalized(text)
+            if any(normalized in other for other in seen):
+                continue
+            blocks.append(text)
+            seen.append(normalized)
+        return blocks, len(documents) - len(blocks)
+
+    def build(
+        self,
+        conversation: List[Dict[str, str]],
+        documents: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+    ) -> Prompt:
+        """
+        Returns the messages to send for conversation with the retrieved
+        chunks as a system message, and their token counts.
+        """
+        blocks, merged = self.blocks(documents, metadatas)
+        context: List[str] = []
+        context_tokens = self.count(CONTEXT_HEADER) + MESSAGE_OVERHEAD_TOKENS
+        dropped = 0
+        for block in blocks:
+            tokens = self.count(block) + 1
+            if context_tokens + tokens <= self.context_max_tokens:
+                context.append(block)
+                context_tokens += tokens
+            elif not context:
+                # The best block alone is over budget: send its beginning
+                block = self._truncate(block, self.context_max_tokens - context_tokens - 1)
+                context.append(block)
+                context_tokens += self.count(block) + 1
+            else:
+                dropped += 1
+
+        latest, older = conversation[-1:], conversation[:-1]
+        history: List[Dict[str, str]] = []
+        history_tokens = 0
+        for message in reversed(older):
+            tokens = self.count(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+            if history_tokens + tokens <= self.history_max_tokens:
+                history.append(message)
+                history_tokens += tokens
+                continue
+            room = self.history_max_tokens - history_tokens - MESSAGE_OVERHEAD_TOKENS
+            if room >= MIN_TRUNCATED_TURN_TOKENS:
+                # Keep the end of the turn, which is closest to the question
+                content = self._truncate(message.get("content", ""), room, keep_end=True)
+                history.append({**message, "content": content})
+                history_tokens += self.count(content) + MESSAGE_OVERHEAD_TOKENS
+            break
+        history.reverse()
+        turns_dropped = len(older) - len(history)
+
+        messages = history + latest
+        latest_tokens = sum(self.count(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in latest)
+        if context:
+            messages = [{"role": "system", "content": CONTEXT_HEADER + "\n\n".join(context)}] + messages
+        else:
+            context_tokens = 0
+        prompt_tokens = context_tokens + history_tokens + latest_tokens
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+            self.chunks_merged += merged
+            self.chunks_dropped += dropped
+            self.turns_dropped += turns_dropped
+        return Prompt(messages, prompt_tokens, context_tokens, history_tokens,
+                      len(context), turns_dropped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "context_max_tokens": self.context_max_tokens,
+                "history_max_tokens": self.history_max_tokens,
+                "requests": self.requests,
+                "mean_prompt_tokens": self.prompt_tokens / self.requests if self.requests else 0.0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "chunks_merged": self.chunks_merged,
+                "chunks_dropped": self.chunks_dropped,
+                "turns_dropped": self.turns_dropped,
+            }
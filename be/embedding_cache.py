@@ -0,0 +1,222 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case-folds and collapses whitespace so trivially different spellings of
+    the same question share a cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embedding vectors keyed on (model, normalized text).
+
+    Vectors are stored as packed float32 bytes. The in-memory tier is bounded
+    by a byte budget and entries expire after ttl_seconds. When persist_path
+    is set, entries are also written to a SQLite file and reloaded from it
+    on a memory miss, so the cache survives restarts. SQLite is only used
+    from one background thread: lookups that miss memory await it, and
+    writes are queued and committed there in batches, so neither blocks
+    the event loop.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        persist_path: Optional[str] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.evictions = 0
+        self._db = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Rows waiting for the background thread to commit them
+        self._unwritten: List[Tuple[str, str, bytes, float]] = []
+        self._write_scheduled = False
+        self.commits = 0
+        if persist_path:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, "
+                "vector BLOB NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            self._db.execute(
+                "DELETE FROM embeddings WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    @staticmethod
+    def _size(key: Tuple[str, str], blob: bytes) -> int:
+        # Encoded length: non-ASCII text takes more than one byte per character
+        return len(blob) + len(key[1].encode("utf-8"))
+
+    def _store(self, key: Tuple[str, str], blob: bytes, expires_at: float):
+        size = self._size(key, blob)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= self._size(key, old[0])
+        self._entries[key] = (blob, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            evicted_key, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted_key, evicted)
+            self.evictions += 1
+
+    def _lookup_memory(self, key: Tuple[str, str], now: float) -> Optional[bytes]:
+        """
+        Called with the lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        blob, expires_at = entry
+        if expires_at > now:
+            self._entries.move_to_end(key)
+            return blob
+        del self._entries[key]
+        self._bytes -= self._size(key, blob)
+        return None
+
+    def _read(self, keys: List[Tuple[str, str]]) -> List[Optional[Tuple[bytes, float]]]:
+        """
+        Reads keys from SQLite. Runs on the background thread.
+        """
+        if self._db is None:
+            return [None] * len(keys)
+        return [
+            self._db.execute(
+                "SELECT vector, expires_at FROM embeddings WHERE model = ? AND text = ?", key,
+            ).fetchone()
+            for key in keys
+        ]
+
+    def _write(self):
+        """
+        Commits every queued row in one transaction. Runs on the background thread.
+        """
+        with self._lock:
+            rows, self._unwritten = self._unwritten, []
+            self._write_scheduled = False
+        if rows and self._db is not None:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector, expires_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+            self.commits += 1
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        return (await self.get_many(model, [text]))[0]
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns the cached vector (or None) for each text. Texts missing
+        from memory are looked up in SQLite in one call to its thread.
+        """
+        keys = [(model, normalize_text(text)) for text in texts]
+        now = time.time()
+        blobs: List[Optional[bytes]] = []
+        with self._lock:
+            for key in keys:
+                blobs.append(self._lookup_memory(key, now))
+        missing = [i for i, blob in enumerate(blobs) if blob is None]
+        if missing and self._executor is not None:
+            rows = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._read, [keys[i] for i in missing])
+            with self._lock:
+                for i, row in zip(missing, rows):
+                    if row is not None and row[1] > now:
+                        self._store(keys[i], row[0], row[1])
+                        blobs[i] = row[0]
+                        self.persistent_hits += 1
+        with self._lock:
+            found = sum(1 for blob in blobs if blob is not None)
+            self.hits += found
+            self.misses += len(blobs) - found
+        return [self._decode(blob) if blob is not None else None for blob in blobs]
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """
+        Stores vectors in memory at once; with persistence, they are
+        queued for the background thread, which commits everything queued
+        by then in one transaction.
+        """
+        expires_at = time.time() + self.ttl_seconds
+        rows = [
+            (model, normalize_text(text), self._encode(vector), expires_at)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            for row in rows:
+                self._store((row[0], row[1]), row[2], expires_at)
+            if self._executor is None:
+                return
+            self._unwritten.extend(rows)
+            if self._write_scheduled:
+                return
+            self._write_scheduled = True
+        self._executor.submit(self._write)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "unwritten": len(self._unwritten),
+                "commits": self.commits,
+            }
+
+    def close(self):
+        """
+        Commits queued writes and closes the SQLite file.
+        """
+        if self._executor is None:
+            return
+        self._executor.submit(self._write)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._db.close()
+        self._db = None
@@ -0,0 +1,126 @@
+import asyncio
+import random
+from typing import List, Optional
+import litellm
+from llm import Embeddings
+from tokens import count_tokens
+from config import (
+    EMBED_CONCURRENCY,
+    EMBED_BATCH_MAX_TOKENS,
+    EMBED_BATCH_MAX_ITEMS,
+    EMBED_MAX_RETRIES,
+    EMBED_RETRY_BASE_SECONDS,
+    EMBED_RETRY_MAX_SECONDS,
+)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True for rate limits, server errors and dropped connections.
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    return isinstance(error, (litellm.APIConnectionError, litellm.Timeout))
+
+
+class BatchEmbedder:
+    """
+    Embeds large lists of texts during ingestion.
+
+    Texts are packed into batches by token count, up to `concurrency` batches
+    are in flight at once, and batches rejected with 429/5xx are retried with
+    jittered exponential backoff. Results are returned in input order.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_batch_tokens: int = EMBED_BATCH_MAX_TOKENS,
+        max_batch_items: int = EMBED_BATCH_MAX_ITEMS,
+        max_retries: int = EMBED_MAX_RETRIES,
+        retry_base_seconds: float = EMBED_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = EMBED_RETRY_MAX_SECONDS,
+    ):
+        self.embeddings = embeddings
+        self.concurrency = concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.requests = 0
+        self.retries = 0
+        # Created on first use so it binds to the running loop; shared by
+        # concurrent embed() calls so the cap holds across documents
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def plan_batches(self, texts: List[str], indices: Optional[List[int]] = None) -> List[List[int]]:
+        """
+        Greedily groups text indices into batches that stay under the token
+        and item limits. A text larger than the token limit gets its own batch.
+        """
+        if indices is None:
+            indices = list(range(len(texts)))
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for i in indices:
+            tokens = count_tokens(texts[i], self.embeddings.model)
+            if current and (
+                current_tokens + tokens > self.max_batch_tokens
+                or len(current) >= self.max_batch_items
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_with_retry(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                return await self.embeddings.embed_uncached(batch)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.retry_max_seconds,
+                            self.retry_base_seconds * 2 ** attempt)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Returns one embedding vector per text, in the same order as texts.
+        Cached vectors are reused and only the rest are sent to the provider.
+        """
+        results, missing = await self.embeddings.lookup_cached(texts)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        semaphore = self._semaphore
+
+        async def run(indices: List[int]):
+            batch = [texts[i] for i in indices]
+            async with semaphore:
+                vectors = await self._embed_with_retry(batch)
+            for i, vector in zip(indices, vectors):
+                results[i] = vector
+            self.embeddings.store_cached(batch, vectors)
+
+        tasks = [asyncio.ensure_future(run(indices))
+                 for indices in self.plan_batches(texts, missing)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return results
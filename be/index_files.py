@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Names the generation directory holding an index's current files
+CURRENT_FILENAME = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+
+class StringColumn:
+    """
+    Read-only strings stored as one UTF-8 blob plus int64 offsets, both
+    memory-mapped, so loading costs nothing until a row is read.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, prefix: str) -> "StringColumn":
+        return cls(
+            np.load(f"{prefix}.bin.npy", mmap_mode="r"),
+            np.load(f"{prefix}.offsets.npy", mmap_mode="r"),
+        )
+
+    @staticmethod
+    def save(prefix: str, values: Sequence[str]):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        np.save(f"{prefix}.bin.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(f"{prefix}.offsets.npy", offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self) -> List[str]:
+        """
+        Decodes every row; much faster than indexing row by row.
+        """
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+def as_list(values: Sequence[str]) -> List[str]:
+    return values.tolist() if isinstance(values, StringColumn) else values
+
+
+def matches(metadata: Optional[Dict[str, Any]], where: Dict[str, Any]) -> bool:
+    """
+    Evaluates the subset of Chroma's where syntax the in-process indexes
+    support: equality, $eq, $ne, $in, $nin, $and and $or.
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op not in ("$eq", "$ne", "$in", "$nin"):
+                    raise ValueError(f"Unsupported where operator: {op}")
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class MaskCache:
+    """
+    Boolean row masks of where filters over one immutable snapshot's
+    metadata, computed once per distinct filter.
+    """
+
+    def __init__(self, metadatas: Sequence[Optional[Dict[str, Any]]]):
+        self.metadatas = metadatas
+        self._masks: Dict[str, np.ndarray] = {}
+
+    def mask(self, where: Dict[str, Any]) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((matches(m, where) for m in self.metadatas),
+                               dtype=bool, count=len(self.metadatas))
+            self._masks[key] = mask
+        return mask
+
+
+def current_generation(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILENAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def new_generation(directory: str) -> Tuple[str, str]:
+    """
+    Creates an empty generation directory and returns its name and path.
+    """
+    generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+    path = os.path.join(directory, generation)
+    os.makedirs(path)
+    return generation, path
+
+
+def publish_generation(directory: str, generation: str):
+    """
+    Points CURRENT at a fully written generation, then removes older ones.
+    Readers switch atomically and never see a partial index.
+    """
+    current = os.path.join(directory, CURRENT_FILENAME)
+    with open(f"{current}.tmp", "w") as f:
+        f.write(generation)
+    os.replace(f"{current}.tmp", current)
+    # Open mappings of older generations stay valid after removal
+    for name in os.listdir(directory):
+        if name.startswith(GENERATION_PREFIX) and name != generation:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from rag import RAG
+from chunking import Chunk, chunker_for, chunker_settings
+from manifest import IngestManifest, ChunkIds
+from pdf_extract import count_pages, extract_page_range
+from config import INGEST_PAGES_PER_TASK, INGEST_SEGMENT_CHUNKS
+
+
+class IngestReport:
+    """
+    Per-stage busy time of a parallel ingestion run. Stages overlap, so the
+    stage times can add up to more than the wall-clock total.
+    """
+
+    STAGES = ("parse", "chunk", "embed", "write")
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {stage: 0.0 for stage in self.STAGES}
+        self.documents = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.embedded = 0
+        self.deleted = 0
+        self.total_seconds = 0.0
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<8} {'busy seconds':>12}"]
+        for stage in self.STAGES:
+            lines.append(f"{stage:<8} {self.seconds[stage]:>12.2f}")
+        rate = self.chunks / self.total_seconds if self.total_seconds else 0.0
+        lines.append(
+            f"{self.documents} documents, {self.chunks} chunks in "
+            f"{self.total_seconds:.2f}s ({rate:.1f} chunks/s)")
+        lines.append(
+            f"{self.skipped} unchanged documents skipped, {self.embedded} chunks "
+            f"embedded, {self.deleted} stale chunks deleted")
+        return "\n".join(lines)
+
+
+class IngestItem:
+    """
+    A run of consecutive chunks from one document moving through the
+    pipeline; only chunks that still need embedding are carried, plus
+    stored chunks whose position in the document changed. The last
+    segment of a document has `total_segments` set, together with the ids
+    and hashes of every chunk in the document and the ids that went stale.
+    """
+
+    def __init__(self, pdf_path: str, file_hash: Optional[str], chunks: List[Chunk], ids: List[str],
+                 indexes: List[int]):
+        self.pdf_path = pdf_path
+        self.file_hash = file_hash
+        self.chunks = chunks
+        self.ids = ids
+        self.indexes = indexes
+        self.vectors: List[List[float]] = []
+        self.moved_chunks: List[Chunk] = []
+        self.moved_ids: List[str] = []
+        self.moved_indexes: List[int] = []
+        self.total_segments: Optional[int] = None
+        self.all_ids: List[str] = []
+        self.all_hashes: List[str] = []
+        self.stale_ids: List[str] = []
+
+
+async def ingest_pdfs_parallel(
+    rag: RAG,
+    pdf_paths: List[str],
+    workers: int,
+    pages_per_task: int = INGEST_PAGES_PER_TASK,
+    manifest: Optional[IngestManifest] = None,
+    segment_size: int = INGEST_SEGMENT_CHUNKS,
+) -> IngestReport:
+    """
+    Ingests pdf_paths as a three-stage pipeline:
+
+    1. parse: page ranges are extracted in a pool of `workers` processes and
+       streamed, in page order, through the chunking strategy configured
+       for the document type;
+    2. embed: segments of up to segment_size chunks are embedded by
+       rag.batch_embedder, several at a time within its concurrency limit;
+    3. write: a single writer adds the embedded chunks to the vector store.
+
+    Bounded queues between the stages keep memory flat on large corpora.
+
+    With a manifest, unchanged files (chunked with the same strategy and
+    parameters) are skipped before parsing, only chunks
+    whose content is new are embedded, chunks that disappeared from a
+    document are deleted, and documents no longer in pdf_paths are removed.
+    The manifest is saved after every document so an interrupted run resumes.
+    """
+    loop = asyncio.get_running_loop()
+    report = IngestReport()
+    started = time.perf_counter()
+    chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    embed_slots = asyncio.Semaphore(max(2, rag.batch_embedder.concurrency))
+
+    if manifest is not None:
+        present = {os.path.basename(pdf_path) for pdf_path in pdf_paths}
+        for document in [d for d in manifest.documents if d not in present]:
+            stale_ids = manifest.forget(document)
+            if stale_ids:
+                await rag.delete_chunks(stale_ids)
+            report.deleted += len(stale_ids)
+            print(f"Removed {document} ({len(stale_ids)} chunks)")
+        await rag.flush()
+        manifest.save()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        async def parse(pdf_path: str):
+            file_hash = None
+            if manifest is not None:
+                unchanged, file_hash = await loop.run_in_executor(
+                    None, manifest.is_unchanged, pdf_path, chunker_settings(pdf_path))
+                if unchanged:
+                    report.skipped += 1
+                    return
+            known = manifest.known_positions(pdf_path) if manifest else {}
+            assigner = ChunkIds(os.path.basename(pdf_path))
+            chunker = chunker_for(pdf_path)
+            all_ids: List[str] = []
+            all_hashes: List[str] = []
+            segments = 0
+
+            def make_item(chunks: List[Chunk]) -> IngestItem:
+                nonlocal segments
+                segments += 1
+                ids, hashes = assigner.assign([chunk.text for chunk in chunks])
+                indexes = list(range(len(all_ids), len(all_ids) + len(ids)))
+                all_ids.extend(ids)
+                all_hashes.extend(hashes)
+                new = [i for i, id_ in enumerate(ids) if id_ not in known]
+                item = IngestItem(pdf_path, file_hash, [chunks[i] for i in new],
+                                  [ids[i] for i in new], [indexes[i] for i in new])
+                # Stored chunks that now sit elsewhere in the document
+                moved = [i for i, id_ in enumerate(ids) if id_ in known and known[id_] != indexes[i]]
+                item.moved_chunks = [chunks[i] for i in moved]
+                item.moved_ids = [ids[i] for i in moved]
+                item.moved_indexes = [indexes[i] for i in moved]
+                return item
+
+            pages = await loop.run_in_executor(pool, count_pages, pdf_path)
+            # All ranges are submitted at once and consumed in page order
+            ranges = [
+                loop.run_in_executor(pool, extract_page_range, pdf_path, start,
+                                     min(start + pages_per_task, pages))
+                for start in range(0, pages, pages_per_task)
+            ]
+            segment: List[Chunk] = []
+            for pending in ranges:
+                page_texts, seconds = await pending
+                report.add("parse", seconds)
+                began = time.perf_counter()
+                for page_number, text in page_texts:
+                    segment.extend(chunker.feed(page_number, text))
+                report.add("chunk", time.perf_counter() - began)
+                while len(segment) >= segment_size:
+                    await chunk_queue.put(make_item(segment[:segment_size]))
+                    segment = segment[segment_size:]
+            segment.extend(chunker.finish())
+            last = make_item(segment)
+            last.total_segments = segments
+            last.all_ids, last.all_hashes = all_ids, all_hashes
+            last.stale_ids = sorted(set(known) - set(all_ids))
+            await chunk_queue.put(last)
+
+        async def parse_all():
+            await asyncio.gather(*(parse(pdf_path) for pdf_path in pdf_paths))
+            await chunk_queue.put(None)
+
+        async def embed(item: IngestItem):
+            try:
+                began = time.perf_counter()
+                item.vectors = await rag.batch_embedder.embed(
+                    [chunk.text for chunk in item.chunks])
+                report.add("embed", time.perf_counter() - began)
+                await write_queue.put(item)
+            finally:
+                embed_slots.release()
+
+        async def embed_all():
+            tasks = []
+            while True:
+                item = await chunk_queue.get()
+                if item is None:
+                    break
+                await embed_slots.acquire()
+                tasks.append(asyncio.ensure_future(embed(item)))
+            await asyncio.gather(*tasks)
+            await write_queue.put(None)
+
+        async def write_all():
+            # Segments of one document can finish embedding out of order; a
+            # document is only recorded once all of its segments are written
+            written: Dict[str, int] = {}
+            finals: Dict[str, IngestItem] = {}
+            while True:
+                item = await write_queue.get()
+                if item is None:
+                    break
+                began = time.perf_counter()
+                if item.pdf_path not in written:
+                    written[item.pdf_path] = 0
+                    if manifest is not None and not manifest.is_tracked(item.pdf_path):
+                        # Chunks written before the manifest existed use positional ids
+                        await rag.delete_source(item.pdf_path)
+                if item.chunks:
+                    await rag.add_chunks(item.pdf_path, item.chunks,
+                                         item.vectors, item.ids, item.indexes)
+                if item.moved_ids:
+                    await rag.move_chunks(item.pdf_path, item.moved_chunks,
+                                          item.moved_ids, item.moved_indexes)
+                written[item.pdf_path] += 1
+                report.embedded += len(item.chunks)
+                if item.total_segments is not None:
+                    finals[item.pdf_path] = item
+                final = finals.get(item.pdf_path)
+                if final is not None and written[item.pdf_path] == final.total_segments:
+                    if final.stale_ids:
+                        await rag.delete_chunks(final.stale_ids)
+                    if manifest is not None:
+                        # The manifest may only name chunks the store has made durable
+                        await rag.flush()
+                        manifest.record(final.pdf_path, final.file_hash, chunker_settings(final.pdf_path),
+                                        final.all_ids, final.all_hashes)
+                        manifest.save()
+                    report.documents += 1
+                    report.chunks += len(final.all_ids)
+                    report.deleted += len(final.stale_ids)
+                    del finals[item.pdf_path]
+                    print(
+                        f"Done ingesting {os.path.basename(final.pdf_path)} "
+                        f"({len(final.all_ids)} chunks, {len(final.stale_ids)} stale)")
+                report.add("write", time.perf_counter() - began)
+
+        await asyncio.gather(parse_all(), embed_all(), write_all())
+
+    await rag.flush()
+    if manifest is not None:
+        # Persists mtimes refreshed for files whose content did not change
+        manifest.save()
+    report.total_seconds = time.perf_counter() - started
+    return report
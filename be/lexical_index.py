@@ -0,0 +1,368 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from executor import BoundedExecutor
+from metrics import timed
+from index_files import MaskCache, StringColumn, as_list, matches, current_generation, new_generation, publish_generation
+from vector_store import VERSION_CHECK_SECONDS
+
+logger = logging.getLogger("uvicorn.error")
+
+# Model numbers and codes such as "wh-1000xm5", "ip67" or "3.5mm" stay whole
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+SEPARATOR_RE = re.compile(r"[-./]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or "
+    "the this to what when where which with you your".split()
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+LEXICAL_EXECUTOR_WORKERS = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms without stopwords. A term with separators is also
+    indexed joined ("wh1000xm5") and split ("wh", "1000xm5"), so queries
+    match however the user writes it.
+    """
+    terms = []
+    for term in TOKEN_RE.findall(text.casefold()):
+        if term in STOPWORDS:
+            continue
+        terms.append(term)
+        parts = SEPARATOR_RE.split(term)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+            terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+
+class _Postings:
+    """
+    Immutable snapshot of the index: one row per chunk, and for every term
+    (sorted) a slice of term_offsets into the parallel rows/freqs arrays.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Sequence[str],
+        lengths: np.ndarray,
+        terms: Sequence[str],
+        term_offsets: np.ndarray,
+        rows: np.ndarray,
+        freqs: np.ndarray,
+    ):
+        self.ids = ids
+        self.documents = documents
+        # Metadata rows are kept as JSON and parsed on demand
+        self.metadatas = metadatas
+        self.lengths = lengths
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.rows = rows
+        self.freqs = freqs
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+        self._masks: Optional[MaskCache] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def parsed_metadatas(self) -> List[Optional[Dict[str, Any]]]:
+        if self._masks is None:
+            self._masks = MaskCache([json.loads(m) for m in self.metadatas])
+        return self._masks.metadatas
+
+    def mask(self, where: Dict[str, Any]) -> np.ndarray:
+        self.parsed_metadatas()
+        return self._masks.mask(where)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.term_offsets[i], self.term_offsets[i + 1]
+        return self.rows[start:end], self.freqs[start:end]
+
+
+def _kept(values: List[str], rows: np.ndarray) -> List[str]:
+    return values if len(rows) == len(values) else [values[row] for row in rows.tolist()]
+
+
+def _empty_postings() -> _Postings:
+    return _Postings([], [], [], np.zeros(0, dtype=np.int32), [],
+                     np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                     np.zeros(0, dtype=np.uint16))
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 index over the same chunks as the vector store.
+
+    Postings are compressed-sparse arrays that are memory-mapped on load.
+    Like NumpyVectorStore, writes are buffered and merged into a new
+    snapshot on the next query or flush, and flush() publishes a new
+    generation directory that other processes pick up.
+    """
+
+    def __init__(self, directory: str, max_workers: int = LEXICAL_EXECUTOR_WORKERS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.executor = BoundedExecutor(max_workers, thread_name_prefix="lexical")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[Counter, str, str]] = {}
+        self._removed: set = set()
+        self._dirty = False
+        self._checked = time.monotonic()
+        self._postings = self._load()
+
+    def _load(self) -> _Postings:
+        self._generation = current_generation(self.directory)
+        if self._generation is None:
+            return _empty_postings()
+        path = os.path.join(self.directory, self._generation)
+
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        return _Postings(
+            StringColumn.load(os.path.join(path, "ids")),
+            StringColumn.load(os.path.join(path, "documents")),
+            StringColumn.load(os.path.join(path, "metadatas")),
+            array("lengths"),
+            StringColumn.load(os.path.join(path, "terms")),
+            array("term_offsets"),
+            array("rows"),
+            array("freqs"),
+        )
+
+    def _compact(self) -> _Postings:
+        """
+        Merges buffered writes into a new snapshot. Called with the lock held.
+        """
+        old = self._postings
+        if not self._pending and not self._removed:
+            return old
+        old_ids, old_terms = as_list(old.ids), as_list(old.terms)
+        keep = np.fromiter((id not in self._removed for id in old_ids), dtype=bool, count=len(old))
+        new_row = np.cumsum(keep) - 1
+        kept_rows = np.flatnonzero(keep)
+        pending = list(self._pending.items())
+
+        vocabulary = sorted(set(old_terms).union(*(counts for _, (counts, _, _) in pending)))
+        position = {term: i for i, term in enumerate(vocabulary)}
+        term_ids = np.array([position[term] for term in old_terms], dtype=np.int64)
+        posting_terms = np.repeat(term_ids, np.diff(old.term_offsets))
+        live = keep[old.rows] if len(old.rows) else np.zeros(0, dtype=bool)
+        term_parts = [posting_terms[live]]
+        row_parts = [new_row[old.rows[live]]]
+        freq_parts = [np.asarray(old.freqs[live])]
+        for j, (_, (counts, _, _)) in enumerate(pending):
+            term_parts.append(np.array([position[term] for term in counts], dtype=np.int64))
+            row_parts.append(np.full(len(counts), len(kept_rows) + j, dtype=np.int64))
+            freq_parts.append(np.array(list(counts.values()), dtype=np.uint16))
+        terms = np.concatenate(term_parts)
+        rows = np.concatenate(row_parts)
+        freqs = np.concatenate(freq_parts)
+        order = np.lexsort((rows, terms))
+        terms, rows, freqs = terms[order], rows[order], freqs[order]
+
+        # Terms whose every chunk was deleted are dropped from the vocabulary
+        df = np.bincount(terms, minlength=len(vocabulary))
+        used = df > 0
+        term_offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        np.cumsum(df[used], out=term_offsets[1:])
+        self._postings = _Postings(
+            _kept(old_ids, kept_rows) + [id for id, _ in pending],
+            _kept(as_list(old.documents), kept_rows) + [doc for _, (_, doc, _) in pending],
+            _kept(as_list(old.metadatas), kept_rows) + [metadata for _, (_, _, metadata) in pending],
+            np.concatenate([
+                np.asarray(old.lengths[keep], dtype=np.int32),
+                np.array([sum(counts.values()) for _, (counts, _, _) in pending], dtype=np.int32),
+            ]),
+            [term for term, is_used in zip(vocabulary, used) if is_used],
+            term_offsets,
+            rows.astype(np.int32),
+            freqs,
+        )
+        self._pending = {}
+        self._removed = set()
+        return self._postings
+
+    def _snapshot(self) -> _Postings:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= VERSION_CHECK_SECONDS:
+                self._checked = now
+                # Another process flushed a newer index; reload unless this
+                # one has writes of its own that are not on disk yet
+                if not self._dirty and current_generation(self.directory) != self._generation:
+                    self._postings = self._load()
+            return self._compact()
+
+    def warm(self):
+        postings = self._snapshot()
+        for array in (postings.lengths, postings.term_offsets, postings.rows, postings.freqs):
+            np.asarray(array).sum()
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        with self._lock:
+            for i, (id, document) in enumerate(zip(ids, documents)):
+                counts = Counter(tokenize(document))
+                self._removed.add(id)
+                self._pending[id] = (counts, document, json.dumps(metadatas[i] if metadatas else None))
+            self._dirty = True
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """
+        Deletes the given ids, or the chunks whose metadata matches where
+        (restricted to ids when both are given), as Chroma does.
+        """
+        with self._lock:
+            if where is None:
+                targets = set(ids or [])
+            else:
+                postings = self._postings
+                targets = {
+                    id for id, metadata in zip(postings.ids, postings.parsed_metadatas())
+                    if id not in self._removed and matches(metadata, where)
+                }
+                targets.update(
+                    id for id, (_, _, metadata) in self._pending.items()
+                    if matches(json.loads(metadata), where))
+                if ids is not None:
+                    targets &= set(ids)
+            for id in targets:
+                self._removed.add(id)
+                self._pending.pop(id, None)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._postings = _empty_postings()
+            self._pending = {}
+            self._removed = set()
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            postings = self._compact()
+            generation, path = new_generation(self.directory)
+            StringColumn.save(os.path.join(path, "ids"), postings.ids)
+            StringColumn.save(os.path.join(path, "documents"), postings.documents)
+            StringColumn.save(os.path.join(path, "metadatas"), postings.metadatas)
+            StringColumn.save(os.path.join(path, "terms"), postings.terms)
+            np.save(os.path.join(path, "lengths.npy"), postings.lengths)
+            np.save(os.path.join(path, "term_offsets.npy"), postings.term_offsets)
+            np.save(os.path.join(path, "rows.npy"), postings.rows)
+            np.save(os.path.join(path, "freqs.npy"), postings.freqs)
+            publish_generation(self.directory, generation)
+            self._generation = generation
+            self._dirty = False
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.flush()
+
+    def count(self) -> int:
+        return len(self._snapshot())
+
+    def query(
+        self,
+        query: str,
+        n_results: int = 4,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[str], List[str], List[Optional[Dict[str, Any]]]]:
+        """
+        Returns the ids, documents and metadatas of the n_results best BM25 matches
+        among the chunks matching where; chunks sharing no term with query
+        are never returned.
+        """
+        postings = self._snapshot()
+        total = len(postings)
+        scores = np.zeros(total, dtype=np.float32)
+        for term in set(tokenize(query)):
+            found = postings.postings(term)
+            if found is None:
+                continue
+            rows, freqs = found
+            df = len(rows)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            tf = freqs.astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * postings.lengths[rows] / postings.average_length)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if where and total:
+            scores[~postings.mask(where)] = 0.0
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return [], [], []
+        n = min(n_results, len(matched))
+        top = matched[np.argpartition(-scores[matched], n - 1)[:n]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return ([postings.ids[row] for row in top], [postings.documents[row] for row in top],
+                [json.loads(postings.metadatas[row]) for row in top])
+
+    async def aupsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        await self.executor.run(self.upsert, ids, documents, metadatas)
+
+    async def adelete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        await self.executor.run(self.delete, ids=ids, where=where)
+
+    async def aflush(self):
+        await self.executor.run(self.flush)
+
+    @timed("lexical_query")
+    async def aquery(
+        self,
+        query: str,
+        n_results: int = 4,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[str], List[str], List[Optional[Dict[str, Any]]]]:
+        return await self.executor.run(self.query, query, n_results, where)
+
+    def stats(self) -> Dict[str, Any]:
+        postings = self._postings
+        return {
+            "chunks": len(postings),
+            "terms": len(postings.terms),
+            "postings": len(postings.rows),
+            "executor": self.executor.stats(),
+        }
+
+
+def open_built_index(directory: str) -> Optional[LexicalIndex]:
+    """
+    The index in directory if one has been built with chunks in it, else
+    None (logged once), so retrieval does not pay for hybrid search over
+    an empty index.
+    """
+    if current_generation(directory) is not None:
+        index = LexicalIndex(directory)
+        if index.count():
+            return index
+        index.close()
+    logger.warning("No lexical index built in %s; hybrid retrieval is off until one is "
+                   "built with admin_utils/build_lexical_index.py and the server restarted", directory)
+    return None
@@ -1,54 +1,136 @@
 import litellm
-from typing import AsyncGenerator, List
+from typing import AsyncGenerator, List, Optional, Tuple
+from embedding_cache import EmbeddingCache
+from admission import TokenBucket
+from metrics import timed, timed_stream
+from config import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
 
 
 class Embeddings:
-    def __init__(self, model: str = "text-embedding-3-small"):
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        cache: Optional[EmbeddingCache] = None,
+        rate_limit: Optional[TokenBucket] = None,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+    ):
         self.model = model
+        self.cache = cache
+        self.rate_limit = rate_limit
+        # 0 = the model's full size; text-embedding-3 models return the
+        # leading dimensions of the full vector, renormalised
+        self.dimensions = dimensions
+        # Vectors of different sizes must not share cache entries
+        self.cache_key = f"{model}:{dimensions}" if dimensions else model
 
-    async def embed(self, text: str) -> List[float]:
+    @timed("embedding_request")
+    async def embed_uncached(self, texts: List[str]) -> List[List[float]]:
         """
-        Returns the embedding vector for a single string.
+        Sends one embedding request for texts, bypassing the cache.
         """
+        if self.rate_limit is not None:
+            await self.rate_limit.acquire()
         # litellm.aembedding returns a dict with 'data' key containing embeddings
+        options = {"dimensions": self.dimensions} if self.dimensions else {}
         result = await litellm.aembedding(
             model=self.model,
-            input=[text]
+            input=texts,
+            **options,
         )
-        return result["data"][0]["embedding"]
+        items = sorted(result["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in items]
+
+    async def lookup_cached(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], List[int]]:
+        """
+        Returns the cached vector (or None) for each text, and the indices
+        of the texts that still have to be embedded.
+        """
+        if self.cache is None:
+            return [None] * len(texts), list(range(len(texts)))
+        vectors = await self.cache.get_many(self.cache_key, texts)
+        return vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def store_cached(self, texts: List[str], vectors: List[List[float]]):
+        if self.cache is not None:
+            self.cache.put_many(self.cache_key, texts, vectors)
+
+    async def warm(self):
+        """
+        Runs litellm's embedding path once with a mock response, so its
+        lazy imports happen at startup rather than in the first request.
+        """
+        await litellm.aembedding(model=self.model, input=["warm"], mock_response=[0.0])
+
+    @timed("embed")
+    async def embed(self, text: str) -> List[float]:
+        """
+        Returns the embedding vector for a single string.
+        """
+        if self.cache is not None:
+            cached = await self.cache.get(self.cache_key, text)
+            if cached is not None:
+                return cached
+        vector = (await self.embed_uncached([text]))[0]
+        if self.cache is not None:
+            self.cache.put(self.cache_key, text, vector)
+        return vector
 
     async def embed_batch(self, texts: List[str], batch_size: int = 16) -> List[List[float]]:
         """
         Returns a list of embedding vectors for a list of strings.
         Processes texts in batches to avoid API limits.
+        Only texts missing from the cache are sent to the provider.
         """
-        all_embeddings = []
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i: i + batch_size]
-            result = await litellm.aembedding(
-                model=self.model,
-                input=batch
-            )
-            all_embeddings.extend([item["embedding"]
-                                  for item in result["data"]])
+        all_embeddings, missing = await self.lookup_cached(texts)
+        for i in range(0, len(missing), batch_size):
+            indices = missing[i: i + batch_size]
+            batch = [texts[j] for j in indices]
+            vectors = await self.embed_uncached(batch)
+            for j, vector in zip(indices, vectors):
+                all_embeddings[j] = vector
+            self.store_cached(batch, vectors)
         return all_embeddings
 
 
 class LLM:
-    def __init__(self, model: str = "gpt-4.1"):
+    def __init__(self, model: str = "gpt-4.1", rate_limit: Optional[TokenBucket] = None):
         self.model = model
+        self.rate_limit = rate_limit
 
-    async def generate(self, messages: list[dict]) -> AsyncGenerator[str, None]:
+    async def warm(self):
         """
-        Streams output from the LLM as it is generated.
+        Streams one mock completion through litellm and imports the OpenAI
+        client's resources, which together take about a second the first
+        time and would otherwise delay the first answer.
         """
-        # messages: list of {"role": "user"|"assistant", "content": str}
+        import openai.resources  # noqa: F401
         result = await litellm.acompletion(
             model=self.model,
+            messages=[{"role": "user", "content": "warm"}],
+            stream=True,
+            mock_response="ok",
+        )
+        async for _ in result:
+            pass
+
+    @timed_stream("llm_generate")
+    async def generate(self, messages: list[dict], model: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Streams output from the LLM (or the named model) as it is generated.
+        """
+        # messages: list of {"role": "user"|"assistant", "content": str}
+        if self.rate_limit is not None:
+            await self.rate_limit.acquire()
+        result = await litellm.acompletion(
+            model=model or self.model,
             messages=messages,
             stream=True,
         )
-        async for chunk in result:
-            delta = chunk["choices"][0]["delta"].get("content", "")
-            if delta:
-                yield delta
+        try:
+            async for chunk in result:
+                delta = chunk["choices"][0]["delta"].get("content", "")
+                if delta:
+                    yield delta
+        finally:
+            # Closes the HTTP response at once when the reader stops early
+            await result.aclose()
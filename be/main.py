@@ -1,55 +1,272 @@
-from fastapi import FastAPI
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Request
-from fastapi.responses import StreamingResponse
-from llm import LLM, Embeddings
-from chromadb_client import ChromaDbClient
-from rag import RAG
+from fastapi.responses import PlainTextResponse
+from typing import AsyncIterator, Dict, Optional
+from model_router import ModelRouter
+from rag import RAG, Retrieval
+from components import Components
+from response_cache import SemanticResponseCache
+from context_budget import ContextBudget
+from admission import AdmissionMiddleware
+from metrics import REGISTRY, MetricsMiddleware, current_trace_id
+from sse import SSEWriter, sse_data, sse_event
+from config import RETRIEVAL_TIMEOUT_SECONDS, LLM_FIRST_TOKEN_TIMEOUT_SECONDS, LLM_IDLE_TIMEOUT_SECONDS, TRACE_HEADER
 import asyncio
+import json
+import logging
+import time
 
-app = FastAPI()
+# uvicorn configures this logger, so its INFO records reach the server log
+logger = logging.getLogger("uvicorn.error")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    components = Components()
+    await components.awarm()
+    app.state.components = components
+    try:
+        yield
+    finally:
+        await components.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Added first so CORS wraps it and rejections carry CORS headers
+app.add_middleware(AdmissionMiddleware, paths=["/generate"])
+# Outside admission, so rejected and queued requests are timed and traced
+app.add_middleware(MetricsMiddleware, paths=["/generate"])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER] if TRACE_HEADER else [],
 )
 
 
+def get_components(request: Request) -> Components:
+    return request.app.state.components
+
+
+def get_model_router(components: Components = Depends(get_components)) -> ModelRouter:
+    return components.model_router
+
+
+def get_rag(components: Components = Depends(get_components)) -> RAG:
+    return components.rag
+
+
+def get_response_cache(components: Components = Depends(get_components)) -> Optional[SemanticResponseCache]:
+    return components.response_cache
+
+
+def get_sse_writer(components: Components = Depends(get_components)) -> SSEWriter:
+    return components.sse_writer
+
+
+def get_context_budget(components: Components = Depends(get_components)) -> ContextBudget:
+    return components.context_budget
+
+
+def is_single_turn(conversation: list) -> bool:
+    return len(conversation) == 1 and conversation[0].get("role") == "user"
+
+
+def bypasses_cache(request: Request) -> bool:
+    cache_control = request.headers.get("cache-control", "").lower()
+    return "no-cache" in cache_control or "no-store" in cache_control
+
+
+class StageTimer:
+    """
+    Milliseconds spent in each stage of one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, name: str, since: float):
+        self.stages[name] = round((time.perf_counter() - since) * 1000, 1)
+
+    @contextmanager
+    def stage(self, name: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, began)
+
+    def summary(self) -> Dict[str, float]:
+        self.record("total", self.started)
+        # Called once per request, as it ends
+        REGISTRY.observe_stages(self.stages)
+        return self.stages
+
+
+async def retrieve_within_budget(rag: RAG, query: str, timer: StageTimer) -> Optional[Retrieval]:
+    """
+    Retrieval, or None if it fails or runs over RETRIEVAL_TIMEOUT_SECONDS,
+    in which case the question is answered without context.
+    """
+    with timer.stage("retrieval"):
+        try:
+            return await asyncio.wait_for(rag.retrieve(query, k=4), RETRIEVAL_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Retrieval took over %gs, answering without context", RETRIEVAL_TIMEOUT_SECONDS)
+            REGISTRY.count_error("retrieval_timeout")
+        except Exception:
+            logger.exception("Retrieval failed, answering without context")
+            REGISTRY.count_error("retrieval_failed")
+    return None
+
+
+async def stream_within_budget(stream: AsyncIterator[str], timer: StageTimer) -> AsyncIterator[str]:
+    """
+    Relays stream, raising asyncio.TimeoutError if the first delta takes
+    longer than LLM_FIRST_TOKEN_TIMEOUT_SECONDS or any later one longer
+    than LLM_IDLE_TIMEOUT_SECONDS.
+    """
+    began = time.perf_counter()
+    iterator = stream.__aiter__()
+    timeout = LLM_FIRST_TOKEN_TIMEOUT_SECONDS
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            if "first_token" not in timer.stages:
+                timer.record("first_token", began)
+                timeout = LLM_IDLE_TIMEOUT_SECONDS
+            yield delta
+    finally:
+        timer.record("generation", began)
+        await iterator.aclose()
+
+
 @app.get("/hello")
 def read_hello():
     return {"message": "Hello, world!"}
 
 
+def collect_stats(components: Components) -> dict:
+    return {
+        "admission": components.admission.stats() if components.admission else None,
+        "upstream": components.upstream.stats(),
+        "llm_rate_limit": components.llm_rate_limit.stats() if components.llm_rate_limit else None,
+        "embedding_rate_limit": components.embedding_rate_limit.stats() if components.embedding_rate_limit else None,
+        "vector_store_executor": components.vector_store.executor_stats(),
+        "embedding_cache": components.embedding_cache.stats(),
+        "retrieval_cache": components.retrieval_cache.stats(),
+        "lexical_index": components.lexical_index.stats() if components.lexical_index else None,
+        "query_router": components.query_router.stats() if components.query_router else None,
+        "retrieval_batcher": components.retrieval_batcher.stats() if components.retrieval_batcher else None,
+        "response_cache": components.response_cache.stats() if components.response_cache else None,
+        "context_budget": components.context_budget.stats(),
+        "model_router": components.model_router.stats(),
+        "sse": components.sse_writer.stats(),
+        "profiler": components.profiler.stats() if components.profiler else None,
+        "event_loop": components.loop_monitor.stats() if components.loop_monitor else None,
+    }
+
+
+@app.get("/stats")
+def read_stats(components: Components = Depends(get_components)):
+    return collect_stats(components)
+
+
+@app.get("/metrics")
+def read_metrics(components: Components = Depends(get_components)):
+    return PlainTextResponse(REGISTRY.render(collect_stats(components)), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/generate")
-async def generate(request: Request):
-    data = await request.json()
+async def generate(
+    request: Request,
+    model_router: ModelRouter = Depends(get_model_router),
+    rag: RAG = Depends(get_rag),
+    response_cache: Optional[SemanticResponseCache] = Depends(get_response_cache),
+    context_budget: ContextBudget = Depends(get_context_budget),
+    sse_writer: SSEWriter = Depends(get_sse_writer),
+):
+    timer = StageTimer()
+    with timer.stage("request"):
+        data = await request.json()
     conversation = data.get("conversation")
-    llm = LLM()
-    embeddings = Embeddings()
-    chroma_client = ChromaDbClient()
-    rag = RAG(chroma_client, embeddings)
+    bypass = bypasses_cache(request)
 
     # Find the latest user message for retrieval
     user_messages = [m for m in conversation if m.get("role") == "user"]
     latest_user_message = user_messages[-1]["content"] if user_messages else ""
 
-    # Retrieve relevant context from ChromaDB using RAG
-    context_chunks = await rag.retrieve_relevant_chunks(latest_user_message, k=4)
-    context_text = "\n\n".join(context_chunks)
-    if context_text:
-        # Prepend context as a system message
-        conversation = (
-            [{"role": "system", "content": f"Relevant context:\n{context_text}"}]
-            + conversation
+    async def event_stream():
+        # The response starts before any work, so the client sees the first
+        # byte at once; named events are progress, data events the answer
+        yield sse_event("status", {"stage": "retrieval"})
+        retrieval = await retrieve_within_budget(rag, latest_user_message, timer)
+
+        # Single-turn questions may be answered from the semantic answer cache
+        cache_status = "OFF"
+        question_vec = None
+        if response_cache is not None and retrieval is not None and is_single_turn(conversation):
+            cache_status = "BYPASS" if bypass else "MISS"
+            with timer.stage("cache"):
+                question_vec = await rag.embeddings.embed(latest_user_message)
+                cached = response_cache.lookup(question_vec, retrieval.ids) if not bypass else None
+            if cached is not None:
+                yield sse_event("status", {"stage": "generation", "cache": "HIT"})
+                # The whole cached answer goes out in one write
+                yield sse_data("".join(cached)) + sse_event("timing", timer.summary()) + sse_data("[DONE]")
+                return
+
+        # Context as a system message, deduplicated and cut to the token budgets
+        retrieval = retrieval or Retrieval([], [], [])
+        with timer.stage("prompt"):
+            prompt = context_budget.build(conversation, retrieval.documents, retrieval.metadatas)
+            route = model_router.route(conversation, retrieval.ids)
+        logger.info(
+            "prompt_tokens=%d context_tokens=%d history_tokens=%d context_blocks=%d turns_dropped=%d",
+            prompt.prompt_tokens, prompt.context_tokens, prompt.history_tokens,
+            prompt.context_blocks, prompt.turns_dropped,
         )
+        yield sse_event("status", {
+            "stage": "generation",
+            "cache": cache_status,
+            "context": bool(retrieval.ids),
+            "prompt_tokens": prompt.prompt_tokens,
+            "tier": route.tier,
+        })
 
-    async def event_stream():
-        async for chunk in llm.generate(conversation):
-            # SSE format: data: <chunk>\n\n
-            yield f"data: {chunk}\n\n"
-        yield "data: [DONE]\n\n"
+        deltas = []
+        complete = False
+        try:
+            stream = stream_within_budget(model_router.generate(prompt.messages, route), timer)
+            # Closing the chunks closes the model's stream, also when the
+            # client disconnects and this generator is closed
+            async with aclosing(sse_writer.coalesce(stream)) as chunks:
+                async for chunk in chunks:
+                    deltas.append(chunk)
+                    yield sse_data(chunk)
+            complete = True
+        except asyncio.TimeoutError:
+            logger.warning("LLM stream timed out after %d deltas", len(deltas))
+            REGISTRY.count_error("llm_timeout")
+            yield sse_event("error", {"message": "The model stopped responding"})
+        except Exception:
+            logger.exception("LLM stream failed")
+            REGISTRY.count_error("llm_failed")
+            yield sse_event("error", {"message": "The model request failed"})
+        timing = timer.summary()
+        logger.info("trace_id=%s timing_ms=%s", current_trace_id() or "-", json.dumps(timing))
+        yield sse_event("timing", timing) + sse_data("[DONE]")
+        # Only complete answers are cached; a dropped stream never gets here
+        if complete and question_vec is not None:
+            response_cache.store(latest_user_message, question_vec, retrieval.ids, deltas)
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return sse_writer.response(event_stream())
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+
+
+class ChunkIds:
+    """
+    Assigns content-addressed ids to a document's chunks as they stream in.
+    Repeated chunks get an occurrence suffix so ids stay unique.
+    """
+
+    def __init__(self, document: str):
+        self.document = document
+        self._seen: Dict[str, int] = {}
+
+    def assign(self, chunks: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Returns the ids and content hashes of the next chunks of the document.
+        """
+        ids, hashes = [], []
+        for chunk in chunks:
+            h = chunk_hash(chunk)
+            occurrence = self._seen.get(h, 0)
+            self._seen[h] = occurrence + 1
+            ids.append(f"{self.document}_{h}" if occurrence == 0 else f"{self.document}_{h}_{occurrence}")
+            hashes.append(h)
+        return ids, hashes
+
+
+def chunk_ids(document: str, chunks: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Content-addressed ids for all of a document's chunks, plus their hashes.
+    """
+    return ChunkIds(document).assign(chunks)
+
+
+class IngestManifest:
+    """
+    Records what has been ingested for each document (keyed by file name):
+    file hash, size, mtime, the chunking strategy and its parameters, and
+    the ids and content hashes of its chunks.
+    Lets re-ingestion skip unchanged files, embed only new chunks and
+    delete chunks that no longer exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, pdf_path: str, chunker: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (unchanged, file_hash). A document chunked with settings
+        other than chunker has changed even if its file has not. The hash
+        is only computed when size or mtime differ from the manifest, and
+        is None when it was not needed.
+        """
+        entry = self.documents.get(os.path.basename(pdf_path))
+        if entry is not None and (entry.get("chunker") != chunker or not entry.get("indexed")):
+            entry = None
+        stat = os.stat(pdf_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True, None
+        file_hash = file_sha256(pdf_path)
+        if entry and entry["sha256"] == file_hash:
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            return True, file_hash
+        return False, file_hash
+
+    def known_ids(self, pdf_path: str) -> List[str]:
+        entry = self.documents.get(os.path.basename(pdf_path))
+        return entry["chunk_ids"] if entry else []
+
+    def known_positions(self, pdf_path: str) -> Dict[str, Optional[int]]:
+        """
+        The stored chunks of a document and the chunk_index their metadata
+        holds: their position in chunk_ids, or None for documents recorded
+        before positions were stored.
+        """
+        entry = self.documents.get(os.path.basename(pdf_path))
+        if not entry:
+            return {}
+        indexed = entry.get("indexed", False)
+        return {id: (index if indexed else None) for index, id in enumerate(entry["chunk_ids"])}
+
+    def is_tracked(self, pdf_path: str) -> bool:
+        return os.path.basename(pdf_path) in self.documents
+
+    def record(self, pdf_path: str, file_hash: str, chunker: Dict[str, Any],
+               ids: List[str], hashes: List[str]):
+        stat = os.stat(pdf_path)
+        self.documents[os.path.basename(pdf_path)] = {
+            "sha256": file_hash,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunker": chunker,
+            # Stored chunks carry their position in chunk_ids as chunk_index
+            "indexed": True,
+            "chunk_ids": ids,
+            "chunk_hashes": hashes,
+        }
+
+    def forget(self, document: str) -> List[str]:
+        """
+        Drops a document and returns the chunk ids it owned.
+        """
+        entry = self.documents.pop(document, None)
+        return entry["chunk_ids"] if entry else []
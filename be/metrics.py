@@ -0,0 +1,451 @@
+import asyncio
+import cProfile
+import contextvars
+import functools
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from config import TRACE_HEADER, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_DIR, EVENT_LOOP_MONITOR_MS
+
+logger = logging.getLogger("uvicorn.error")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Finer ones for event-loop lag, where a few milliseconds already matter
+LAG_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Trace IDs accepted from clients; anything else is replaced by a new one
+TRACE_ID_RE = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """
+    Trace ID of the request being served, if trace IDs are on.
+    """
+    return _trace_id.get()
+
+
+def _number(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]):
+        # One count per bucket plus +Inf, not cumulative until rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, buckets: Sequence[float], value: float):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+
+    def copy(self) -> "_Histogram":
+        copy = _Histogram(())
+        copy.counts, copy.sum = self.counts[:], self.sum
+        return copy
+
+    def render(self, name: str, labels: str, buckets: Sequence[float]) -> List[str]:
+        prefix = labels + "," if labels else ""
+        lines = []
+        total = 0
+        for bound, count in zip((*map(_number, buckets), "+Inf"), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {_number(self.sum)}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+        return lines
+
+
+class Span:
+    """
+    Durations, in-flight count and errors of one instrumented operation;
+    for a stream, also the time to its first item and the items yielded.
+    Only timing and counting happen per call: a span around a coroutine
+    costs about 2 us, one around a stream about 5 us plus 0.4 us per item.
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.streaming = False
+        self.in_flight = 0
+        self.errors = 0
+        self.items = 0
+        self._duration = _Histogram(buckets)
+        self._first_item = _Histogram(buckets)
+        self._lock = threading.Lock()
+
+    def start(self) -> float:
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def first_item(self, began: float):
+        seconds = time.perf_counter() - began
+        with self._lock:
+            self._first_item.observe(self.buckets, seconds)
+
+    def stop(self, began: float, failed: bool = False, items: int = 0):
+        seconds = time.perf_counter() - began
+        with self._lock:
+            self.in_flight -= 1
+            self._duration.observe(self.buckets, seconds)
+            self.items += items
+            if failed:
+                self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "errors": self.errors,
+                "items": self.items,
+                "duration": self._duration.copy(),
+                "first_item": self._first_item.copy(),
+            }
+
+
+class Metrics:
+    """
+    Process-wide metrics rendered in the Prometheus text format: spans
+    around instrumented calls, the stages of /generate (StageTimer), HTTP
+    requests by path and status, and counters such as stream errors.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._spans: Dict[str, Span] = {}
+        self._stages: Dict[str, _Histogram] = {}
+        self._requests: Dict[str, _Histogram] = {}
+        self._responses: Dict[Tuple[str, int], int] = {}
+        self._errors: Dict[str, int] = {}
+        self._loop_lag = _Histogram(LAG_BUCKETS)
+
+    def span(self, name: str) -> Span:
+        with self._lock:
+            if name not in self._spans:
+                self._spans[name] = Span(name, self.buckets)
+            return self._spans[name]
+
+    def observe_stages(self, stages_ms: Dict[str, float]):
+        with self._lock:
+            for stage, ms in stages_ms.items():
+                if stage not in self._stages:
+                    self._stages[stage] = _Histogram(self.buckets)
+                self._stages[stage].observe(self.buckets, ms / 1000)
+
+    def observe_loop_lag(self, seconds: float):
+        with self._lock:
+            self._loop_lag.observe(LAG_BUCKETS, seconds)
+
+    def observe_request(self, path: str, status: int, seconds: float):
+        with self._lock:
+            if path not in self._requests:
+                self._requests[path] = _Histogram(self.buckets)
+            self._requests[path].observe(self.buckets, seconds)
+            self._responses[path, status] = self._responses.get((path, status), 0) + 1
+
+    def count_error(self, reason: str):
+        with self._lock:
+            self._errors[reason] = self._errors.get(reason, 0) + 1
+
+    def render(self, stats: Optional[Dict[str, Any]] = None) -> str:
+        """
+        All metrics as Prometheus text. Numbers in stats, the /stats
+        document, are added as backend_stat gauges.
+        """
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help: str):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            spans = {name: span.snapshot() for name, span in self._spans.items()}
+            streaming = [name for name, span in self._spans.items() if span.streaming]
+            stages = {stage: histogram.copy() for stage, histogram in self._stages.items()}
+            requests = {path: histogram.copy() for path, histogram in self._requests.items()}
+            responses = dict(self._responses)
+            errors = dict(self._errors)
+            loop_lag = self._loop_lag.copy()
+
+        family("span_seconds", "histogram", "Duration of instrumented calls")
+        for name, span in spans.items():
+            lines.extend(span["duration"].render("span_seconds", _labels(["span"], [name]), self.buckets))
+        family("span_in_flight", "gauge", "Instrumented calls running now")
+        for name, span in spans.items():
+            lines.append(f"span_in_flight{{{_labels(['span'], [name])}}} {span['in_flight']}")
+        family("span_errors_total", "counter", "Instrumented calls that raised")
+        for name, span in spans.items():
+            lines.append(f"span_errors_total{{{_labels(['span'], [name])}}} {span['errors']}")
+        family("span_first_item_seconds", "histogram", "Time to the first item of instrumented streams")
+        for name in streaming:
+            lines.extend(spans[name]["first_item"].render(
+                "span_first_item_seconds", _labels(["span"], [name]), self.buckets))
+        family("span_items_total", "counter", "Items yielded by instrumented streams")
+        for name in streaming:
+            lines.append(f"span_items_total{{{_labels(['span'], [name])}}} {spans[name]['items']}")
+
+        family("generate_stage_seconds", "histogram", "Duration of each stage of /generate")
+        for stage, histogram in stages.items():
+            lines.extend(histogram.render("generate_stage_seconds", _labels(["stage"], [stage]), self.buckets))
+        family("generate_errors_total", "counter", "/generate answers cut short, by reason")
+        for reason, count in errors.items():
+            lines.append(f"generate_errors_total{{{_labels(['reason'], [reason])}}} {count}")
+
+        family("http_request_seconds", "histogram", "Duration of HTTP requests, streamed body included")
+        for path, histogram in requests.items():
+            lines.extend(histogram.render("http_request_seconds", _labels(["path"], [path]), self.buckets))
+        family("http_responses_total", "counter", "HTTP responses by path and status")
+        for (path, status), count in responses.items():
+            lines.append(f"http_responses_total{{{_labels(['path', 'status'], [path, status])}}} {count}")
+
+        family("event_loop_lag_seconds", "histogram", "How late the event loop ran a timer")
+        lines.extend(loop_lag.render("event_loop_lag_seconds", "", LAG_BUCKETS))
+
+        if stats is not None:
+            family("backend_stat", "gauge", "Numeric values from /stats")
+            for component, values in stats.items():
+                for stat, value in self._flatten(values):
+                    lines.append(f"backend_stat{{{_labels(['component', 'stat'], [component, stat])}}} "
+                                 f"{_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _flatten(self, values: Any, prefix: str = ""):
+        if isinstance(values, bool):
+            yield prefix, int(values)
+        elif isinstance(values, (int, float)):
+            yield prefix, values
+        elif isinstance(values, dict):
+            for key, value in values.items():
+                yield from self._flatten(value, f"{prefix}.{key}" if prefix else str(key))
+
+
+REGISTRY = Metrics()
+
+
+def timed(name: str):
+    """
+    Decorates a coroutine function with a span: its duration, in-flight
+    count and errors. Cancellation is not counted as an error.
+    """
+    span = REGISTRY.span(name)
+
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            began = span.start()
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                span.stop(began, failed)
+        return wrapper
+    return decorate
+
+
+def timed_stream(name: str):
+    """
+    Decorates an async generator function with a span that lasts until
+    the stream ends or is closed, and also records the time to its first
+    item and the number of items.
+    """
+    span = REGISTRY.span(name)
+    span.streaming = True
+
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            began = span.start()
+            failed = False
+            items = 0
+            stream = func(*args, **kwargs)
+            try:
+                async for item in stream:
+                    if not items:
+                        span.first_item(began)
+                    items += 1
+                    yield item
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # Closing the wrapper closes the stream at once
+                await stream.aclose()
+                span.stop(began, failed, items)
+        return wrapper
+    return decorate
+
+
+class RequestProfiler:
+    """
+    Runs a sample_rate share of requests under cProfile and writes the
+    profiles of those that take longer than slow_ms to directory. cProfile
+    sees everything the event loop thread runs meanwhile, other requests
+    included, but not the executor threads; only one request is profiled
+    at a time.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        directory: str = PROFILE_DIR,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self._active = False
+        self._lock = threading.Lock()
+        self.profiled = 0
+        self.kept = 0
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self._active or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    async def finish(self, profile: cProfile.Profile, seconds: float, trace_id: Optional[str]):
+        profile.disable()
+        self._active = False
+        with self._lock:
+            self.profiled += 1
+        if seconds * 1000 < self.slow_ms:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(time.time())}-{trace_id or secrets.token_hex(4)}.prof")
+        await asyncio.to_thread(profile.dump_stats, path)
+        with self._lock:
+            self.kept += 1
+        logger.warning("Slow request (%.0f ms) profiled to %s", seconds * 1000, path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_ms,
+                "profiled": self.profiled,
+                "kept": self.kept,
+            }
+
+
+class EventLoopMonitor:
+    """
+    Sleeps interval_ms at a time on the event loop and records how much
+    later than asked it woke up: the time callbacks, such as JSON parsing
+    or a blocking call, held the loop while the timer was due.
+    """
+
+    def __init__(self, interval_ms: float = EVENT_LOOP_MONITOR_MS):
+        self.interval = interval_ms / 1000
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - due)
+            REGISTRY.observe_loop_lag(lag)
+            with self._lock:
+                self.samples += 1
+                self.lag_seconds += lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "interval_ms": self.interval * 1000,
+                "samples": self.samples,
+                "mean_lag_ms": self.lag_seconds / self.samples * 1000 if self.samples else 0.0,
+                "max_lag_ms": self.max_lag_seconds * 1000,
+            }
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that puts a trace ID in trace_header of every response
+    (the client's own if it sent a valid one) and makes it available to
+    the request's code through current_trace_id(). Requests to paths are
+    timed by status, streamed body included, and sampled for profiling by
+    app.state.components.profiler.
+    """
+
+    def __init__(self, app, paths: Sequence[str] = ("/generate",), trace_header: str = TRACE_HEADER):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.trace_header = trace_header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace_id = None
+        if self.trace_header:
+            for name, value in scope["headers"]:
+                if name == self.trace_header:
+                    trace_id = value.decode("latin-1")
+                    break
+            if trace_id is None or not TRACE_ID_RE.fullmatch(trace_id):
+                trace_id = secrets.token_hex(8)
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace_id is not None:
+                    headers = [*message.get("headers", ()), (self.trace_header, trace_id.encode("latin-1"))]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = _trace_id.set(trace_id)
+        try:
+            if scope["path"] not in self.paths:
+                await self.app(scope, receive, send_with_trace)
+                return
+            profiler: Optional[RequestProfiler] = scope["app"].state.components.profiler
+            profile = profiler.start() if profiler is not None else None
+            began = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                seconds = time.perf_counter() - began
+                REGISTRY.observe_request(scope["path"], status, seconds)
+                if profile is not None:
+                    await profiler.finish(profile, seconds, trace_id)
+        finally:
+            _trace_id.reset(token)
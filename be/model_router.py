@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, NamedTuple, Optional, Tuple
+from llm import LLM
+from chunking import chunk_document_type
+from config import (
+    LLM_SIMPLE_MODELS,
+    LLM_COMPLEX_MODELS,
+    LLM_FALLBACK_MODELS,
+    ROUTER_SIMPLE_MAX_WORDS,
+    ROUTER_SIMPLE_MAX_TURNS,
+    LLM_HEDGE_AFTER_SECONDS,
+    LLM_HEDGE,
+    LLM_TTFT_WINDOW_SECONDS,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+SIMPLE = "simple"
+COMPLEX = "complex"
+# Samples kept per model, however recent
+TTFT_MAX_SAMPLES = 256
+# Models with fewer recent samples rank first, so they are measured again
+TTFT_MIN_SAMPLES = 3
+
+
+def parse_models(value: str) -> List[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+class Route(NamedTuple):
+    tier: str
+    # Candidates in the order they are tried
+    models: List[str]
+
+
+class RollingLatency:
+    """
+    Time to first token of one model over the last window_seconds. A
+    request abandoned for a faster model counts with the time it had
+    waited, a failed one with the hedge deadline, so slow or failing
+    models sink in the ranking until their samples expire.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=TTFT_MAX_SAMPLES)
+
+    def add(self, seconds: float):
+        self._samples.append((time.monotonic(), seconds))
+
+    def recent(self) -> List[float]:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return sorted(seconds for _, seconds in self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        values = self.recent()
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+    def count(self) -> int:
+        return len(self.recent())
+
+
+class _Attempt:
+    """
+    One model's stream, with its first delta being awaited in a task.
+    """
+
+    def __init__(self, model: str, stream: AsyncGenerator[str, None]):
+        self.model = model
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.first = asyncio.ensure_future(stream.__anext__())
+
+    async def cancel(self):
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        await self.stream.aclose()
+
+
+class ModelRouter:
+    """
+    Picks the models for each answer and streams from the first to
+    respond. Questions that are short, early in a conversation and backed
+    by policy documents (or no context) go to the simple tier, the rest
+    to the complex tier; within a tier models are tried fastest first by
+    rolling time to first token, then the fallback models. When the first
+    token misses hedge_after_seconds the next model is started, racing
+    the slow one (hedge) or replacing it; a model that fails before its
+    first token is replaced at once. Once a token arrives the answer stays
+    with that model.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        simple_models: List[str] = parse_models(LLM_SIMPLE_MODELS),
+        complex_models: List[str] = parse_models(LLM_COMPLEX_MODELS),
+        fallback_models: List[str] = parse_models(LLM_FALLBACK_MODELS),
+        simple_max_words: int = ROUTER_SIMPLE_MAX_WORDS,
+        simple_max_turns: int = ROUTER_SIMPLE_MAX_TURNS,
+        hedge_after_seconds: float = LLM_HEDGE_AFTER_SECONDS,
+        hedge: bool = LLM_HEDGE,
+        ttft_window_seconds: float = LLM_TTFT_WINDOW_SECONDS,
+    ):
+        self.llm = llm
+        self.tiers = {
+            SIMPLE: simple_models or [llm.model],
+            COMPLEX: complex_models or [llm.model],
+        }
+        self.fallback_models = fallback_models
+        self.simple_max_words = simple_max_words
+        self.simple_max_turns = simple_max_turns
+        self.hedge_after_seconds = hedge_after_seconds
+        self.hedge = hedge
+        self.ttft_window_seconds = ttft_window_seconds
+        self._latency: Dict[str, RollingLatency] = {}
+        self._lock = threading.Lock()
+        self.routed: Counter = Counter()
+        self.attempts: Counter = Counter()
+        self.answers: Counter = Counter()
+        self.deadline_misses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.hedged = 0
+        self.failovers = 0
+
+    def _rolling(self, model: str) -> RollingLatency:
+        if model not in self._latency:
+            self._latency[model] = RollingLatency(self.ttft_window_seconds)
+        return self._latency[model]
+
+    def classify(self, conversation: List[Dict[str, str]], retrieved_ids: List[str]) -> str:
+        user_turns = [m for m in conversation if m.get("role") == "user"]
+        question = user_turns[-1]["content"] if user_turns else ""
+        if len(user_turns) > self.simple_max_turns:
+            return COMPLEX
+        if len(question.split()) > self.simple_max_words:
+            return COMPLEX
+        if any(chunk_document_type(id) != "policy" for id in retrieved_ids):
+            return COMPLEX
+        return SIMPLE
+
+    def route(self, conversation: List[Dict[str, str]], retrieved_ids: List[str]) -> Route:
+        tier = self.classify(conversation, retrieved_ids)
+
+        def expected_ttft(model: str) -> float:
+            latency = self._rolling(model)
+            return latency.percentile(50) if latency.count() >= TTFT_MIN_SAMPLES else 0.0
+
+        with self._lock:
+            self.routed[tier] += 1
+            # sorted() is stable, so unmeasured models keep their configured order
+            models = sorted(self.tiers[tier], key=expected_ttft)
+        models += [model for model in self.fallback_models if model not in models]
+        return Route(tier, models)
+
+    def _record(self, model: str, ttft: float, counter: Optional[Counter] = None):
+        with self._lock:
+            self._rolling(model).add(ttft)
+            if counter is not None:
+                counter[model] += 1
+
+    async def _abandon(self, attempt: _Attempt):
+        """
+        Cancels an attempt that lost the race, counting the time it had
+        waited as its time to first token.
+        """
+        self._record(attempt.model, time.perf_counter() - attempt.started)
+        await attempt.cancel()
+
+    async def generate(self, messages: List[Dict[str, str]], route: Route) -> AsyncGenerator[str, None]:
+        """
+        Streams the answer of the first of route's models to produce a
+        token. Raises the last error if every model fails before one.
+        """
+        remaining = list(route.models)
+        pending: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        last_error: Optional[BaseException] = None
+
+        def start():
+            model = remaining.pop(0)
+            with self._lock:
+                self.attempts[model] += 1
+            pending.append(_Attempt(model, self.llm.generate(messages, model=model)))
+
+        try:
+            start()
+            while winner is None:
+                timeout = None
+                if remaining:
+                    elapsed = time.perf_counter() - pending[-1].started
+                    timeout = max(0.0, self.hedge_after_seconds - elapsed)
+                done, _ = await asyncio.wait(
+                    [attempt.first for attempt in pending],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # The latest model missed the deadline: bring in the next
+                    with self._lock:
+                        self.deadline_misses[pending[-1].model] += 1
+                        self.hedged += 1
+                    if not self.hedge:
+                        for attempt in pending:
+                            await self._abandon(attempt)
+                        pending.clear()
+                    start()
+                    continue
+                failed = False
+                for attempt in list(pending):
+                    if not attempt.first.done():
+                        continue
+                    pending.remove(attempt)
+                    error = attempt.first.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = attempt
+                        break
+                    logger.warning("Model %s failed before its first token: %r", attempt.model, error)
+                    self._record(attempt.model, self.hedge_after_seconds, self.errors)
+                    last_error, failed = error, True
+                if winner is not None:
+                    break
+                if remaining and (failed or not pending):
+                    with self._lock:
+                        self.failovers += 1
+                    start()
+                elif not pending:
+                    raise last_error
+
+            for attempt in pending:
+                await self._abandon(attempt)
+            pending.clear()
+            ttft = time.perf_counter() - winner.started
+            self._record(winner.model, ttft, self.answers)
+            logger.info("model=%s tier=%s ttft_ms=%.0f", winner.model, route.tier, ttft * 1000)
+            if winner.first.exception() is not None:
+                return
+            yield winner.first.result()
+            async for delta in winner.stream:
+                yield delta
+        finally:
+            for attempt in pending:
+                await attempt.cancel()
+            if winner is not None:
+                await winner.stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {}
+            for model in sorted(set(self.attempts) | set(self._latency)):
+                latency = self._rolling(model)
+                p50, p90 = latency.percentile(50), latency.percentile(90)
+                models[model] = {
+                    "attempts": self.attempts[model],
+                    "answers": self.answers[model],
+                    "deadline_misses": self.deadline_misses[model],
+                    "errors": self.errors[model],
+                    "ttft_samples": latency.count(),
+                    "ttft_p50_ms": p50 * 1000 if p50 is not None else None,
+                    "ttft_p90_ms": p90 * 1000 if p90 is not None else None,
+                }
+            return {
+                "tiers": self.tiers,
+                "fallback_models": self.fallback_models,
+                "hedge_after_seconds": self.hedge_after_seconds,
+                "hedge": self.hedge,
+                "routed": dict(self.routed),
+                "hedged": self.hedged,
+                "failovers": self.failovers,
+                "models": models,
+            }
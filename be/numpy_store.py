@@ -0,0 +1,456 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from config import (
+    CHROMA_EXECUTOR_WORKERS,
+    NUMPY_INDEX_DIR,
+    NUMPY_INDEX_DTYPE,
+    NUMPY_RESCORE_CANDIDATES,
+    NUMPY_PREFIX_DIMS,
+)
+from vector_store import VectorStore
+from index_files import MaskCache, StringColumn, as_list, matches, current_generation, new_generation, publish_generation
+
+# float16 and int8 rows are upcast this many at a time while scoring; for
+# float16 the upcast dominates, so it searches several times slower
+SCORE_BLOCK_ROWS = 1024
+DTYPES = ("float32", "float16", "int8")
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Scalar int8 codes of vectors with a scale and offset per dimension,
+    spreading each dimension's range over all 256 levels. A vector is
+    approximately codes * scale + offset.
+    """
+    if not len(vectors):
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        return np.empty((0, dim), dtype=np.int8), np.ones(dim, np.float32), np.zeros(dim, np.float32)
+    low = vectors.min(axis=0)
+    scale = (vectors.max(axis=0) - low) / 255
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint((vectors - low) / scale) - 128, -128, 127).astype(np.int8)
+    return codes, scale.astype(np.float32), (low + 128 * scale).astype(np.float32)
+
+
+class _Index:
+    """
+    Immutable snapshot of the stored rows. Queries keep using the snapshot
+    they started with while writes build the next one.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: Sequence[str],
+                 documents: Sequence[str], metadatas: Sequence[str],
+                 full: Optional[np.ndarray] = None,
+                 scale: Optional[np.ndarray] = None, offset: Optional[np.ndarray] = None):
+        # Rows as searched: float32, float16 or int8 codes of the full
+        # vectors or of their leading dimensions
+        self.vectors = vectors
+        # float32 rows (vectors itself for float32), or None if only the
+        # codes exist; usually memory-mapped, so only rows read are loaded
+        self.full = full
+        # Per-dimension dequantisation of int8 codes
+        self.scale = scale
+        self.offset = offset
+        self.ids = ids
+        self.documents = documents
+        # Metadata rows are kept as JSON and parsed on demand
+        self.metadatas = metadatas
+        self._rows: Optional[Dict[str, int]] = None
+        self._parsed: Optional[List[Optional[Dict[str, Any]]]] = None
+        self._masks: Optional[MaskCache] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return (self.full if self.full is not None else self.vectors).shape[1]
+
+    def float_rows(self, rows) -> np.ndarray:
+        """
+        float32 vectors of rows (an index array or slice), from the full
+        vectors when there are any, else decoded from the codes.
+        """
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scale is not None:
+            vectors = vectors * self.scale + self.offset
+        return vectors
+
+    def rows(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {id: row for row, id in enumerate(self.ids)}
+        return self._rows
+
+    def metadata(self, row: int) -> Optional[Dict[str, Any]]:
+        if self._parsed is not None:
+            return self._parsed[row]
+        return json.loads(self.metadatas[row])
+
+    def parsed_metadatas(self) -> List[Optional[Dict[str, Any]]]:
+        if self._parsed is None:
+            self._parsed = [json.loads(m) for m in self.metadatas]
+        return self._parsed
+
+    def candidate_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        if self._masks is None:
+            self._masks = MaskCache(self.parsed_metadatas())
+        return np.flatnonzero(self._masks.mask(where))
+
+
+def _empty_index(dtype: np.dtype) -> _Index:
+    return _Index(np.empty((0, 0), dtype=dtype), [], [], [], full=np.empty((0, 0), dtype=np.float32))
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact in-process search over one contiguous, L2-normalised matrix.
+
+    The matrix, ids and documents live in .npy files that are memory-mapped
+    on load. Writes are buffered and merged into a new snapshot on the next
+    query or flush; flush() writes a new generation directory and switches
+    CURRENT to it, so readers in other processes never see a partial index.
+
+    With a float16 or int8 dtype the matrix searched holds compact codes
+    (int8 with a scale and offset per dimension), and the float32 vectors
+    go to a side file that is memory-mapped but never scanned: the top
+    rescore_candidates rows by the codes are re-scored from it exactly.
+    With prefix_dims, the codes cover only the vectors' leading dimensions
+    (renormalised), which text-embedding-3 models train to stand on their
+    own, so the scan reads a fraction of the bytes before re-scoring.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = NUMPY_INDEX_DIR,
+        dtype: str = NUMPY_INDEX_DTYPE,
+        max_workers: int = CHROMA_EXECUTOR_WORKERS,
+        rescore_candidates: int = NUMPY_RESCORE_CANDIDATES,
+        prefix_dims: int = NUMPY_PREFIX_DIMS,
+    ):
+        super().__init__(persist_directory, max_workers, thread_name_prefix="numpy-store")
+        os.makedirs(persist_directory, exist_ok=True)
+        if str(dtype) not in DTYPES:
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        self.dtype = np.dtype(dtype)
+        self.rescore_candidates = rescore_candidates
+        self.prefix_dims = prefix_dims
+        self._lock = threading.Lock()
+        self._pending: Dict[str, tuple] = {}
+        self._removed: set = set()
+        self._dirty = False
+        self._seen_version = self.version()[1]
+        self._index = self._load()
+
+    def _search_dims(self, dim: int) -> int:
+        return self.prefix_dims if 0 < self.prefix_dims < dim else dim
+
+    def _encode(self, full: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        The search matrix for float32 rows, and the int8 scale and offset.
+        """
+        search = full
+        if self._search_dims(full.shape[1]) < full.shape[1]:
+            search = normalized(full[:, :self.prefix_dims])
+        if self.dtype == np.int8:
+            return quantize_int8(search)
+        if self.dtype == np.float32:
+            return search, None, None
+        return search.astype(self.dtype), None, None
+
+    def _load(self) -> _Index:
+        self._generation = current_generation(self.persist_directory)
+        if self._generation is None:
+            return _empty_index(self.dtype)
+        path = os.path.join(self.persist_directory, self._generation)
+        vectors = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        full_path = os.path.join(path, "embeddings.full.npy")
+        scale = offset = None
+        if os.path.exists(full_path):
+            full = np.load(full_path, mmap_mode="r")
+        elif vectors.dtype == np.float32:
+            full = vectors
+        else:
+            full = None
+        if vectors.dtype == np.int8:
+            scale, offset = np.load(os.path.join(path, "quantization.npy"))
+        dim = full.shape[1] if full is not None else vectors.shape[1]
+        if vectors.dtype != self.dtype or vectors.shape[1] != self._search_dims(dim):
+            # Built with another dtype or prefix: converted in memory, not on disk
+            if full is None:
+                full = _Index(vectors, [], [], [], None, scale, offset).float_rows(slice(None))
+            vectors, scale, offset = self._encode(full)
+        return _Index(
+            vectors,
+            StringColumn.load(os.path.join(path, "ids")),
+            StringColumn.load(os.path.join(path, "documents")),
+            StringColumn.load(os.path.join(path, "metadatas")),
+            full,
+            scale,
+            offset,
+        )
+
+    def _prepare(self, embeddings: List[List[float]]) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("embeddings must be a list of vectors")
+        dim = self._index.dim if len(self._index) else None
+        if dim is None and self._pending:
+            dim = len(next(iter(self._pending.values()))[0])
+        if dim is not None and vectors.shape[1] != dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match index dimension {dim}")
+        # Kept in full precision until compaction encodes them
+        return normalized(vectors)
+
+    def _compact(self) -> _Index:
+        """
+        Merges buffered writes into a new snapshot. Called with the lock held.
+        """
+        index = self._index
+        if not self._pending and not self._removed:
+            return index
+        ids = as_list(index.ids)
+        keep = [row for row, id in enumerate(ids) if id not in self._removed]
+        pending = list(self._pending.items())
+        documents, metadatas = as_list(index.documents), as_list(index.metadatas)
+        parts = []
+        if keep and len(index):
+            parts.append(index.float_rows(keep))
+        if pending:
+            parts.append(np.stack([vector for _, (vector, _, _) in pending]))
+        full = np.ascontiguousarray(np.concatenate(parts)) if parts else np.empty((0, 0), dtype=np.float32)
+        # int8 ranges are recomputed over all rows, so codes are rebuilt
+        vectors, scale, offset = self._encode(full)
+        self._index = _Index(
+            vectors,
+            [ids[row] for row in keep] + [id for id, _ in pending],
+            [documents[row] for row in keep] + [doc for _, (_, doc, _) in pending],
+            [metadatas[row] for row in keep] + [meta for _, (_, _, meta) in pending],
+            full,
+            scale,
+            offset,
+        )
+        self._pending = {}
+        self._removed = set()
+        return self._index
+
+    def _snapshot(self) -> _Index:
+        external = self.version()[1]
+        with self._lock:
+            if external != self._seen_version:
+                self._seen_version = external
+                # Another process flushed a newer index; reload unless this
+                # one has writes of its own that are not on disk yet
+                if not self._dirty and current_generation(self.persist_directory) != self._generation:
+                    self._index = self._load()
+            return self._compact()
+
+    def warm(self):
+        """
+        Reads the whole matrix once so its pages are resident before the
+        first query.
+        """
+        index = self._snapshot()
+        if len(index):
+            self.query(query_embeddings=[index.float_rows([0])[0]], n_results=1, include=[])
+
+    def upsert_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        with self._lock:
+            vectors = self._prepare(embeddings)
+            for i, id in enumerate(ids):
+                metadata = metadatas[i] if metadatas else None
+                self._removed.add(id)
+                self._pending[id] = (vectors[i], documents[i], json.dumps(metadata))
+            self._dirty = True
+        self._bump_version()
+
+    def add_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        # Like Chroma, ids that already exist are left untouched
+        with self._lock:
+            rows = self._index.rows()
+            new = [
+                i for i, id in enumerate(ids)
+                if id not in self._pending and (id not in rows or id in self._removed)
+            ]
+        if new:
+            self.upsert_documents(
+                embeddings=[embeddings[i] for i in new],
+                documents=[documents[i] for i in new],
+                ids=[ids[i] for i in new],
+                metadatas=[metadatas[i] for i in new] if metadatas else None,
+            )
+
+    def delete_documents(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        with self._lock:
+            index = self._index
+            if where is None:
+                targets = set(ids or [])
+            else:
+                metadatas = index.parsed_metadatas()
+                targets = {
+                    id for row, id in enumerate(index.ids)
+                    if id not in self._removed and matches(metadatas[row], where)
+                }
+                targets.update(
+                    id for id, (_, _, metadata) in self._pending.items()
+                    if matches(json.loads(metadata), where)
+                )
+                if ids is not None:
+                    targets &= set(ids)
+            for id in targets:
+                self._removed.add(id)
+                self._pending.pop(id, None)
+            self._dirty = True
+        self._bump_version()
+
+    def flush(self):
+        """
+        Writes the current rows as a new generation and points CURRENT at it.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            index = self._compact()
+            generation, path = new_generation(self.persist_directory)
+            np.save(os.path.join(path, "embeddings.npy"), index.vectors)
+            if index.full is not None and index.full is not index.vectors:
+                np.save(os.path.join(path, "embeddings.full.npy"), index.full)
+            if index.scale is not None:
+                np.save(os.path.join(path, "quantization.npy"), np.stack([index.scale, index.offset]))
+            StringColumn.save(os.path.join(path, "ids"), index.ids)
+            StringColumn.save(os.path.join(path, "documents"), index.documents)
+            StringColumn.save(os.path.join(path, "metadatas"), index.metadatas)
+            publish_generation(self.persist_directory, generation)
+            self._generation = generation
+            self._dirty = False
+        self._bump_version()
+        self._seen_version = self.version()[1]
+
+    def _scores(self, index: _Index, vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if vectors.dtype == np.float32:
+            return queries @ vectors.T
+        bias = 0.0
+        if index.scale is not None:
+            # q . (codes * scale + offset) = (q * scale) . codes + q . offset
+            bias = (queries @ index.offset)[:, None]
+            queries = queries * index.scale
+        scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = vectors[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores + bias
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 4,
+        include: List[str] = ["documents"],
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        index = self._snapshot()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        results: Dict[str, Any] = {"ids": []}
+        for field in ("documents", "metadatas", "distances", "embeddings"):
+            results[field] = [] if field in include else None
+        # A filter is applied before scoring: only matching rows are multiplied
+        candidates = index.candidate_rows(where) if where and len(index) else None
+        vectors = index.vectors if candidates is None else index.vectors[candidates]
+        if not len(vectors):
+            for field, values in results.items():
+                if values is not None:
+                    values.extend([] for _ in queries)
+            return results
+        queries = normalized(queries)
+        # A prefix index is searched with the queries' leading dimensions
+        search = normalized(queries[:, :vectors.shape[1]]) if vectors.shape[1] < queries.shape[1] else queries
+        scores = self._scores(index, vectors, search)
+        k = min(n_results, len(vectors))
+        # Codes only shortlist rows; the float32 side file decides the order
+        rescore = self.rescore_candidates > 0 and index.full is not None and index.full is not index.vectors
+        shortlist_size = min(max(k, self.rescore_candidates), len(vectors)) if rescore else k
+        top = np.argpartition(-scores, shortlist_size - 1, axis=1)[:, :shortlist_size]
+        for q in range(len(queries)):
+            shortlist = top[q]
+            if rescore:
+                stored = shortlist if candidates is None else candidates[shortlist]
+                shortlist_scores = np.asarray(index.full[stored], dtype=np.float32) @ queries[q]
+            else:
+                shortlist_scores = scores[q, shortlist]
+            picked = np.argsort(-shortlist_scores, kind="stable")[:k]
+            order, best = shortlist[picked], shortlist_scores[picked]
+            rows = order if candidates is None else candidates[order]
+            results["ids"].append([index.ids[row] for row in rows])
+            if results["documents"] is not None:
+                results["documents"].append([index.documents[row] for row in rows])
+            if results["metadatas"] is not None:
+                results["metadatas"].append([index.metadata(row) for row in rows])
+            if results["distances"] is not None:
+                # Squared L2 between unit vectors, as Chroma's default space reports
+                results["distances"].append((2.0 - 2.0 * best).tolist())
+            if results["embeddings"] is not None:
+                results["embeddings"].append(index.float_rows(rows).tolist())
+        return results
+
+    def get_documents(
+        self,
+        ids: List[str],
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Dict[str, Any]:
+        index = self._snapshot()
+        positions = index.rows()
+        rows = [positions[id] for id in ids if id in positions]
+        result: Dict[str, Any] = {"ids": [index.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [index.documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [index.metadata(row) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = index.float_rows(rows) if rows else []
+        return result
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Iterator[Dict[str, Any]]:
+        index = self._snapshot()
+        for start in range(0, len(index), batch_size):
+            rows = range(start, min(start + batch_size, len(index)))
+            page: Dict[str, Any] = {"ids": [index.ids[row] for row in rows]}
+            if "documents" in include:
+                page["documents"] = [index.documents[row] for row in rows]
+            if "metadatas" in include:
+                page["metadatas"] = [index.metadata(row) for row in rows]
+            if "embeddings" in include:
+                page["embeddings"] = index.float_rows(slice(start, rows.stop))
+            yield page
+
+    def count(self) -> int:
+        return len(self._snapshot())
@@ -0,0 +1,31 @@
+import time
+from typing import Iterator, List, Optional, Tuple
+import PyPDF2
+
+# Kept free of heavy imports: these functions run in ingestion worker
+# processes, which import this module on start-up.
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(PyPDF2.PdfReader(pdf_path).pages)
+
+
+def iter_page_texts(pdf_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (1-based page number, text) for pages [start, end), one page at a time.
+    """
+    reader = PyPDF2.PdfReader(pdf_path)
+    if end is None:
+        end = len(reader.pages)
+    for i in range(start, end):
+        yield i + 1, reader.pages[i].extract_text() or ""
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> Tuple[List[Tuple[int, str]], float]:
+    """
+    Returns the (page number, text) pairs of pages [start, end) and the
+    seconds spent extracting them.
+    """
+    began = time.perf_counter()
+    pages = list(iter_page_texts(pdf_path, start, end))
+    return pages, time.perf_counter() - began
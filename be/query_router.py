@@ -0,0 +1,102 @@
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from catalog import ProductCatalog, name_words
+from lexical_index import SEPARATOR_RE
+
+# Name words too common in questions to identify a product on their own
+GENERIC_WORDS = frozenset(
+    "wireless headphones headphone speaker laptop drone camera phone charge "
+    "mini pro ultra max plus edition series".split()
+)
+# Name words at least this long identify a product even without a digit
+DISTINCTIVE_LENGTH = 6
+
+
+def _keys(words: List[str]) -> Set[Tuple[str, ...]]:
+    """
+    Unigram and bigram keys of a word sequence; words with separators
+    also contribute their joined form ("wh-1000xm5" -> "wh1000xm5").
+    """
+    keys = set()
+    for i, word in enumerate(words):
+        keys.add((word,))
+        keys.add(("".join(SEPARATOR_RE.split(word)),))
+        if i + 1 < len(words):
+            keys.add((word, words[i + 1]))
+    return keys
+
+
+class QueryRouter:
+    """
+    Detects products named in a question and narrows retrieval to their
+    manuals plus the policy documents, which apply to every product.
+
+    A product is recognised by a key unique to its name: a word with a
+    digit ("wh-1000xm5", "s24"), its brand if no other product shares it,
+    a long non-generic word ("playstation"), or two consecutive name
+    words ("xps 15", "mini 4").
+    """
+
+    def __init__(self, catalog: ProductCatalog):
+        owners: Dict[Tuple[str, ...], Set[int]] = {}
+        for product in catalog.products:
+            words = name_words(product.name)
+            for key in self._product_keys(words):
+                owners.setdefault(key, set()).add(product.product_id)
+        self._keys = {key: ids.pop() for key, ids in owners.items() if len(ids) == 1}
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.unrouted = 0
+        # Routed searches with fewer than k hits, filled from all documents
+        self.fallbacks = 0
+        self.empty_fallbacks = 0
+
+    @staticmethod
+    def _product_keys(words: List[str]) -> Set[Tuple[str, ...]]:
+        keys = set()
+        for key in _keys(words):
+            if len(key) == 2:
+                if not (set(key) <= GENERIC_WORDS):
+                    keys.add(key)
+                continue
+            word = key[0]
+            if word in GENERIC_WORDS or word.isdigit():
+                continue
+            if any(c.isdigit() for c in word) or word == words[0] or len(word) >= DISTINCTIVE_LENGTH:
+                keys.add(key)
+        return keys
+
+    def mentioned_products(self, question: str) -> List[int]:
+        found = {self._keys[key] for key in _keys(name_words(question)) if key in self._keys}
+        return sorted(found)
+
+    def route(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a where filter for the products question names, or None
+        to search everything.
+        """
+        product_ids = self.mentioned_products(question)
+        with self._lock:
+            if product_ids:
+                self.routed += 1
+            else:
+                self.unrouted += 1
+        if not product_ids:
+            return None
+        return {"$or": [{"product_id": {"$in": product_ids}}, {"doc_type": "policy"}]}
+
+    def count_fallback(self, empty: bool):
+        with self._lock:
+            self.fallbacks += 1
+            if empty:
+                self.empty_fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "keys": len(self._keys),
+                "routed": self.routed,
+                "unrouted": self.unrouted,
+                "fallbacks": self.fallbacks,
+                "empty_fallbacks": self.empty_fallbacks,
+            }
@@ -1,48 +1,277 @@
 import os
-from typing import List
+import asyncio
+import logging
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
 from llm import Embeddings
-from chromadb_client import ChromaDbClient
-import PyPDF2
+from vector_store import VectorStore
+from embedding_pipeline import BatchEmbedder
+from retrieval_cache import RetrievalCache
+from retrieval_batcher import RetrievalBatcher
+from lexical_index import LexicalIndex
+from catalog import ProductCatalog
+from query_router import QueryRouter
+from chunking import Chunk, chunker_for, document_type, get_chunker, iter_chunks
+from pdf_extract import iter_page_texts
+from metrics import timed
+from config import INGEST_SEGMENT_CHUNKS, HYBRID_CANDIDATES, RRF_K
+
+logger = logging.getLogger("uvicorn.error")
+
+
+Metadata = Optional[Dict[str, Any]]
+Hits = Tuple[List[str], List[str], List[Metadata]]
+
+
+class Retrieval(NamedTuple):
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Metadata]
+
+
+def reciprocal_rank_fusion(rankings: List[Hits], k: int, rrf_k: int = RRF_K) -> Hits:
+    """
+    Merges ranked (ids, documents, metadatas) lists: each id scores the
+    sum of 1 / (rrf_k + rank) over the lists it appears in. Returns the
+    top k.
+    """
+    scores: Dict[str, float] = {}
+    hits: Dict[str, Tuple[str, Metadata]] = {}
+    for ids, docs, metas in rankings:
+        for rank, (id, doc, meta) in enumerate(zip(ids, docs, metas), start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (rrf_k + rank)
+            hits.setdefault(id, (doc, meta))
+    # sorted() is stable, so ties keep the order ids were first seen in
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+    return top, [hits[id][0] for id in top], [hits[id][1] for id in top]
 
 
 class RAG:
-    def __init__(self, chroma_client: ChromaDbClient, embeddings: Embeddings):
-        self.chroma_client = chroma_client
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        embeddings: Embeddings,
+        batch_embedder: Optional[BatchEmbedder] = None,
+        retrieval_cache: Optional[RetrievalCache] = None,
+        batcher: Optional[RetrievalBatcher] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        hybrid_candidates: int = HYBRID_CANDIDATES,
+        catalog: Optional[ProductCatalog] = None,
+        router: Optional[QueryRouter] = None,
+    ):
+        self.vector_store = vector_store
         self.embeddings = embeddings
+        self.batch_embedder = batch_embedder or BatchEmbedder(embeddings)
+        self.retrieval_cache = retrieval_cache
+        self.batcher = batcher
+        self.lexical_index = lexical_index
+        self.hybrid_candidates = hybrid_candidates
+        self.catalog = catalog
+        self.router = router
+
+    @staticmethod
+    def iter_pdf_chunks(pdf_path: str, strategy: Optional[str] = None, **options) -> Iterator[Chunk]:
+        """
+        Yields chunks with their page numbers while the PDF is read page by page.
+        Uses the strategy configured for the document type unless one is named.
+        """
+        chunker = get_chunker(strategy, **options) if strategy else chunker_for(pdf_path)
+        return iter_chunks(iter_page_texts(pdf_path), chunker)
 
     @staticmethod
-    def extract_text_chunks_from_pdf(pdf_path: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        reader = PyPDF2.PdfReader(pdf_path)
-        all_text = ""
-        for page in reader.pages:
-            all_text += page.extract_text() or ""
-        # Simple chunking by character count with overlap
-        chunks = []
-        start = 0
-        while start < len(all_text):
-            end = min(start + chunk_size, len(all_text))
-            chunk = all_text[start:end]
-            chunks.append(chunk)
-            start += chunk_size - overlap
-        return [c.strip() for c in chunks if c.strip()]
-
-    async def ingest_pdf(self, pdf_path: str):
-        chunks = self.extract_text_chunks_from_pdf(pdf_path)
-        vectors = await self.embeddings.embed_batch(chunks)
-        ids = [f"{os.path.basename(pdf_path)}_{i}" for i in range(len(chunks))]
-        metadatas = [{"source": pdf_path}] * len(chunks)
-        self.chroma_client.add_documents(
+    def extract_text_chunks_from_pdf(pdf_path: str, strategy: Optional[str] = None, **options) -> List[str]:
+        return [chunk.text for chunk in RAG.iter_pdf_chunks(pdf_path, strategy, **options)]
+
+    async def ingest_pdf(self, pdf_path: str, segment_size: int = INGEST_SEGMENT_CHUNKS):
+        """
+        Streams the PDF through chunking, embedding and the vector store
+        segment_size chunks at a time, so memory stays bounded on long manuals.
+        """
+        segment: List[Chunk] = []
+        first_index = 0
+        for chunk in self.iter_pdf_chunks(pdf_path):
+            segment.append(chunk)
+            if len(segment) == segment_size:
+                await self._ingest_segment(pdf_path, segment, first_index)
+                first_index += len(segment)
+                segment = []
+        if segment:
+            await self._ingest_segment(pdf_path, segment, first_index)
+        await self.flush()
+
+    async def _ingest_segment(self, pdf_path: str, segment: List[Chunk], first_index: int):
+        vectors = await self.batch_embedder.embed([chunk.text for chunk in segment])
+        indexes = list(range(first_index, first_index + len(segment)))
+        ids = [f"{os.path.basename(pdf_path)}_{index}" for index in indexes]
+        await self.add_chunks(pdf_path, segment, vectors, ids, indexes)
+
+    async def add_chunks(
+        self,
+        pdf_path: str,
+        chunks: List[Chunk],
+        vectors: List[List[float]],
+        ids: List[str],
+        indexes: List[int],
+    ):
+        """
+        Writes chunks of pdf_path with their vectors; indexes are the
+        chunks' positions in the document.
+        """
+        metadatas = [self.chunk_metadata(pdf_path, chunk.page_start, chunk.page_end, index)
+                     for chunk, index in zip(chunks, indexes)]
+        documents = [chunk.text for chunk in chunks]
+        # Upsert so re-ingesting a document replaces its chunks in place
+        writes = [self.vector_store.aupsert_documents(
             embeddings=vectors,
-            documents=chunks,
+            documents=documents,
             ids=ids,
             metadatas=metadatas,
-        )
+        )]
+        if self.lexical_index is not None:
+            writes.append(self.lexical_index.aupsert(ids, documents, metadatas))
+        await asyncio.gather(*writes)
+
+    async def move_chunks(self, pdf_path: str, chunks: List[Chunk], ids: List[str], indexes: List[int]):
+        """
+        Rewrites stored chunks of pdf_path whose position in the document
+        changed, keeping their vectors.
+        """
+        stored = await self.vector_store.aget_documents(ids, include=["embeddings"])
+        vector_of = dict(zip(stored["ids"], stored["embeddings"]))
+        # Chunks the store lost are embedded again
+        missing = [chunk.text for chunk, id in zip(chunks, ids) if id not in vector_of]
+        if missing:
+            vector_of.update(zip([id for id in ids if id not in vector_of],
+                                 await self.batch_embedder.embed(missing)))
+        await self.add_chunks(pdf_path, chunks, [vector_of[id] for id in ids], ids, indexes)
+
+    def chunk_metadata(
+        self,
+        pdf_path: str,
+        page_start: int,
+        page_end: int,
+        chunk_index: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Metadata stored with every chunk and available to where filters:
+        source, page range, position in the document, document type and,
+        for manuals of products in the catalog, the product's id and name.
+        """
+        metadata = {
+            "source": pdf_path,
+            "page_start": page_start,
+            "page_end": page_end,
+            "doc_type": document_type(pdf_path),
+        }
+        if chunk_index is not None:
+            metadata["chunk_index"] = chunk_index
+        product = self.catalog.product_for_document(pdf_path) if self.catalog else None
+        if product is not None:
+            metadata["product_id"] = product.product_id
+            metadata["product_name"] = product.name
+        return metadata
+
+    async def delete_chunks(self, ids: List[str]):
+        await self.vector_store.adelete_documents(ids=ids)
+        if self.lexical_index is not None:
+            await self.lexical_index.adelete(ids=ids)
+
+    async def delete_source(self, pdf_path: str):
+        """
+        Deletes every chunk ingested from pdf_path, whatever its id.
+        """
+        await self.vector_store.adelete_documents(where={"source": pdf_path})
+        if self.lexical_index is not None:
+            await self.lexical_index.adelete(where={"source": pdf_path})
 
-    async def retrieve_relevant_chunks(self, query: str, k: int = 4) -> List[str]:
+    async def flush(self):
+        """
+        Makes every chunk written so far durable in all indexes.
+        """
+        await self.vector_store.aflush()
+        if self.lexical_index is not None:
+            await self.lexical_index.aflush()
+
+    async def _vector_search(
+        self,
+        query: str,
+        k: int,
+        where: Optional[Dict[str, Any]],
+    ) -> Hits:
+        if self.batcher is not None:
+            return await self.batcher.retrieve(query, k, where)
         query_vec = await self.embeddings.embed(query)
-        results = self.chroma_client.query(
+        results = await self.vector_store.aquery(
             query_embeddings=[query_vec],
             n_results=k,
-            include=["documents"],
+            include=["documents", "metadatas"],
+            where=where,
+        )
+        ids = results["ids"][0] if results["ids"] else []
+        documents = results["documents"][0] if results["documents"] else []
+        metadatas = results["metadatas"][0] if results["metadatas"] else []
+        return ids, documents, metadatas
+
+    async def _search(
+        self,
+        query: str,
+        k: int,
+        where: Optional[Dict[str, Any]],
+    ) -> Hits:
+        if self.lexical_index is None:
+            return await self._vector_search(query, k, where)
+        candidates = max(k, self.hybrid_candidates)
+        dense, lexical = await asyncio.gather(
+            self._vector_search(query, candidates, where),
+            self.lexical_index.aquery(query, candidates, where),
         )
-        return results["documents"][0] if results["documents"] else []
+        return reciprocal_rank_fusion([dense, lexical], k)
+
+    @timed("retrieve")
+    async def retrieve(
+        self,
+        query: str,
+        k: int = 4,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Retrieval:
+        """
+        Returns the ids, documents and metadatas of the k chunks closest to
+        query, among those whose metadata matches where. Without a filter, the
+        router (if any) narrows the search to the products query names;
+        if fewer than k chunks match (chunks stored before products were
+        tagged, or a product without a manual), the rest are filled from
+        an unfiltered search. With a lexical index, the top candidates of
+        vector and BM25 search are fused by reciprocal rank.
+        """
+        routed = False
+        if where is None and self.router is not None:
+            where = self.router.route(query)
+            routed = where is not None
+        if self.retrieval_cache is not None:
+            version = self.vector_store.version()
+            cached = self.retrieval_cache.get(query, k, where, version)
+            if cached is not None:
+                return Retrieval(*cached)
+        ids, documents, metadatas = await self._search(query, k, where)
+        if routed and len(ids) < k:
+            if not ids:
+                logger.warning("No chunks match the routed filter %s; searching all documents", where)
+            self.router.count_fallback(empty=not ids)
+            ids, documents, metadatas = list(ids), list(documents), list(metadatas)
+            for hit in zip(*await self._search(query, k, None)):
+                if len(ids) == k:
+                    break
+                if hit[0] not in ids:
+                    ids.append(hit[0])
+                    documents.append(hit[1])
+                    metadatas.append(hit[2])
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.put(query, k, where, version, ids, documents, metadatas)
+        return Retrieval(ids, documents, metadatas)
+
+    async def retrieve_relevant_chunks(
+        self,
+        query: str,
+        k: int = 4,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
+        return (await self.retrieve(query, k, where)).documents
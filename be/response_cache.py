@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+
+class _Entry:
+    def __init__(self, question: str, context_ids: frozenset, deltas: List[str], expires_at: float):
+        self.question = question
+        self.context_ids = context_ids
+        self.deltas = deltas
+        self.expires_at = expires_at
+
+
+class SemanticResponseCache:
+    """
+    Cache of complete /generate answers for single-turn questions.
+
+    A question hits when its embedding is within `threshold` cosine
+    similarity of a cached question and retrieval returned the same context
+    chunk ids, so the cached answer was grounded in the same material.
+    Question vectors live in one preallocated matrix and are matched with a
+    single matrix-vector product. Eviction is LRU; entries also expire
+    after ttl_seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._matrix: Optional[np.ndarray] = None
+        # Slot index -> entry, least recently used first
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector: Iterable[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+    def _release(self, slot: int):
+        del self._entries[slot]
+        self._matrix[slot] = 0.0
+        self._free_slots.append(slot)
+
+    def lookup(self, vector: List[float], context_ids: Iterable[str]) -> Optional[List[str]]:
+        """
+        Returns the cached answer deltas of the closest matching question, or None.
+        """
+        wanted = frozenset(context_ids)
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if self._matrix is None or not self._entries or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for slot in candidates[np.argsort(-scores[candidates])].tolist():
+                entry = self._entries.get(slot)
+                if entry is None:
+                    continue
+                if entry.expires_at <= now:
+                    self._release(slot)
+                    continue
+                if entry.context_ids == wanted:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return entry.deltas
+            self.misses += 1
+            return None
+
+    def store(self, question: str, vector: List[float], context_ids: Iterable[str], deltas: List[str]):
+        if self.max_entries <= 0 or not deltas:
+            return
+        normalized = self._normalize(vector)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != normalized.shape[0]:
+                self._matrix = np.zeros((self.max_entries, normalized.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            if not self._free_slots:
+                self._release(next(iter(self._entries)))
+                self.evictions += 1
+            slot = self._free_slots.pop()
+            self._matrix[slot] = normalized
+            self._entries[slot] = _Entry(
+                question, frozenset(context_ids), list(deltas), time.time() + self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
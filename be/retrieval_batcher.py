@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from llm import Embeddings
+from vector_store import VectorStore
+
+
+class RetrievalBatcher:
+    """
+    Coalesces retrievals that arrive within window_seconds of each other
+    (or until max_batch are waiting) into one embedding request and one
+    multi-vector query per distinct where filter, then hands each caller
+    its own results.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        vector_store: VectorStore,
+        window_seconds: float,
+        max_batch: int,
+    ):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._waiting: List[Tuple[str, int, Optional[Dict[str, Any]], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+
+    async def retrieve(
+        self,
+        query: str,
+        k: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[str], List[str], List[Optional[Dict[str, Any]]]]:
+        """
+        Returns the ids, documents and metadatas of the k chunks closest
+        to query among those matching where.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((query, k, where, future))
+        if len(self._waiting) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._waiting = self._waiting, []
+        # Callers cancelled while waiting need no work
+        batch = [item for item in batch if not item[3].done()]
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[str, int, Optional[Dict[str, Any]], asyncio.Future]]):
+        with self._lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        groups: Dict[str, list] = {}
+        for item in batch:
+            groups.setdefault(json.dumps(item[2], sort_keys=True), []).append(item)
+        try:
+            # Identical questions share one embedding and one query row
+            texts = list(dict.fromkeys(query for query, _, _, _ in batch))
+            vectors = await self.embeddings.embed_batch(texts, batch_size=len(texts))
+            vector_of = dict(zip(texts, vectors))
+            await asyncio.gather(*(self._query_group(items, vector_of) for items in groups.values()))
+        except Exception as error:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            # Cancelled (e.g. at shutdown): callers still waiting are cancelled too
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _query_group(self, items: list, vector_of: Dict[str, List[float]]):
+        texts = list(dict.fromkeys(query for query, _, _, _ in items))
+        results = await self.vector_store.aquery(
+            query_embeddings=[vector_of[text] for text in texts],
+            n_results=max(k for _, k, _, _ in items),
+            include=["documents", "metadatas"],
+            where=items[0][2],
+        )
+        rows = {text: row for row, text in enumerate(texts)}
+        for query, k, _, future in items:
+            if not future.done():
+                row = rows[query]
+                future.set_result((results["ids"][row][:k], results["documents"][row][:k],
+                                   results["metadatas"][row][:k]))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "window_ms": self.window_seconds * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "queries": self.queries,
+                "largest_batch": self.largest_batch,
+                "mean_batch": self.queries / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,76 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from embedding_cache import normalize_text
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results keyed on (normalized query, k, filters).
+
+    Every lookup passes the collection's current version; when it differs
+    from the version the cached results were computed against, the whole
+    cache is dropped, so results never outlive a write to the collection.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[List[str], List[str], List[Optional[Dict[str, Any]]]]]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(query: str, k: int, filters: Optional[Dict[str, Any]]) -> Tuple:
+        return normalize_text(query), k, json.dumps(filters, sort_keys=True) if filters else None
+
+    def _check_version(self, version: Hashable):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get(self, query: str, k: int, filters: Optional[Dict[str, Any]], version: Hashable) -> Optional[Tuple[List[str], List[str], List[Optional[Dict[str, Any]]]]]:
+        """
+        Returns the cached (ids, documents, metadatas) or None.
+        """
+        key = self._key(query, k, filters)
+        with self._lock:
+            self._check_version(version)
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, query: str, k: int, filters: Optional[Dict[str, Any]], version: Hashable, ids: List[str], documents: List[str], metadatas: List[Optional[Dict[str, Any]]]):
+        if self.max_entries <= 0:
+            return
+        key = self._key(query, k, filters)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (list(ids), list(documents), list(metadatas))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
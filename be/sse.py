@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+from starlette.responses import StreamingResponse
+from config import SSE_FLUSH_BYTES, SSE_FLUSH_MS
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def sse_data(text: str) -> str:
+    """
+    An unnamed SSE event carrying text. Every line of text goes on its
+    own data: line; clients join them back together with "\\n".
+    """
+    if "\n" not in text and "\r" not in text:
+        return f"data: {text}\n\n"
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+def sse_event(event: str, data: Any) -> str:
+    """
+    A named SSE event. Clients that only read unnamed data events skip it.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SSEResponse(StreamingResponse):
+    """
+    Event stream that watches for the client going away for as long as it
+    runs, and then closes its body iterator at once, so a generator
+    relaying a model's stream closes that stream too instead of leaving
+    it to the garbage collector.
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(self, content: AsyncIterator[str], writer: Optional["SSEWriter"] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        streaming = asyncio.ensure_future(self.stream_response(send))
+        listening = asyncio.ensure_future(self.listen_for_disconnect(receive))
+        disconnected = False
+        try:
+            await asyncio.wait({streaming, listening}, return_when=asyncio.FIRST_COMPLETED)
+            if streaming.done():
+                try:
+                    streaming.result()
+                except OSError:
+                    # ASGI 2.4 servers raise on sending to a closed connection
+                    disconnected = True
+            else:
+                disconnected = True
+        finally:
+            for task in (streaming, listening):
+                task.cancel()
+            await asyncio.gather(streaming, listening, return_exceptions=True)
+            await self.body_iterator.aclose()
+        if disconnected:
+            logger.info("Client disconnected, stream closed")
+            if self.writer is not None:
+                self.writer.disconnected()
+        if self.background is not None:
+            await self.background()
+
+
+class SSEWriter:
+    """
+    Groups answer deltas into fewer, larger data events. The first delta
+    goes out at once; later ones are held until flush_bytes have
+    collected or flush_ms has passed since the oldest one held, whichever
+    comes first. flush_ms of 0 sends every delta as it arrives.
+    """
+
+    def __init__(self, flush_bytes: int = SSE_FLUSH_BYTES, flush_ms: float = SSE_FLUSH_MS):
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_ms / 1000
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.deltas = 0
+        self.flushes = 0
+        self.disconnects = 0
+
+    def response(self, content: AsyncIterator[str], **kwargs) -> SSEResponse:
+        return SSEResponse(content, writer=self, **kwargs)
+
+    def disconnected(self):
+        with self._lock:
+            self.disconnects += 1
+
+    async def coalesce(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Yields the text of deltas in fewer pieces. Held text is yielded
+        before an error from deltas is raised. Closing this generator
+        closes deltas.
+        """
+        if self.flush_seconds <= 0:
+            received = 0
+            try:
+                async for delta in deltas:
+                    received += 1
+                    yield delta
+            finally:
+                await deltas.aclose()
+                self._count(received, received)
+            return
+
+        # A reader task appends deltas to the buffer and wakes this
+        # generator for the first delta of a window, a full buffer and the
+        # end of the stream; a timer wakes it when the window runs out.
+        # That is one future and one timer per event, none per delta.
+        loop = asyncio.get_running_loop()
+        buffer: List[str] = []
+        size = 0
+        window_start = 0.0
+        finished = False
+        error: Optional[BaseException] = None
+        received = flushed = 0
+        ready: Optional[asyncio.Future] = None
+
+        def wake():
+            if ready is not None and not ready.done():
+                ready.set_result(None)
+
+        async def read():
+            nonlocal size, window_start, finished, error, received
+            try:
+                async for delta in deltas:
+                    received += 1
+                    buffer.append(delta)
+                    size += len(delta)
+                    if len(buffer) == 1:
+                        window_start = loop.time()
+                        wake()
+                    elif size >= self.flush_bytes:
+                        wake()
+            except Exception as exc:
+                error = exc
+            finally:
+                finished = True
+                wake()
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                if not buffer and not finished:
+                    ready = loop.create_future()
+                    await ready
+                if buffer and flushed and not finished and size < self.flush_bytes:
+                    ready = loop.create_future()
+                    timer = loop.call_at(window_start + self.flush_seconds, wake)
+                    try:
+                        await ready
+                    finally:
+                        timer.cancel()
+                if buffer:
+                    text = "".join(buffer)
+                    buffer.clear()
+                    size = 0
+                    flushed += 1
+                    yield text
+                elif finished:
+                    break
+            if error is not None:
+                raise error
+        finally:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            await deltas.aclose()
+            self._count(received, flushed)
+
+    def _count(self, received: int, flushed: int):
+        with self._lock:
+            self.responses += 1
+            self.deltas += received
+            self.flushes += flushed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "flush_bytes": self.flush_bytes,
+                "flush_ms": self.flush_seconds * 1000,
+                "responses": self.responses,
+                "deltas": self.deltas,
+                "events": self.flushes,
+                "deltas_per_event": self.deltas / self.flushes if self.flushes else 0.0,
+                "disconnects": self.disconnects,
+            }
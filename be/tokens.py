@@ -0,0 +1,20 @@
+from typing import List
+import litellm
+
+# litellm picks the model's tokenizer (tiktoken for OpenAI models) and ships
+# the encoding files, so token counting works offline.
+
+
+def encode(text: str, model: str) -> List[int]:
+    return list(litellm.encode(model=model, text=text))
+
+
+def decode(tokens: List[int], model: str) -> str:
+    return litellm.decode(model=model, tokens=tokens)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Number of tokens text occupies for model, using the model's tokenizer.
+    """
+    return len(encode(text, model))
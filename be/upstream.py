@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+import httpx
+import litellm
+from config import (
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_KEEPALIVE_SECONDS,
+    UPSTREAM_PREWARM_CONNECTIONS,
+    UPSTREAM_HTTP2,
+)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+PREWARM_TIMEOUT_SECONDS = 5.0
+# Unread response bytes are drained on close only up to these limits
+DRAIN_TIMEOUT_SECONDS = 0.05
+DRAIN_MAX_BYTES = 64 * 1024
+
+
+def openai_api_base() -> str:
+    """
+    Base URL litellm sends OpenAI requests to, from the same variables it reads.
+    """
+    base = os.environ.get("OPENAI_API_BASE") or os.environ.get("OPENAI_BASE_URL") or DEFAULT_API_BASE
+    return base.rstrip("/")
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """
+    Response body that reports when it is closed. A body closed before
+    its end costs httpx the connection, and the OpenAI client closes
+    streams as soon as it reads "data: [DONE]", just before the body's
+    final bytes; those are read here so the connection goes back to the
+    pool. A stream abandoned mid-answer is not drained past a few ms.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._iterator: Optional[AsyncIterator[bytes]] = None
+        self._exhausted = False
+        self._on_close: Optional[Callable[[], None]] = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        async for chunk in self._iterator:
+            yield chunk
+        self._exhausted = True
+
+    async def _drain(self):
+        drained = 0
+        async for chunk in self._iterator:
+            drained += len(chunk)
+            if drained > DRAIN_MAX_BYTES:
+                return
+
+    async def aclose(self):
+        try:
+            if self._iterator is not None and not self._exhausted:
+                try:
+                    await asyncio.wait_for(self._drain(), DRAIN_TIMEOUT_SECONDS)
+                except (asyncio.TimeoutError, httpx.HTTPError):
+                    pass
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class _MeteredTransport(httpx.AsyncBaseTransport):
+    """
+    Counts requests in flight (until their response body is closed), new
+    connections and TLS handshakes, and how long each request waited for
+    a connection, using httpcore's trace events.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_connections: int):
+        self._transport = transport
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.acquire_seconds = 0.0
+        self.max_acquire_seconds = 0.0
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        began = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_connections:
+                # Every connection is busy: this request queues for one
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        acquired = False
+
+        async def trace(event: str, info: Dict[str, Any]):
+            nonlocal acquired
+            if event == "connection.connect_tcp.complete":
+                with self._lock:
+                    self.connections_opened += 1
+            elif event == "connection.start_tls.complete":
+                with self._lock:
+                    self.tls_handshakes += 1
+            elif event.endswith("send_request_headers.started") and not acquired:
+                acquired = True
+                waited = time.perf_counter() - began
+                with self._lock:
+                    self.acquire_seconds += waited
+                    self.max_acquire_seconds = max(self.max_acquire_seconds, waited)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._finished()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_MeteredStream(response.stream, self._finished),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "saturated_requests": self.saturated,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "mean_acquire_ms": self.acquire_seconds / self.requests * 1000 if self.requests else 0.0,
+                "max_acquire_ms": self.max_acquire_seconds * 1000,
+            }
+
+
+class UpstreamClient:
+    """
+    One size-bounded, keep-alive httpx connection pool shared by every LLM
+    and embedding call. It is installed as litellm's session, which the
+    OpenAI provider uses for completions and embeddings alike, so calls
+    reuse open connections instead of paying for TCP and TLS setup, and
+    speak HTTP/2 where the provider and the h2 package allow. Must be
+    created inside the event loop that uses it.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        keepalive_seconds: float = UPSTREAM_KEEPALIVE_SECONDS,
+        http2: bool = UPSTREAM_HTTP2,
+    ):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_seconds,
+        )
+        self.transport = _MeteredTransport(
+            httpx.AsyncHTTPTransport(limits=limits, http2=self.http2),
+            max_connections,
+        )
+        self.client = httpx.AsyncClient(transport=self.transport, follow_redirects=True)
+        self._previous: Optional[httpx.AsyncClient] = litellm.aclient_session
+        litellm.aclient_session = self.client
+
+    async def prewarm(self, connections: int = UPSTREAM_PREWARM_CONNECTIONS) -> int:
+        """
+        Opens connections to the provider ahead of the first request with
+        cheap GET /models calls. Returns how many succeeded; failures are
+        logged, never raised, since the server works without them.
+        """
+        if connections <= 0:
+            return 0
+        url = f"{openai_api_base()}/models"
+        headers = {}
+        if os.environ.get("OPENAI_API_KEY"):
+            headers["Authorization"] = f"Bearer {os.environ['OPENAI_API_KEY']}"
+
+        async def ping() -> bool:
+            try:
+                response = await self.client.get(url, headers=headers, timeout=PREWARM_TIMEOUT_SECONDS)
+                await response.aread()
+                return True
+            except httpx.HTTPError as error:
+                logger.warning("Could not pre-warm connection to %s: %s", url, error)
+                return False
+
+        results = await asyncio.gather(*(ping() for _ in range(connections)))
+        return sum(results)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"http2": self.http2, **self.transport.stats()}
+
+    async def aclose(self):
+        if litellm.aclient_session is self.client:
+            litellm.aclient_session = self._previous
+        await self.client.aclose()
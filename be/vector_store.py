@@ -0,0 +1,224 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from executor import BoundedExecutor
+from metrics import timed
+from config import VECTOR_STORE, EMBEDDING_DIMENSIONS
+
+# Rewritten on every write so other processes (e.g. ingest_pdfs.py running
+# next to the server) can tell the collection changed
+VERSION_FILENAME = "collection_version"
+VERSION_CHECK_SECONDS = 1.0
+
+
+class VectorStore(ABC):
+    """
+    Storage and nearest-neighbour search over chunk embeddings.
+
+    Backends implement the blocking methods; the async variants run them on
+    the store's bounded executor so callers never block the event loop.
+    Query results use Chroma's shape: {"ids": [[...]], "documents": [[...]], ...}
+    with one inner list per query embedding; where filters use Chroma's
+    metadata filter syntax.
+    """
+
+    def __init__(self, persist_directory: str, max_workers: int, thread_name_prefix: str):
+        self.persist_directory = persist_directory
+        self.executor = BoundedExecutor(
+            max_workers, thread_name_prefix=thread_name_prefix)
+        self._local_version = 0
+        self._external_version = ""
+        self._version_checked = float("-inf")
+
+    @abstractmethod
+    def add_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        ...
+
+    @abstractmethod
+    def upsert_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        ...
+
+    @abstractmethod
+    def delete_documents(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        ...
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 4,
+        include: List[str] = ["documents"],
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get_documents(
+        self,
+        ids: List[str],
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Dict[str, Any]:
+        """
+        The stored chunks among ids, shaped like Chroma's get():
+        {"ids": [...], "documents": [...], ...} for the included fields.
+        """
+
+    @abstractmethod
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every stored chunk in pages shaped like Chroma's get():
+        {"ids": [...], "documents": [...], ...} for the included fields.
+        """
+
+    def warm(self):
+        """
+        Loads whatever the first query would otherwise have to load.
+        """
+
+    def flush(self):
+        """
+        Makes completed writes durable. Backends that persist on every
+        write need not override it.
+        """
+
+    def close(self):
+        """
+        Waits for in-flight calls and flushes pending writes.
+        """
+        self.executor.shutdown(wait=True)
+        self.flush()
+
+    def _bump_version(self):
+        self._local_version += 1
+        path = os.path.join(self.persist_directory, VERSION_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, path)
+
+    def version(self) -> Tuple[int, str]:
+        """
+        Changes whenever the collection is written, by this process or by
+        another one (noticed within VERSION_CHECK_SECONDS).
+        """
+        now = time.monotonic()
+        if now - self._version_checked >= VERSION_CHECK_SECONDS:
+            try:
+                with open(os.path.join(self.persist_directory, VERSION_FILENAME)) as f:
+                    self._external_version = f.read()
+            except FileNotFoundError:
+                self._external_version = ""
+            self._version_checked = now
+        return self._local_version, self._external_version
+
+    async def aadd_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        Same as add_documents, run on the store's executor.
+        """
+        await self.executor.run(
+            self.add_documents,
+            embeddings=embeddings,
+            documents=documents,
+            ids=ids,
+            metadatas=metadatas,
+        )
+
+    async def aupsert_documents(
+        self,
+        embeddings: List[List[float]],
+        documents: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        await self.executor.run(
+            self.upsert_documents,
+            embeddings=embeddings,
+            documents=documents,
+            ids=ids,
+            metadatas=metadatas,
+        )
+
+    async def adelete_documents(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        await self.executor.run(self.delete_documents, ids=ids, where=where)
+
+    async def aflush(self):
+        await self.executor.run(self.flush)
+
+    async def aget_documents(
+        self,
+        ids: List[str],
+        include: List[str] = ["documents", "metadatas"],
+    ) -> Dict[str, Any]:
+        return await self.executor.run(self.get_documents, ids, include=include)
+
+    @timed("vector_query")
+    async def aquery(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 4,
+        include: List[str] = ["documents"],
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Same as query, run on the store's executor so the event loop keeps
+        serving other streams while the search runs.
+        """
+        return await self.executor.run(
+            self.query,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include,
+            where=where,
+        )
+
+    def executor_stats(self) -> Dict[str, Any]:
+        return self.executor.stats()
+
+
+def create_vector_store(backend: str = VECTOR_STORE, **options) -> VectorStore:
+    """
+    Builds the configured backend; options are passed to its constructor.
+    """
+    if EMBEDDING_DIMENSIONS and backend != "numpy":
+        # Only the NumPy store keeps full vectors to re-rank shortened ones with
+        raise ValueError(
+            "EMBEDDING_DIMENSIONS needs VECTOR_STORE=numpy; to search fewer dimensions "
+            "and re-rank in full, set NUMPY_PREFIX_DIMS with the NumPy store instead")
+    if backend == "chroma":
+        from chromadb_client import ChromaDbClient
+        return ChromaDbClient(**options)
+    if backend == "numpy":
+        from numpy_store import NumpyVectorStore
+        return NumpyVectorStore(**options)
+    raise ValueError(f"Unknown vector store: {backend}")
@@ -1,5 +1,9 @@
 import { Message } from "./utils";
 
+// The server reports a model timeout or failure after streaming has begun
+// as an error event on the 200 response, not as an HTTP status
+export class LLMStreamError extends Error {}
+
 export async function streamLLMResponse(
   conversation: Message[],
   onChunk: (chunk: string) => void,
@@ -12,6 +16,8 @@ export async function streamLLMResponse(
     signal,
   });
 
+  // 429/503 when the server is at capacity; Retry-After says when to retry
+  if (!response.ok) throw new Error(`Request failed: ${response.status}`);
   if (!response.body) throw new Error("No response body");
 
   const reader = response.body.getReader();
@@ -24,15 +30,30 @@ export async function streamLLMResponse(
     done = doneReading;
     if (value) {
       acc += decoder.decode(value, { stream: true });
-      // Parse SSE chunks
-      const lines = acc.split("\n\n");
-      acc = lines.pop() || "";
-      for (const line of lines) {
-        if (line.startsWith("data: ")) {
-          const data = line.slice(6);
-          if (data === "[DONE]") return;
-          onChunk(data);
+      // Parse SSE events; a multi-line chunk arrives as several data: lines
+      const events = acc.split("\n\n");
+      acc = events.pop() || "";
+      for (const event of events) {
+        const lines = event.split("\n");
+        const eventLine = lines.find((line) => line.startsWith("event:"));
+        const dataLines = lines.filter((line) => line.startsWith("data:"));
+        const data = dataLines
+          .map((line) => line.slice(line.startsWith("data: ") ? 6 : 5))
+          .join("\n");
+        if (eventLine) {
+          if (eventLine.slice(6).trim() === "error") {
+            let message = "The model request failed";
+            try {
+              message = JSON.parse(data).message || message;
+            } catch {}
+            throw new LLMStreamError(message);
+          }
+          // Other named events (status, timing) are progress, not answer text
+          continue;
         }
+        if (dataLines.length === 0) continue;
+        if (data === "[DONE]") return;
+        onChunk(data);
       }
     }
   }
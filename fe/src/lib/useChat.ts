@@ -1,6 +1,6 @@
 import { useRef, useState } from "react";
 import { Message, getTimestamp } from "./utils";
-import { streamLLMResponse } from "./llm";
+import { LLMStreamError, streamLLMResponse } from "./llm";
 
 export function useChat() {
   const [messages, setMessages] = useState<Message[]>([]);
@@ -55,7 +55,10 @@ export function useChat() {
         {
           id: crypto.randomUUID(),
           role: "assistant",
-          content: "Error: Unable to get response from LLM.",
+          content:
+            err instanceof LLMStreamError
+              ? `Error: ${err.message}.`
+              : "Error: Unable to get response from LLM.",
           timestamp: getTimestamp(),
         },
       ]);